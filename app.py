@@ -1,13 +1,374 @@
 import streamlit as st
 import random
+import functools
 import os
+import logging
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 from groq import Groq
+from streamlit.runtime.scriptrunner import get_script_run_ctx, add_script_run_ctx
+from streamlit.errors import StreamlitAPIException
+from llm_cache import ResponseCache, normalize_query
+from llm_stream import stream_chat, complete_chat, PartialJSONObject, StreamBuffer
+from quiz_pool import QuizPool
+from quiz_gen import (
+    QuizGenerator, QUIZ_FIELDS, QUIZ_LEVEL_DESC, QUIZ, QUIZ_BATCH, quiz_request, quiz_batch_request,
+    validate_quiz, extract_json,
+)
+from llm_scheduler import RequestScheduler, ScheduledClient, RETRYABLE_ERRORS
+from content_store import open_store
+from srs import SRSStore
+from progress import ProgressStore
+from sampler import AdaptiveSampler
+from mutations import MUTATION_TAG
+from classroom import ClassroomAggregator
+from session_state import Round, GeneratedQuiz, SessionMemory, state_bytes, dump_words, load_words
+from lexicon import open_lexicon
+from build_font import read_manifest as read_font_manifest, is_current as font_is_current, STATIC_FONT_DIR
+import metrics
+import prompts
+
+_run_started = time.perf_counter()
 
 # ============================================
 # Groq API設定
 # ============================================
 GROQ_API_KEY = os.environ.get("GROQ_API_KEY", "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")
-client = Groq(api_key=GROQ_API_KEY)
+
+
+def current_session_id():
+    # バックグラウンドのスレッド（クイズプールの補充など）はセッションを持たない
+    ctx = get_script_run_ctx(suppress_warning=True)
+    return ctx.session_id if ctx else "background"
+
+
+# ============================================
+# メトリクス（Prometheus形式。METRICS_PORT を指定すると /metrics を返す）
+# ============================================
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "0"))
+# 空でなければ ?admin=<この値> でサイドバーに管理用パネルを出す
+METRICS_ADMIN_TOKEN = os.environ.get("METRICS_ADMIN_TOKEN", "")
+# 開いているタブは session_upkeep がこの間隔で再実行される。セッションの数・大きさは
+# その2倍の間に実行がなければ数えない（1回遅れても外れない）
+SESSION_CHECK_SECONDS = int(os.environ.get("SESSION_CHECK_SECONDS", "60"))
+SESSION_WINDOW_SECONDS = 2 * SESSION_CHECK_SECONDS
+
+
+@st.cache_resource
+def get_session_tracker():
+    tracker = metrics.SessionTracker(window=SESSION_WINDOW_SECONDS)
+    metrics.register_gauge(
+        "app_active_sessions",
+        f"Open sessions: a script run in the last {SESSION_WINDOW_SECONDS} s "
+        f"(idle tabs rerun every {SESSION_CHECK_SECONDS} s).",
+        tracker.active,
+    )
+    if METRICS_PORT:
+        metrics.start_exporter(METRICS_PORT)
+    return tracker
+
+
+session_tracker = get_session_tracker()
+session_tracker.touch(current_session_id())
+
+
+@st.cache_resource
+def get_session_memory():
+    memory = SessionMemory(window=SESSION_WINDOW_SECONDS)
+    metrics.register_gauge("app_session_state_bytes", "Approximate session_state size: total, largest and mean session.",
+                           memory.summary, label="stat")
+    metrics.register_stats("app_session_spills_total", "Idle sessions spilled to the progress store, and restores.",
+                           lambda: memory.stats)
+    return memory
+
+
+session_memory = get_session_memory()
+# ページ全体の実行はユーザーの操作（か最初の表示）
+session_memory.active(current_session_id())
+
+
+def timed_fragment(func=None, periodic=False):
+    # フラグメントだけが再実行された時の時間を数える（ページ全体の実行は最後にまとめて数える）。
+    # periodic は run_every で勝手に再実行されるもの（ユーザーの操作としては数えない）。
+    # それ以外（各モード）は最後にサイドバーのスコアを書き直す
+    if func is None:
+        return functools.partial(timed_fragment, periodic=periodic)
+
+    @functools.wraps(func)
+    def wrapper():
+        start = time.perf_counter()
+        func()
+        if not periodic:
+            show_score()
+        ctx = get_script_run_ctx(suppress_warning=True)
+        if ctx and ctx.fragment_ids_this_run:
+            session_tracker.touch(ctx.session_id)
+            if not periodic:
+                session_memory.active(ctx.session_id)
+            metrics.SCRIPT_SECONDS.observe(time.perf_counter() - start, mode=func.__name__, run="fragment")
+    return wrapper
+
+
+@st.cache_resource
+def get_llm_client():
+    # 全セッションで1つのクライアントを共有する（HTTP接続を使い回すため）。
+    # 再試行はスケジューラがまとめて行うので SDK 側の再試行は切る
+    scheduler = RequestScheduler(
+        max_concurrency=int(os.environ.get("LLM_MAX_CONCURRENCY", "4")),
+        max_retries=int(os.environ.get("LLM_MAX_RETRIES", "4")),
+    )
+    metrics.register_stats("llm_scheduler_events_total", "LLM scheduler requests, retries and failures.",
+                           lambda: scheduler.stats)
+    metrics.register_gauge("llm_scheduler_requests", "LLM requests in flight or waiting.",
+                           scheduler.load, label="state")
+    return ScheduledClient(
+        Groq(api_key=GROQ_API_KEY, max_retries=0),
+        scheduler,
+        session_id=current_session_id,
+    )
+
+
+client = get_llm_client()
+LLM_MODEL = "llama-3.3-70b-versatile"
+# 再試行しても混み合っていた時の表示
+BUSY_MESSAGE = "🙏 いまAIがとても混んでいます。少し待ってから、もう一度ためしてね！"
+# 0にすると応答が全部届いてから表示する（従来の動き）
+LLM_STREAMING = os.environ.get("LLM_STREAMING", "1") != "0"
+
+# TTFT・合計時間のログ
+llm_logger = logging.getLogger("llm")
+if not llm_logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(asctime)s %(name)s %(message)s"))
+    llm_logger.addHandler(_handler)
+    llm_logger.setLevel(logging.INFO)
+
+# ============================================
+# AIチューターの応答キャッシュ
+# ============================================
+# プロンプト（prompts.py）を変えたら上げる（古いキャッシュを使わないため）
+TUTOR_PROMPT_VERSION = 2
+# 空文字にするとディスク層を使わない
+LLM_CACHE_PATH = os.environ.get("LLM_CACHE_PATH", ".cache/llm_cache.sqlite3")
+
+
+@st.cache_resource
+def get_tutor_cache():
+    # 全セッションで1つを共有する
+    cache = ResponseCache(
+        max_entries=int(os.environ.get("LLM_CACHE_MAX_ENTRIES", "2048")),
+        ttl_seconds=int(os.environ.get("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600))),
+        db_path=LLM_CACHE_PATH or None,
+    )
+    metrics.register_stats("llm_cache_events_total", "AI tutor response cache lookups.", lambda: cache.stats)
+    return cache
+
+
+def tutor_request(word):
+    return prompts.TUTOR.request(LLM_MODEL, word=word)
+
+
+def tutor_hint_request(entry):
+    # 辞書にあった単語は「覚え方のコツ」だけをAIに聞く
+    return prompts.TUTOR_HINT.request(LLM_MODEL, **entry)
+
+
+def run_detached(func, done=None):
+    # スクリプトとは別のスレッドで動かす（このタブが再実行・停止されても最後まで進む）。
+    # スケジューラがセッションごとの順番に使うので、このセッションのコンテキストを渡す
+    future = Future()
+
+    def run():
+        try:
+            future.set_result(func())
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            if done is not None:
+                done()
+
+    thread = threading.Thread(target=run, name="tutor-llm", daemon=True)
+    add_script_run_ctx(thread, get_script_run_ctx(suppress_warning=True))
+    thread.start()
+    return future
+
+
+def show_cached_answer(key, label, template, request):
+    # キャッシュになければLLMに聞く。ストリーミングの時は届いたトークンから順に表示する。
+    # LLMの呼び出しとキャッシュへの保存は別スレッドで行い、st.* はキャッシュの計算の外で呼ぶ
+    # （同じ言葉を待っている他のセッションを、このタブの描画や再実行で止めないため）
+    tutor_cache = get_tutor_cache()
+    st.markdown("---")
+    answer = tutor_cache.get(key)
+    cached, streamed = answer is not None, False
+    if answer is None:
+        if LLM_STREAMING:
+            buffer = StreamBuffer()
+            future = run_detached(
+                lambda: tutor_cache.get_or_compute(
+                    key, lambda: buffer.feed(stream_chat(client, label, template, **request))),
+                done=buffer.close,
+            )
+            # 他のセッションが計算中だった時は、断片は届かずに閉じる（出来上がった答えを出す）
+            streamed = buffer.started()
+            if streamed:
+                st.write_stream(buffer)
+        else:
+            future = run_detached(
+                lambda: tutor_cache.get_or_compute(key, lambda: complete_chat(client, label, template, **request)))
+        answer, cached = future.result()
+    if not streamed:
+        st.markdown(answer)
+    if cached:
+        st.caption("⚡ 前に調べた結果を表示しています")
+    metrics.TUTOR_ANSWERS.inc(source="cache" if cached else "llm")
+
+
+# ============================================
+# AIチューターのローカル辞書（content/vocab.jsonl と content/dictionary/ から作る）
+# ============================================
+@st.cache_resource
+def get_lexicon():
+    # 索引ファイルを mmap で開く（ページはプロセス間で共有される）
+    return open_lexicon()
+
+
+def lexicon_answer(entry):
+    lines = [f"📖 読み方: {entry['reading']}", f"🇨🇳 中国語の意味: {entry['meaning_chinese']}"]
+    if entry["example"]:
+        lines.append(f"📝 例文: {entry['example']}")
+    return "  \n".join(lines)
+
+
+# ============================================
+# まとめて調べる（文章や単語の並びを貼り付けた時）
+# ============================================
+# 1回に調べる単語の上限と、1セッションから同時に出すLLMリクエストの数
+# （全体の同時実行数はスケジューラの LLM_MAX_CONCURRENCY で抑える）
+TUTOR_BATCH_MAX_WORDS = int(os.environ.get("TUTOR_BATCH_MAX_WORDS", "12"))
+TUTOR_BATCH_CONCURRENCY = int(os.environ.get("TUTOR_BATCH_CONCURRENCY", "4"))
+
+
+def show_batch_card(placeholder, word, answer, source):
+    with placeholder.container(border=True):
+        st.markdown(f"**{word}**")
+        st.markdown(answer)
+        if source == "lexicon":
+            st.caption("📒 辞書から表示しています")
+        elif source == "cache":
+            st.caption("⚡ 前に調べた結果を表示しています")
+
+
+def show_batch_lookup(words):
+    """辞書にある単語はすぐ、ない単語はLLMに並行して聞き、届いた順にカードを埋める。"""
+    start = time.perf_counter()
+    lexicon = get_lexicon()
+    tutor_cache = get_tutor_cache()
+    # カードの場所は入力の順に先に作っておく
+    placeholders = {}
+    missing = []
+    for word in words:
+        placeholders[word] = st.empty()
+        entry = lexicon.lookup(word)
+        if entry is None:
+            placeholders[word].info(f"⏳ 「{word}」をAIが調べています...")
+            missing.append(word)
+        else:
+            show_batch_card(placeholders[word], word, lexicon_answer(entry), "lexicon")
+            metrics.TUTOR_ANSWERS.inc(source="lexicon")
+    if not missing:
+        return
+
+    def ask(word):
+        key = tutor_cache.make_key(word, TUTOR_PROMPT_VERSION)
+        return tutor_cache.get_or_compute(key, lambda: complete_chat(client, "tutor_batch", prompts.TUTOR, **tutor_request(word)))
+
+    # ワーカーにもこのセッションのコンテキストを渡す（スケジューラのセッションごとの順番に使う）
+    ctx = get_script_run_ctx(suppress_warning=True)
+    with ThreadPoolExecutor(max_workers=min(TUTOR_BATCH_CONCURRENCY, len(missing)),
+                            initializer=lambda: add_script_run_ctx(ctx=ctx)) as pool:
+        futures = {pool.submit(ask, word): word for word in missing}
+        for future in as_completed(futures):
+            word = futures[future]
+            try:
+                answer, cached = future.result()
+            except RETRYABLE_ERRORS:
+                placeholders[word].warning(f"{word}: {BUSY_MESSAGE}")
+                continue
+            except Exception as e:
+                placeholders[word].error(f"{word}: エラーが発生しました: {str(e)}")
+                continue
+            source = "cache" if cached else "llm"
+            show_batch_card(placeholders[word], word, answer, source)
+            metrics.TUTOR_ANSWERS.inc(source=source)
+    llm_logger.info("tutor batch words=%d llm=%d total=%.3fs", len(words), len(missing),
+                    time.perf_counter() - start)
+
+
+# ============================================
+# AI問題生成（プロンプトは quiz_gen.py）
+# ============================================
+# 0にすると response_format を付けない（JSONモードのないモデルに切り替えた時など）
+LLM_JSON_MODE = os.environ.get("LLM_JSON_MODE", "1") != "0"
+
+
+@st.cache_resource
+def get_quiz_generator():
+    # 全セッション共通（解析失敗率・頼み直し率をまとめて数えるため）
+    generator = QuizGenerator(
+        client,
+        functools.partial(quiz_batch_request, LLM_MODEL),
+        json_mode=LLM_JSON_MODE,
+        template=QUIZ_BATCH,
+        max_retries=int(os.environ.get("QUIZ_REPAIR_RETRIES", "2")),
+    )
+    metrics.register_stats(
+        "quiz_generator_events_total", "AI quiz generation calls, JSON parse failures and item outcomes.",
+        lambda: {key: value for key, value in generator.stats().items() if not key.endswith("_rate") and key != "tokens"},
+    )
+    return generator
+
+
+@st.cache_resource
+def get_quiz_pool():
+    # 全セッション共通。バックグラウンドで難易度ごとに補充し続ける
+    pool = QuizPool(
+        get_quiz_generator().generate,
+        QUIZ_LEVEL_DESC.keys(),
+        low_water=int(os.environ.get("QUIZ_POOL_LOW_WATER", "3")),
+        target=int(os.environ.get("QUIZ_POOL_TARGET", "8")),
+        batch_size=int(os.environ.get("QUIZ_POOL_BATCH_SIZE", "4")),
+    ).start()
+    metrics.register_stats("quiz_pool_events_total", "Pre-generated AI quiz pool hits and refills.", lambda: pool.stats)
+    metrics.register_gauge("quiz_pool_size", "Quizzes waiting in the pool.",
+                           lambda: {level: pool.size(level) for level in QUIZ_LEVEL_DESC}, label="level")
+    return pool
+
+
+def stream_quiz(difficulty):
+    # 必要なフィールドがそろった時点で問題を返す（残りのトークンは待たない）
+    preview = st.empty()
+    parser = PartialJSONObject()
+    stream = stream_chat(client, "quiz", QUIZ, **quiz_request(LLM_MODEL, difficulty))
+    try:
+        for delta in stream:
+            fields = parser.feed(delta)
+            if "word" in fields:
+                preview.markdown(f'<div class="big-text">{fields["word"]}</div>', unsafe_allow_html=True)
+            if all(field in fields for field in QUIZ_FIELDS):
+                quiz, _ = validate_quiz(fields)
+                get_quiz_generator().record(parsed=True, valid=quiz is not None)
+                return quiz
+    finally:
+        stream.close()
+    data = extract_json(parser.buffer)
+    quiz, _ = validate_quiz(data)
+    get_quiz_generator().record(parsed=data is not None, valid=quiz is not None)
+    return quiz
+
 
 # ============================================
 # ページ設定
@@ -18,16 +379,37 @@ st.set_page_config(
     layout="centered"
 )
 
+# ============================================
+# フォント（python build_font.py で作る Noto Sans JP のサブセット）
+# ============================================
+@st.cache_resource
+def get_font_face_css():
+    # サブセットがなければシステムフォントで表示する（外部のフォントは読みに行かない）
+    manifest = read_font_manifest()
+    if manifest is None or not os.path.exists(os.path.join(STATIC_FONT_DIR, manifest["file"])):
+        return ""
+    if not font_is_current(manifest):
+        logging.getLogger("font").warning("font subset is stale; run python build_font.py")
+    return f"""
+<style>
+    @font-face {{
+        font-family: '{manifest["family"]}';
+        src: url('app/static/fonts/{manifest["file"]}') format('woff2');
+        font-weight: {manifest["weights"]};
+        font-display: swap;
+    }}
+</style>"""
+
+
 # ============================================
 # カスタムCSS（nanamitoolスタイル）
 # ============================================
-st.markdown("""
+st.markdown(get_font_face_css() + """
 <style>
-    @import url('https://fonts.googleapis.com/css2?family=Noto+Sans+JP:wght@400;500;600;700&display=swap');
-    
-    /* 全体のスタイル */
+    /* 全体のスタイル。サブセットにない字は後ろのフォントで表示される */
     .stApp {
-        font-family: 'Noto Sans JP', sans-serif !important;
+        font-family: 'Noto Sans JP Subset', 'Noto Sans JP', 'Hiragino Sans', 'Hiragino Kaku Gothic ProN',
+            'Yu Gothic', 'Noto Sans CJK JP', 'Microsoft YaHei', sans-serif !important;
         background: linear-gradient(135deg, #ffffff 0%, #fce4ec 40%, #f8bbd9 100%) !important;
     }
     
@@ -192,78 +574,255 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # ============================================
-# 熟語クイズデータ（20問）
-# ============================================
-QUIZ_DATA = [
-    {"word": "勉強", "correct_reading": "べんきょう", "wrong_readings": ["べんきよう", "べんきゅう", "べんこう"], "meaning_chinese": "学习 xuéxí", "example": "毎日日本語を勉強します。"},
-    {"word": "学校", "correct_reading": "がっこう", "wrong_readings": ["がくこう", "がこう", "がっこ"], "meaning_chinese": "学校 xuéxiào", "example": "学校は楽しいです。"},
-    {"word": "友達", "correct_reading": "ともだち", "wrong_readings": ["ゆうたち", "ともたち", "ゆうだち"], "meaning_chinese": "朋友 péngyou", "example": "友達と遊びます。"},
-    {"word": "先生", "correct_reading": "せんせい", "wrong_readings": ["せんしょう", "さきせい", "せいせん"], "meaning_chinese": "老师 lǎoshī", "example": "先生に質問します。"},
-    {"word": "家族", "correct_reading": "かぞく", "wrong_readings": ["いえぞく", "かそく", "けぞく"], "meaning_chinese": "家人 jiārén", "example": "家族は5人です。"},
-    {"word": "天気", "correct_reading": "てんき", "wrong_readings": ["てんけ", "あめき", "てんぎ"], "meaning_chinese": "天气 tiānqì", "example": "今日の天気はいいです。"},
-    {"word": "食事", "correct_reading": "しょくじ", "wrong_readings": ["たべじ", "しょくし", "しょくに"], "meaning_chinese": "饭/用餐 fàn", "example": "食事の時間です。"},
-    {"word": "音楽", "correct_reading": "おんがく", "wrong_readings": ["おとがく", "いんがく", "おんらく"], "meaning_chinese": "音乐 yīnyuè", "example": "音楽を聴きます。"},
-    {"word": "運動", "correct_reading": "うんどう", "wrong_readings": ["うんとう", "はこどう", "うどう"], "meaning_chinese": "运动 yùndòng", "example": "運動が好きです。"},
-    {"word": "宿題", "correct_reading": "しゅくだい", "wrong_readings": ["やどだい", "しゅくたい", "しゅだい"], "meaning_chinese": "作业 zuòyè", "example": "宿題を忘れました。"},
-    {"word": "図書館", "correct_reading": "としょかん", "wrong_readings": ["ずしょかん", "としょがん", "とうしょかん"], "meaning_chinese": "图书馆 túshūguǎn", "example": "図書館で本を読みます。"},
-    {"word": "病院", "correct_reading": "びょういん", "wrong_readings": ["やまいん", "びょいん", "びょうえん"], "meaning_chinese": "医院 yīyuàn", "example": "病院に行きます。"},
-    {"word": "電車", "correct_reading": "でんしゃ", "wrong_readings": ["でんくるま", "でんしや", "てんしゃ"], "meaning_chinese": "电车 diànchē", "example": "電車で学校に行きます。"},
-    {"word": "買物", "correct_reading": "かいもの", "wrong_readings": ["ばいもの", "かいぶつ", "かいもつ"], "meaning_chinese": "购物 gòuwù", "example": "買物に行きましょう。"},
-    {"word": "料理", "correct_reading": "りょうり", "wrong_readings": ["りょうに", "りょり", "りようり"], "meaning_chinese": "料理 liàolǐ", "example": "母は料理が上手です。"},
-    {"word": "映画", "correct_reading": "えいが", "wrong_readings": ["えが", "えいか", "ようが"], "meaning_chinese": "电影 diànyǐng", "example": "映画を見ます。"},
-    {"word": "写真", "correct_reading": "しゃしん", "wrong_readings": ["しゃじん", "かきしん", "しゃちん"], "meaning_chinese": "照片 zhàopiàn", "example": "写真を撮ります。"},
-    {"word": "新聞", "correct_reading": "しんぶん", "wrong_readings": ["しんもん", "あらぶん", "しんぷん"], "meaning_chinese": "报纸 bàozhǐ", "example": "新聞を読みます。"},
-    {"word": "野菜", "correct_reading": "やさい", "wrong_readings": ["のさい", "やさき", "のなさい"], "meaning_chinese": "蔬菜 shūcài", "example": "野菜を食べます。"},
-    {"word": "果物", "correct_reading": "くだもの", "wrong_readings": ["かぶつ", "はたもの", "くだぶつ"], "meaning_chinese": "水果 shuǐguǒ", "example": "果物が好きです。"},
-]
-
-# ============================================
-# 間違い探しデータ（8問）
-# ============================================
-MISTAKE_DATA = [
-    {"sentence": "わたしは学校が行きます。", "mistake": "が", "correct": "に", "explanation": "「行く」是移动动词，应该用「に」表示目的地。"},
-    {"sentence": "りんごは赤くいです。", "mistake": "くい", "correct": "い", "explanation": "形容词「赤い」不需要加「く」。正确是「赤いです」。"},
-    {"sentence": "本を読むのが好きいです。", "mistake": "好きい", "correct": "好き", "explanation": "「好き」是な形容词，不需要加「い」。"},
-    {"sentence": "昨日、友達を会いました。", "mistake": "を", "correct": "に", "explanation": "「会う」用「に」表示见面的对象，不用「を」。"},
-    {"sentence": "この本は面白です。", "mistake": "面白", "correct": "面白い", "explanation": "「面白い」是い形容词，需要「い」结尾。"},
-    {"sentence": "日本語を話すことがでます。", "mistake": "でます", "correct": "できます", "explanation": "「できる」的ます形是「できます」，不是「でます」。"},
-    {"sentence": "彼女は歌を上手です。", "mistake": "を", "correct": "が", "explanation": "「上手」前面用「が」，不用「を」。"},
-    {"sentence": "今日は暑いなので、アイスを食べます。", "mistake": "暑いな", "correct": "暑い", "explanation": "い形容词后面直接加「ので」，不需要「な」。"},
-]
-
-# ============================================
-# フラッシュカードデータ（10枚）
-# ============================================
-FLASHCARDS = [
-    {"word": "学校", "reading": "がっこう", "meaning": "学校 xuéxiào", "example": "学校に行きます。"},
-    {"word": "友達", "reading": "ともだち", "meaning": "朋友 péngyou", "example": "友達と遊びます。"},
-    {"word": "先生", "reading": "せんせい", "meaning": "老师 lǎoshī", "example": "先生に質問します。"},
-    {"word": "勉強", "reading": "べんきょう", "meaning": "学习 xuéxí", "example": "日本語を勉強します。"},
-    {"word": "家族", "reading": "かぞく", "meaning": "家人 jiārén", "example": "家族は5人です。"},
-    {"word": "天気", "reading": "てんき", "meaning": "天气 tiānqì", "example": "今日の天気はいいです。"},
-    {"word": "食事", "reading": "しょくじ", "meaning": "饭/用餐 fàn", "example": "食事の時間です。"},
-    {"word": "音楽", "reading": "おんがく", "meaning": "音乐 yīnyuè", "example": "音楽を聴きます。"},
-    {"word": "運動", "reading": "うんどう", "meaning": "运动 yùndòng", "example": "運動が好きです。"},
-    {"word": "宿題", "reading": "しゅくだい", "meaning": "作业 zuòyè", "example": "宿題を忘れました。"},
-]
+# 学習コンテンツ（content/*.jsonl から作るストア）
+# ============================================
+@st.cache_resource
+def get_content_store():
+    # プロセスで1回だけ開く。項目は必要な時に読む
+    content = open_store()
+    metrics.register_stats("content_vocab_cache_events_total", "Vocabulary item cache lookups.",
+                           lambda: metrics.lru_stats(content.get_vocab))
+    metrics.register_stats("content_mistake_cache_events_total", "Mistake item cache lookups.",
+                           lambda: metrics.lru_stats(content.get_mistake))
+    return content
+
+
+store = get_content_store()
+
+# ============================================
+# 学習者ごとの記録（フラッシュカードの復習スケジュールなど）
+# ============================================
+PROGRESS_DB_PATH = os.environ.get("PROGRESS_DB_PATH", ".cache/progress.sqlite3")
+
+
+@st.cache_resource
+def get_srs_store():
+    return SRSStore(PROGRESS_DB_PATH)
+
+
+@st.cache_resource
+def get_progress_store():
+    # 解答の記録と今日・全期間のスコア。日付の区切りは北京時間（UTC+8）
+    progress = ProgressStore(
+        PROGRESS_DB_PATH,
+        utc_offset_hours=float(os.environ.get("PROGRESS_UTC_OFFSET_HOURS", "8")),
+    )
+    metrics.register_stats("progress_events_total", "Answers recorded and flushed to the progress store.",
+                           lambda: progress.stats)
+    metrics.register_gauge("progress_pending_answers", "Answers waiting to be written.", progress.pending)
+    return progress
+
+
+@st.cache_resource
+def get_classroom_aggregator():
+    # 全セッションで1つ。先生の画面は生徒のセッションではなく、ここのカウンターを読む
+    aggregator = ClassroomAggregator(
+        ttl_seconds=int(os.environ.get("CLASSROOM_TTL_SECONDS", str(6 * 3600))),
+    )
+    metrics.register_stats("classroom_events_total", "Classroom joins and answers (duplicates are not counted).",
+                           aggregator.stats)
+    metrics.register_gauge("classroom_rooms", "Open classrooms.", aggregator.rooms)
+    return aggregator
+
+
+def current_learner_id():
+    # URLの ?learner= で同じ学習者を見分ける（再読み込みしても続きから）
+    learner_id = st.query_params.get("learner")
+    if not learner_id:
+        learner_id = uuid.uuid4().hex[:12]
+        st.query_params["learner"] = learner_id
+    return learner_id
+
+
+# ============================================
+# 出題順（セッションごと。1周は同じ問題を出さず、間違えた問題は少しあとにまた出す）
+# ============================================
+def get_sampler(kind):
+    key = f"{kind}_sampler"
+    restore_session()
+    if key not in st.session_state:
+        st.session_state[key] = AdaptiveSampler(len(store.all_ids(kind)))
+    return st.session_state[key]
+
+
+def next_question(kind):
+    position = get_sampler(kind).draw()
+    return None if position is None else store.all_ids(kind)[position]
+
+
+def record_sampler_result(kind, item_id, correct):
+    restore_session()
+    sampler = st.session_state.get(f"{kind}_sampler")
+    if sampler is None:
+        return  # AI問題生成の問題など、出題順を使っていないもの
+    ids = store.all_ids(kind)
+    position = bisect_left(ids, item_id)
+    if position < len(ids) and ids[position] == item_id:
+        sampler.record(position, correct)
+
+
+# ============================================
+# しばらく使わないセッションの退避
+# ============================================
+# 最後の操作から SESSION_IDLE_SECONDS 秒たったセッションは、重い状態（出題順・見た
+# AI問題）を ProgressStore に書いて session_state から消す。フラッシュカードのデッキは
+# SRSStore に保存済みなので消すだけ。次に使う時（同じ ?learner= の新しいタブでも）読み直す。
+# 0 にすると退避しない
+SESSION_IDLE_SECONDS = int(os.environ.get("SESSION_IDLE_SECONDS", "600"))
+# 使っていないかを確かめる間隔は SESSION_CHECK_SECONDS（この間隔でだけ再実行される）
+SAMPLER_KINDS = ("quiz", "mistakes")
+
+
+def spill_session():
+    state = {}
+    for kind in SAMPLER_KINDS:
+        sampler = st.session_state.pop(f"{kind}_sampler", None)
+        if sampler is not None:
+            state[f"sampler:{kind}"] = sampler.dumps()
+    seen = st.session_state.pop("ai_quiz_seen", None)
+    if seen:
+        state["ai_quiz_seen"] = dump_words(seen)
+    st.session_state.pop("flashcard_deck", None)
+    st.session_state.pop("tutor_entry", None)
+    if state:
+        get_progress_store().save_state(st.session_state.learner_id, state)
+    st.session_state.restore_pending = True
+    session_memory.spilled()
+
+
+def restore_session():
+    # 新しいセッションと退避したセッションだけ、最初に必要になった時に1回読む
+    if not st.session_state.get("restore_pending"):
+        return
+    st.session_state.restore_pending = False
+    state = get_progress_store().load_state(st.session_state.learner_id)
+    if not state:
+        return
+    for kind in SAMPLER_KINDS:
+        data = state.get(f"sampler:{kind}")
+        sampler = AdaptiveSampler.loads(data) if data else None
+        # 問題の数が変わっていたら（内容を作り直した後）位置がずれるので使わない
+        if sampler is not None and sampler.size == len(store.all_ids(kind)):
+            st.session_state.setdefault(f"{kind}_sampler", sampler)
+    if "ai_quiz_seen" in state:
+        st.session_state.ai_quiz_seen = load_words(state["ai_quiz_seen"]) | st.session_state.get("ai_quiz_seen", set())
+    session_memory.restored()
+
+
+def account_session():
+    # このセッションの大きさを測る。しばらく操作がなければ退避する
+    session_id = current_session_id()
+    idle = session_memory.measure(session_id, state_bytes(st.session_state.to_dict()))
+    if SESSION_IDLE_SECONDS and idle > SESSION_IDLE_SECONDS and not st.session_state.get("restore_pending"):
+        spill_session()
+
 
 # ============================================
 # セッション状態の初期化
 # ============================================
-if "quiz_index" not in st.session_state:
-    st.session_state.quiz_index = random.randint(0, len(QUIZ_DATA) - 1)
-if "quiz_answered" not in st.session_state:
-    st.session_state.quiz_answered = False
-if "score" not in st.session_state:
-    st.session_state.score = {"correct": 0, "total": 0}
-if "flashcard_index" not in st.session_state:
-    st.session_state.flashcard_index = 0
+# 問題は Round（id と結果）で持つ。出題順の前に学習者を決める（退避した出題順を読むため）
+if "learner_id" not in st.session_state:
+    st.session_state.learner_id = current_learner_id()
+    st.session_state.restore_pending = True
+if "quiz" not in st.session_state:
+    st.session_state.quiz = Round(next_question("quiz"))
 if "flashcard_show_answer" not in st.session_state:
     st.session_state.flashcard_show_answer = False
-if "mistake_index" not in st.session_state:
-    st.session_state.mistake_index = random.randint(0, len(MISTAKE_DATA) - 1)
-if "mistake_answered" not in st.session_state:
-    st.session_state.mistake_answered = False
+if "mistake" not in st.session_state:
+    st.session_state.mistake = Round(next_question("mistakes"))
+
+# ============================================
+# スコア
+# ============================================
+# 解答は ProgressStore に記録する。サイドバーのスコア（score_slot）は、答えた時に
+# 再実行されるモードのフラグメントが書き直す（スコアのためだけの定期的な再実行はしない）。
+# フラグメントが外の入れ物に書けるのは、ページ全体の実行でも書いた時だけなので毎回書く
+
+
+def question_shown(mode, item_id):
+    # 答えるまでの時間を測るため、問題を最初に表示した時刻を覚えておく
+    shown = st.session_state.get("shown_question")
+    if shown is None or shown[:2] != (mode, item_id):
+        st.session_state.shown_question = (mode, item_id, time.time())
+
+
+def record_answer(mode, item_id, correct):
+    # 書き込みはバックグラウンドでまとめて行うので、ここでは待たない
+    shown = st.session_state.get("shown_question")
+    latency = time.time() - shown[2] if shown is not None and shown[:2] == (mode, item_id) else None
+    st.session_state.shown_question = None
+    record_sampler_result(mode, item_id, correct)
+    get_progress_store().record(st.session_state.learner_id, mode, item_id, correct, latency)
+
+
+def rerun_mode():
+    # モード内の操作はそのフラグメントだけ再実行する。
+    # 全体の再実行中に呼ばれた時（モード切替と重なった時など）は全体を再実行する
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
+        st.rerun()
+
+
+def show_score():
+    correct, total, all_correct, all_total = get_progress_store().scores(st.session_state.learner_id)
+    with score_slot.container():
+        if total > 0:
+            st.metric("今日のスコア", f"{correct}/{total}", f"{int(correct/total*100)}%")
+        if all_total > 0:
+            st.caption(f"これまで: {all_correct}/{all_total}問正解")
+
+
+@st.fragment(run_every=SESSION_CHECK_SECONDS)
+@timed_fragment(periodic=True)
+def session_upkeep():
+    # 何も表示しない。開いたまま使っていないタブの大きさを測り、退避する
+    account_session()
+
+
+METRICS_REFRESH_SECONDS = 5
+
+
+def _ratio(numerator, denominator):
+    return f"{numerator / denominator:.0%}" if denominator else "-"
+
+
+@st.fragment(run_every=METRICS_REFRESH_SECONDS)
+def metrics_panel():
+    # 管理用。?admin=<METRICS_ADMIN_TOKEN> の時だけ出す
+    with st.expander("📈 メトリクス"):
+        memory = session_memory.summary()
+        st.caption(
+            f"アクティブなセッション: {session_tracker.active()} / "
+            f"session_state: このセッション {session_memory.size(current_session_id()) / 1024:.1f} KB・"
+            f"最大 {memory['max'] / 1024:.1f} KB・合計 {memory['total'] / 1024:.1f} KB / "
+            f"退避 {session_memory.stats['spills']}・読み直し {session_memory.stats['restores']}"
+        )
+        rows = [
+            {"mode": mode, "run": run, "count": s["count"], "mean_ms": round(s["mean"] * 1000, 1),
+             "p95_ms": s["p95"] * 1000}
+            for (mode, run), s in metrics.SCRIPT_SECONDS.summary().items()
+        ]
+        rows += [
+            {"mode": f"llm:{label}", "run": "ttft", "count": s["count"], "mean_ms": round(s["mean"] * 1000, 1),
+             "p95_ms": s["p95"] * 1000}
+            for (label,), s in metrics.LLM_TTFT_SECONDS.summary().items()
+        ]
+        if rows:
+            # p95 はヒストグラムのバケットの上限（おおよその値）
+            st.dataframe(rows, hide_index=True)
+        cache = get_tutor_cache().stats
+        hits = cache["hits"] + cache["disk_hits"] + cache["coalesced"]
+        quiz = get_quiz_generator().stats()
+        st.caption(
+            f"チューターのキャッシュ命中率: {_ratio(hits, hits + cache['misses'])} / "
+            f"問題生成のJSON解析失敗: {quiz['parse_failures']}（{quiz['parse_failure_rate']:.1%}） / "
+            f"トークン: {metrics.LLM_TOKENS.total()}"
+        )
+        # テンプレートごとのトークン数と、今の max_tokens（実測の p99 から決まる）
+        st.dataframe([template.summary() for template in prompts.LEDGER.values()], hide_index=True)
+        st.download_button("metrics.txt", metrics.REGISTRY.render(), file_name="metrics.txt")
+
 
 # ============================================
 # メイン
@@ -276,16 +835,19 @@ with st.sidebar:
     st.header("🎮 モードを選ぼう")
     mode = st.radio(
         "学習モード",
-        ["🎯 熟語クイズ", "🔍 間違い探し", "📖 フラッシュカード", "🤖 AIチューター", "✨ AI問題生成"],
+        ["🎯 熟語クイズ", "🔍 間違い探し", "📖 フラッシュカード", "🤖 AIチューター", "✨ AI問題生成", "🏫 クラス"],
+        # 先生が配ったリンク（?class=コード）から開いた時はクラスのモードで始める
+        index=5 if st.query_params.get("class") else 0,
         label_visibility="collapsed"
     )
     
     st.divider()
     
-    if st.session_state.score["total"] > 0:
-        correct = st.session_state.score["correct"]
-        total = st.session_state.score["total"]
-        st.metric("今日のスコア", f"{correct}/{total}", f"{int(correct/total*100)}%")
+    score_slot = st.empty()
+    session_upkeep()
+    
+    if METRICS_ADMIN_TOKEN and st.query_params.get("admin") == METRICS_ADMIN_TOKEN:
+        metrics_panel()
     
     st.divider()
     st.caption("🤖 AI搭載！いつでも学習サポート")
@@ -293,22 +855,25 @@ with st.sidebar:
 # ============================================
 # 熟語クイズモード
 # ============================================
-if mode == "🎯 熟語クイズ":
+@st.fragment
+@timed_fragment
+def quiz_mode():
     st.header("🎯 熟語クイズ")
     st.write("正しい読み方を選んでね！")
     
     if st.button("🆕 新しい問題", use_container_width=True):
-        st.session_state.quiz_index = random.randint(0, len(QUIZ_DATA) - 1)
-        st.session_state.quiz_answered = False
-        st.rerun()
+        st.session_state.quiz = Round(next_question("quiz"))
+        rerun_mode()
     
-    quiz = QUIZ_DATA[st.session_state.quiz_index]
+    current = st.session_state.quiz
+    quiz = store.get_vocab(current.item)
     
     st.markdown(f'<div class="big-text">{quiz["word"]}</div>', unsafe_allow_html=True)
     st.caption(f"🇨🇳 中国語: {quiz['meaning_chinese']}")
     
-    if not st.session_state.quiz_answered:
-        options = [quiz["correct_reading"]] + quiz["wrong_readings"]
+    if not current.answered:
+        question_shown("quiz", quiz["id"])
+        options = [quiz["reading"]] + quiz["wrong_readings"]
         random.shuffle(options)
         
         st.write("**この熟語の読み方は？**")
@@ -317,54 +882,55 @@ if mode == "🎯 熟語クイズ":
         for i, option in enumerate(options):
             with cols[i % 2]:
                 if st.button(option, key=f"opt_{i}", use_container_width=True):
-                    st.session_state.quiz_answered = True
-                    st.session_state.score["total"] += 1
-                    
-                    if option == quiz["correct_reading"]:
-                        st.session_state.score["correct"] += 1
-                        st.session_state.last_result = "correct"
-                    else:
-                        st.session_state.last_result = "incorrect"
-                    st.rerun()
+                    current.result = option == quiz["reading"]
+                    record_answer("quiz", quiz["id"], current.result)
+                    rerun_mode()
     else:
-        if st.session_state.get("last_result") == "correct":
+        if current.result:
             st.markdown('<div class="correct">🎉 正解！すごい！</div>', unsafe_allow_html=True)
         else:
-            st.markdown(f'<div class="incorrect">😢 残念... 正解は「{quiz["correct_reading"]}」</div>', unsafe_allow_html=True)
+            st.markdown(f'<div class="incorrect">😢 残念... 正解は「{quiz["reading"]}」</div>', unsafe_allow_html=True)
         
         st.info(f"📝 例文: {quiz['example']}")
 
 # ============================================
 # 間違い探しモード
 # ============================================
-elif mode == "🔍 間違い探し":
+def is_mistake_answer(answer, data):
+    answer = answer.strip()
+    if answer == data["mistake"]:
+        return True
+    # 規則で作った問題は、答えが1回だけ出てくるよう前の語まで含めている（「日本語が」）。
+    # 間違えた後ろの部分（「が」）だけを書いても正解にする
+    return bool(answer) and MUTATION_TAG in data["tags"] \
+        and data["mistake"].endswith(answer) and not data["correct"].endswith(answer)
+
+
+@st.fragment
+@timed_fragment
+def mistake_mode():
     st.header("🔍 間違い探し")
     st.write("文の中の間違いを見つけてね！")
     
     if st.button("🆕 新しい問題", use_container_width=True):
-        st.session_state.mistake_index = random.randint(0, len(MISTAKE_DATA) - 1)
-        st.session_state.mistake_answered = False
-        st.rerun()
+        st.session_state.mistake = Round(next_question("mistakes"))
+        rerun_mode()
     
-    data = MISTAKE_DATA[st.session_state.mistake_index]
+    current = st.session_state.mistake
+    data = store.get_mistake(current.item)
     
     st.markdown(f'<div class="big-text" style="font-size: 1.5rem;">{data["sentence"]}</div>', unsafe_allow_html=True)
     
-    if not st.session_state.mistake_answered:
+    if not current.answered:
+        question_shown("mistakes", data["id"])
         user_answer = st.text_input("間違いはどこ？（間違っている部分を入力）")
         
         if st.button("答え合わせ", use_container_width=True):
-            st.session_state.mistake_answered = True
-            st.session_state.score["total"] += 1
-            
-            if user_answer.strip() == data["mistake"]:
-                st.session_state.score["correct"] += 1
-                st.session_state.mistake_result = "correct"
-            else:
-                st.session_state.mistake_result = "incorrect"
-            st.rerun()
+            current.result = is_mistake_answer(user_answer, data)
+            record_answer("mistakes", data["id"], current.result)
+            rerun_mode()
     else:
-        if st.session_state.get("mistake_result") == "correct":
+        if current.result:
             st.markdown('<div class="correct">🎉 正解！よく見つけたね！</div>', unsafe_allow_html=True)
         else:
             st.markdown(f'<div class="incorrect">😢 残念... 間違いは「{data["mistake"]}」</div>', unsafe_allow_html=True)
@@ -375,78 +941,137 @@ elif mode == "🔍 間違い探し":
 # ============================================
 # フラッシュカードモード
 # ============================================
-elif mode == "📖 フラッシュカード":
+@st.fragment
+@timed_fragment
+def flashcard_mode():
     st.header("📖 フラッシュカード")
     st.write("単語を覚えよう！")
     
-    idx = st.session_state.flashcard_index % len(FLASHCARDS)
-    card = FLASHCARDS[idx]
+    deck_size = store.count("vocab")
+    if "flashcard_deck" not in st.session_state:
+        st.session_state.flashcard_deck = get_srs_store().load(
+            st.session_state.learner_id,
+            deck_size,
+            lambda position: store.id_at("vocab", position),
+        )
+        st.session_state.flashcard_id = None
+    deck = st.session_state.flashcard_deck
+    if st.session_state.flashcard_id is None:
+        st.session_state.flashcard_id = deck.next_card()
+    card = store.get_vocab(st.session_state.flashcard_id)
     
     if not st.session_state.flashcard_show_answer:
         st.markdown(f'<div class="flashcard">{card["word"]}</div>', unsafe_allow_html=True)
         st.caption("👆 この漢字、読めるかな？")
     else:
         st.markdown(f'<div class="flashcard">{card["reading"]}</div>', unsafe_allow_html=True)
-        st.success(f"🇨🇳 意味: {card['meaning']}")
+        st.success(f"🇨🇳 意味: {card['meaning_chinese']}")
         st.info(f"📝 例文: {card['example']}")
     
-    col1, col2 = st.columns(2)
-    with col1:
-        if st.button("🔄 めくる", use_container_width=True):
-            st.session_state.flashcard_show_answer = not st.session_state.flashcard_show_answer
-            st.rerun()
-    with col2:
-        if st.button("➡️ 次へ", use_container_width=True):
-            st.session_state.flashcard_index += 1
+    if st.button("🔄 めくる", use_container_width=True):
+        st.session_state.flashcard_show_answer = not st.session_state.flashcard_show_answer
+        rerun_mode()
+    
+    # めくったら、覚えていたかどうかで次に出す日を決める
+    if st.session_state.flashcard_show_answer:
+        col1, col2 = st.columns(2)
+        with col1:
+            knew = st.button("⭕ 覚えてた", use_container_width=True)
+        with col2:
+            forgot = st.button("❌ 忘れてた", use_container_width=True)
+        if knew or forgot:
+            state = deck.review(card["id"], knew)
+            get_srs_store().save(deck, state)
+            st.session_state.flashcard_id = deck.next_card()
             st.session_state.flashcard_show_answer = False
-            st.rerun()
+            rerun_mode()
     
-    st.progress((idx + 1) / len(FLASHCARDS))
-    st.caption(f"カード {idx + 1} / {len(FLASHCARDS)}")
+    st.progress(len(deck.states) / deck_size)
+    st.caption(f"学習したカード {len(deck.states)} / {deck_size}")
 
 # ============================================
 # AIチューターモード
 # ============================================
-elif mode == "🤖 AIチューター":
+def choose_tutor_word(word):
+    # 候補のボタンのコールバック（ウィジェットが作られる前に入力欄を書き換える）
+    st.session_state.tutor_query = word
+    st.session_state.tutor_lookup = word
+
+
+@st.fragment
+@timed_fragment
+def tutor_mode():
     st.header("🤖 AIチューター")
     st.write("漢字や熟語の意味を教えてもらおう！")
     
-    user_input = st.text_input("🔤 調べたい漢字・熟語を入力", placeholder="例: 勉強、学校、友達...")
+    lexicon = get_lexicon()
+    user_input = st.text_input("🔤 調べたい漢字・熟語を入力", placeholder="例: 勉強、学校、友達...", key="tutor_query")
     
+    # 入力した文字で始まる単語（読みでもよい）を辞書から出す。押すとすぐ調べる
+    query = normalize_query(user_input)
+    suggestions = [word for word in lexicon.suggest(query) if word != query] if query else []
+    if suggestions:
+        cols = st.columns(4)
+        for i, word in enumerate(suggestions):
+            with cols[i % 4]:
+                st.button(word, key=f"tutor_suggest_{i}", on_click=choose_tutor_word, args=(word,),
+                          use_container_width=True)
+    
+    lookup = st.session_state.pop("tutor_lookup", None)
     if st.button("📚 意味を調べる", use_container_width=True) and user_input:
-        with st.spinner("AIが調べています..."):
-            try:
-                prompt = f"""あなたは中国の小学生に日本語を教える優しい先生です。
-以下の日本語の漢字・熟語について教えてください：
-
-「{user_input}」
-
-以下の形式で回答してください：
-📖 読み方: （ひらがなで）
-🇨🇳 中国語の意味: （簡体字で、ピンイン付き）
-📝 例文: （簡単な日本語の例文を1つ）
-💡 覚え方のコツ: （中国語との関連や覚えやすいヒント）
-
-回答は小学生にもわかりやすく、短くまとめてください。"""
-                
-                response = client.chat.completions.create(
-                    model="llama-3.3-70b-versatile",
-                    messages=[{"role": "user", "content": prompt}],
-                    temperature=0.7,
-                    max_tokens=1024
-                )
-                st.markdown("---")
-                st.markdown(response.choices[0].message.content)
-            except Exception as e:
-                st.error(f"エラーが発生しました: {str(e)}")
+        lookup = user_input
+    
+    # 文章や「、」区切りの単語の並びは、単語ごとに分けてまとめて調べる
+    words = lexicon.segment(normalize_query(lookup), limit=TUTOR_BATCH_MAX_WORDS + 1) if lookup else []
+    if len(words) > 1:
+        st.session_state.tutor_entry = None
+        if len(words) > TUTOR_BATCH_MAX_WORDS:
+            words = words[:TUTOR_BATCH_MAX_WORDS]
+            st.caption(f"✂️ 最初の{TUTOR_BATCH_MAX_WORDS}語だけ調べます")
+        st.markdown("---")
+        show_batch_lookup(words)
+    elif lookup:
+        word = normalize_query(lookup)
+        entry = lexicon.lookup(word)
+        # 辞書にあれば LLM を呼ばずにすぐ出す
+        st.session_state.tutor_entry = entry
+        if entry is None:
+            with st.spinner("AIが調べています..."):
+                try:
+                    key = get_tutor_cache().make_key(word, TUTOR_PROMPT_VERSION)
+                    show_cached_answer(key, "tutor", prompts.TUTOR, tutor_request(word))
+                except RETRYABLE_ERRORS:
+                    st.warning(BUSY_MESSAGE)
+                except Exception as e:
+                    st.error(f"エラーが発生しました: {str(e)}")
+        else:
+            metrics.TUTOR_ANSWERS.inc(source="lexicon")
+    
+    entry = st.session_state.get("tutor_entry")
+    if entry is not None:
+        st.markdown("---")
+        st.markdown(f'<div class="big-text">{entry["word"]}</div>', unsafe_allow_html=True)
+        st.markdown(lexicon_answer(entry))
+        st.caption("📒 辞書から表示しています")
+        if st.button("💡 覚え方のコツをAIに聞く", use_container_width=True):
+            with st.spinner("AIが考えています..."):
+                try:
+                    key = get_tutor_cache().make_key(f"hint:{entry['word']}", TUTOR_PROMPT_VERSION)
+                    show_cached_answer(key, "tutor_hint", prompts.TUTOR_HINT, tutor_hint_request(entry))
+                except RETRYABLE_ERRORS:
+                    st.warning(BUSY_MESSAGE)
+                except Exception as e:
+                    st.error(f"エラーが発生しました: {str(e)}")
     
     st.divider()
-    st.caption("💡 ヒント: 漢字1文字でも、熟語でも調べられます！")
+    st.caption("💡 ヒント: 漢字1文字でも、熟語でも調べられます！文章を貼り付けると、出てくる単語をまとめて調べます")
 
 # ============================================
 # AI問題生成モード
 # ============================================
-elif mode == "✨ AI問題生成":
+@st.fragment
+@timed_fragment
+def ai_quiz_mode():
     st.header("✨ AI問題生成")
     st.write("AIが新しい問題を作ってくれるよ！")
     
@@ -456,78 +1081,52 @@ elif mode == "✨ AI問題生成":
         value="ふつう"
     )
     
+    # ai_quiz は Round（item が GeneratedQuiz）。まだ作っていなければ None
     if "ai_quiz" not in st.session_state:
         st.session_state.ai_quiz = None
-    if "ai_quiz_answered" not in st.session_state:
-        st.session_state.ai_quiz_answered = False
+    restore_session()
+    if "ai_quiz_seen" not in st.session_state:
+        st.session_state.ai_quiz_seen = set()
+    
+    quiz_pool = get_quiz_pool()
     
     if st.button("🎲 新しい問題を作る", use_container_width=True):
-        with st.spinner("AIが問題を考えています..."):
-            try:
-                level_desc = {
-                    "かんたん": "小学1-2年生レベルの簡単な漢字（日、月、火、水、山、川など）",
-                    "ふつう": "小学3-4年生レベルの漢字（勉強、学校、友達など）",
-                    "むずかしい": "小学5-6年生レベルの漢字（経済、政治、環境など）"
-                }
-                
-                prompt = f"""あなたは日本語クイズの出題者です。
-{level_desc[difficulty]}から1つの熟語を選び、読み方クイズを作ってください。
-
-以下のJSON形式で回答してください（余計な説明は不要）:
-{{
-  "word": "熟語",
-  "correct_reading": "正しい読み方（ひらがな）",
-  "wrong_readings": ["間違い1", "間違い2", "間違い3"],
-  "meaning_chinese": "中国語の意味（ピンイン付き）",
-  "example": "例文"
-}}"""
-                
-                response = client.chat.completions.create(
-                    model="llama-3.3-70b-versatile",
-                    messages=[{"role": "user", "content": prompt}],
-                    temperature=0.7,
-                    max_tokens=1024
-                )
-                response_text = response.choices[0].message.content.strip()
-                
-                # JSONを抽出（```json ... ``` の形式にも対応）
-                import json
-                import re
-                
-                # マークダウンのコードブロックを除去
-                if "```json" in response_text:
-                    response_text = re.sub(r'```json\s*', '', response_text)
-                    response_text = re.sub(r'```\s*', '', response_text)
-                elif "```" in response_text:
-                    response_text = re.sub(r'```\s*', '', response_text)
-                
-                # JSONを抽出（ネストされたオブジェクトや配列に対応）
+        # プールにあれば待たずに出す。空の時だけその場で生成する
+        quiz_data = quiz_pool.pop(difficulty, st.session_state.ai_quiz_seen)
+        if not quiz_data:
+            with st.spinner("AIが問題を考えています..."):
                 try:
-                    # 最初の { から最後の } までを抽出
-                    start_idx = response_text.find('{')
-                    end_idx = response_text.rfind('}')
-                    if start_idx != -1 and end_idx != -1:
-                        json_str = response_text[start_idx:end_idx + 1]
-                        quiz_data = json.loads(json_str)
-                        st.session_state.ai_quiz = quiz_data
-                        st.session_state.ai_quiz_answered = False
-                    else:
+                    quiz_data = stream_quiz(difficulty) if LLM_STREAMING else None
+                    if not quiz_data:
+                        # ストリーミングしない時・形が崩れていた時は JSONモードで1問作る
+                        generated = get_quiz_generator().generate(
+                            difficulty, 1, st.session_state.ai_quiz_seen
+                        )
+                        quiz_data = generated[0] if generated else None
+                    if not quiz_data:
                         st.error("問題の生成に失敗しました。もう一度お試しください。")
-                except json.JSONDecodeError as je:
-                    st.error(f"JSONの解析に失敗しました: {str(je)}")
-            except Exception as e:
-                st.error(f"エラーが発生しました: {str(e)}")
-        st.rerun()
+                except RETRYABLE_ERRORS:
+                    st.warning(BUSY_MESSAGE)
+                except Exception as e:
+                    st.error(f"エラーが発生しました: {str(e)}")
+        # 失敗した時はメッセージが消えないように再実行しない
+        if quiz_data:
+            # プールの dict はコピーせず、必要なところだけを小さな記録にする
+            st.session_state.ai_quiz = Round(GeneratedQuiz.from_dict(quiz_data))
+            st.session_state.ai_quiz_seen.add(quiz_data["word"])
+            rerun_mode()
     
     # 生成された問題を表示
     if st.session_state.ai_quiz:
-        quiz = st.session_state.ai_quiz
+        current = st.session_state.ai_quiz
+        quiz = current.item
         
-        st.markdown(f'<div class="big-text">{quiz["word"]}</div>', unsafe_allow_html=True)
-        st.caption(f"🇨🇳 中国語: {quiz['meaning_chinese']}")
+        st.markdown(f'<div class="big-text">{quiz.word}</div>', unsafe_allow_html=True)
+        st.caption(f"🇨🇳 中国語: {quiz.meaning_chinese}")
         
-        if not st.session_state.ai_quiz_answered:
-            options = [quiz["correct_reading"]] + quiz["wrong_readings"]
+        if not current.answered:
+            question_shown("ai_quiz", quiz.word)
+            options = [quiz.reading, *quiz.wrong_readings]
             random.shuffle(options)
             
             st.write("**この熟語の読み方は？**")
@@ -536,22 +1135,169 @@ elif mode == "✨ AI問題生成":
             for i, option in enumerate(options):
                 with cols[i % 2]:
                     if st.button(option, key=f"ai_opt_{i}", use_container_width=True):
-                        st.session_state.ai_quiz_answered = True
-                        st.session_state.score["total"] += 1
-                        
-                        if option == quiz["correct_reading"]:
-                            st.session_state.score["correct"] += 1
-                            st.session_state.ai_result = "correct"
-                        else:
-                            st.session_state.ai_result = "incorrect"
-                        st.rerun()
+                        current.result = option == quiz.reading
+                        record_answer("ai_quiz", quiz.word, current.result)
+                        rerun_mode()
         else:
-            if st.session_state.get("ai_result") == "correct":
+            if current.result:
                 st.markdown('<div class="correct">🎉 正解！すごい！</div>', unsafe_allow_html=True)
             else:
-                st.markdown(f'<div class="incorrect">😢 残念... 正解は「{quiz["correct_reading"]}」</div>', unsafe_allow_html=True)
+                st.markdown(f'<div class="incorrect">😢 残念... 正解は「{quiz.reading}」</div>', unsafe_allow_html=True)
             
-            st.info(f"📝 例文: {quiz['example']}")
+            st.info(f"📝 例文: {quiz.example}")
+
+# ============================================
+# クラスモード（先生がコードを配り、みんなで同じ問題を解く）
+# ============================================
+# 先生の画面を読み直す間隔（秒）と、1クラスの問題の上限
+CLASSROOM_REFRESH_SECONDS = 2
+CLASSROOM_MAX_ITEMS = 30
+
+
+def quiz_options(quiz, seed):
+    # 読み直しても選択肢の順番が変わらないようにする
+    options = [quiz["reading"]] + quiz["wrong_readings"]
+    random.Random(seed).shuffle(options)
+    return options
+
+
+def leave_classroom():
+    for key in ("classroom_code", "classroom_index", "classroom_result"):
+        st.session_state.pop(key, None)
+
+
+def classroom_student():
+    aggregator = get_classroom_aggregator()
+    code = st.session_state.get("classroom_code")
+    room = aggregator.get(code) if code else None
+    if code and room is None:
+        st.warning("クラスが終わりました。")
+        leave_classroom()
+        code = None
+
+    if room is None:
+        entered = st.text_input("🔑 クラスのコード", value=st.query_params.get("class", ""), max_chars=8)
+        if st.button("🚪 参加する", use_container_width=True) and entered:
+            room = aggregator.join(entered, st.session_state.learner_id)
+            if room is None:
+                st.error("コードが見つかりません。先生に聞いてね！")
+            else:
+                st.session_state.classroom_code = room.code
+                st.session_state.classroom_index = 0
+                rerun_mode()
+        return
+
+    index = st.session_state.classroom_index
+    st.caption(f"🏫 クラス {room.code}・{min(index + 1, len(room.item_ids))} / {len(room.item_ids)} 問目")
+    if index >= len(room.item_ids):
+        st.success("🎉 全部できました！")
+        st.button("🚪 クラスを出る", on_click=leave_classroom, use_container_width=True)
+        return
+
+    quiz = store.get_vocab(room.item_ids[index])
+    st.markdown(f'<div class="big-text">{quiz["word"]}</div>', unsafe_allow_html=True)
+    st.caption(f"🇨🇳 中国語: {quiz['meaning_chinese']}")
+    result = st.session_state.get("classroom_result")
+    if result is None:
+        question_shown("quiz", quiz["id"])
+        st.write("**この熟語の読み方は？**")
+        cols = st.columns(2)
+        for i, option in enumerate(quiz_options(quiz, f"{st.session_state.learner_id}:{quiz['id']}")):
+            with cols[i % 2]:
+                if st.button(option, key=f"class_opt_{i}", use_container_width=True):
+                    correct = option == quiz["reading"]
+                    aggregator.record(room.code, quiz["id"], st.session_state.learner_id, option, correct)
+                    record_answer("quiz", quiz["id"], correct)
+                    st.session_state.classroom_result = correct
+                    rerun_mode()
+    else:
+        if result:
+            st.markdown('<div class="correct">🎉 正解！すごい！</div>', unsafe_allow_html=True)
+        else:
+            st.markdown(f'<div class="incorrect">😢 残念... 正解は「{quiz["reading"]}」</div>', unsafe_allow_html=True)
+        if st.button("➡️ 次の問題", use_container_width=True):
+            st.session_state.classroom_index = index + 1
+            st.session_state.classroom_result = None
+            rerun_mode()
+
+
+@st.fragment(run_every=CLASSROOM_REFRESH_SECONDS)
+@timed_fragment(periodic=True)
+def classroom_dashboard():
+    # 問題の数だけカウンターを読む（生徒の数にはよらない）
+    code = st.session_state.get("classroom_teacher_code")
+    snapshot = get_classroom_aggregator().snapshot(code) if code else None
+    if snapshot is None:
+        return
+    answers = sum(total for _, _, total, _ in snapshot["items"])
+    cols = st.columns(2)
+    cols[0].metric("🙋 参加した生徒", snapshot["students"])
+    cols[1].metric("✏️ 解答の数", answers)
+    rows = []
+    for item_id, correct, total, choices in snapshot["items"]:
+        quiz = store.get_vocab(item_id)
+        distribution = "　".join(
+            f"{'✅' if option == quiz['reading'] else ''}{option} {choices.get(option, 0)}"
+            for option in [quiz["reading"]] + quiz["wrong_readings"]
+        )
+        rows.append({"熟語": quiz["word"], "解答": total, "正解率": correct / total if total else 0.0,
+                     "選んだ読み": distribution})
+    st.dataframe(rows, hide_index=True, column_config={
+        "正解率": st.column_config.ProgressColumn("正解率", format="percent", min_value=0.0, max_value=1.0),
+    })
+
+
+def close_classroom():
+    get_classroom_aggregator().close(st.session_state.pop("classroom_teacher_code", None))
+
+
+def classroom_teacher():
+    code = st.session_state.get("classroom_teacher_code")
+    if code and get_classroom_aggregator().get(code) is None:
+        st.warning("クラスの時間が終わりました。")
+        st.session_state.pop("classroom_teacher_code")
+        code = None
+
+    if code is None:
+        grades = store.grades("quiz")
+        grade = st.selectbox("📚 学年", grades, format_func=lambda g: f"{g}年生")
+        item_ids = st.multiselect(
+            f"🎯 出す熟語（{CLASSROOM_MAX_ITEMS}個まで）", store.ids("quiz", grade=grade, limit=200),
+            format_func=lambda item_id: store.get_vocab(item_id)["word"], max_selections=CLASSROOM_MAX_ITEMS,
+        )
+        if st.button("🏫 クラスを作る", use_container_width=True, disabled=not item_ids):
+            room = get_classroom_aggregator().create(item_ids, st.session_state.learner_id)
+            st.session_state.classroom_teacher_code = room.code
+            rerun_mode()
+        return
+
+    st.markdown(f'<div class="big-text">{code}</div>', unsafe_allow_html=True)
+    st.caption(f"生徒は「🏫 クラス」でこのコードを入れるか、URLの最後に ?class={code} を付けて開きます")
+    classroom_dashboard()
+    st.button("🛑 クラスを終わる", on_click=close_classroom, use_container_width=True)
+
+
+@st.fragment
+@timed_fragment
+def classroom_mode():
+    st.header("🏫 クラス")
+    student_tab, teacher_tab = st.tabs(["🙋 生徒", "👩‍🏫 先生"])
+    with student_tab:
+        classroom_student()
+    with teacher_tab:
+        classroom_teacher()
+
+
+# 各モードはフラグメント。モード内の操作ではそのモードだけが再実行される
+MODES = {
+    "🎯 熟語クイズ": quiz_mode,
+    "🔍 間違い探し": mistake_mode,
+    "📖 フラッシュカード": flashcard_mode,
+    "🤖 AIチューター": tutor_mode,
+    "✨ AI問題生成": ai_quiz_mode,
+    "🏫 クラス": classroom_mode,
+}
+MODES[mode]()
 
 # ============================================
 # フッター
@@ -559,3 +1305,5 @@ elif mode == "✨ AI問題生成":
 st.divider()
 st.caption("Made with ❤️ for Chinese students learning Japanese | Powered by Gemini AI 🤖")
 
+# ページ全体の実行時間（途中で st.rerun() された実行は数えない）
+metrics.SCRIPT_SECONDS.observe(time.perf_counter() - _run_started, mode=MODES[mode].__name__, run="full")
@@ -0,0 +1,262 @@
+"""1回の操作（スクリプトの実行）にかかる時間・メモリを測るベンチマーク。
+
+streamlit.testing.v1.AppTest で app.py を動かし、各モードを最初から最後まで操作する。
+AIのモードは stub_groq の偽クライアントを使うのでネットワークは使わない。
+
+    python benchmarks/bench_app.py --iterations 20 --output bench.json
+    python benchmarks/bench_app.py --thresholds benchmarks/thresholds.json
+    python benchmarks/bench_app.py --baseline old.json --tolerance 0.25
+
+結果はJSONで出力し、しきい値を超えたら終了コード1で終わる。
+"""
+import argparse
+import gc
+import itertools
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_PATH = os.path.join(os.path.dirname(BENCH_DIR), "app.py")
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import stub_groq  # noqa: E402
+from session_state import state_bytes  # noqa: E402
+
+MODE_LABELS = {
+    "quiz": "🎯 熟語クイズ",
+    "mistake": "🔍 間違い探し",
+    "flashcard": "📖 フラッシュカード",
+    "tutor": "🤖 AIチューター",
+    "tutor_lexicon": "🤖 AIチューター",
+    "ai_quiz": "✨ AI問題生成",
+}
+
+
+# ============================================
+# 各モードの操作（1回分）
+# ============================================
+def _button(at, label):
+    for button in at.button:
+        if button.label == label:
+            return button
+    raise LookupError(f"button not found: {label}")
+
+
+def step_quiz(at):
+    yield "answer", lambda: at.button[1].click().run()
+    yield "new", lambda: _button(at, "🆕 新しい問題").click().run()
+
+
+def step_mistake(at):
+    yield "type", lambda: at.text_input[0].input("が").run()
+    yield "check", lambda: _button(at, "答え合わせ").click().run()
+    yield "new", lambda: _button(at, "🆕 新しい問題").click().run()
+
+
+def step_flashcard(at):
+    yield "flip", lambda: _button(at, "🔄 めくる").click().run()
+    yield "grade", lambda: _button(at, "⭕ 覚えてた").click().run()
+
+
+# 辞書（lexicon.py）にない2文字の言葉。毎回ちがう言葉にして、AIの応答のキャッシュにも
+# 当てない（LLMを呼ぶ遅い道を測る）
+TUTOR_KANJI = "春夏秋冬山川海空雨雪風森"
+TUTOR_WORDS = itertools.cycle([a + b for a in TUTOR_KANJI for b in TUTOR_KANJI if a != b])
+# 辞書にある言葉（LLMを呼ばずにすぐ出す道）
+LEXICON_WORD = "勉強"
+
+
+def step_tutor(at):
+    word = next(TUTOR_WORDS)
+    yield "type", lambda: at.text_input[0].input(word).run()
+    yield "lookup", lambda: _button(at, "📚 意味を調べる").click().run()
+
+
+def step_tutor_lexicon(at):
+    yield "type", lambda: at.text_input[0].input(LEXICON_WORD).run()
+    yield "lookup", lambda: _button(at, "📚 意味を調べる").click().run()
+
+
+def step_ai_quiz(at):
+    yield "generate", lambda: _button(at, "🎲 新しい問題を作る").click().run()
+    yield "answer", lambda: at.button[1].click().run()
+
+
+SCENARIOS = {
+    "quiz": step_quiz,
+    "mistake": step_mistake,
+    "flashcard": step_flashcard,
+    "tutor": step_tutor,
+    "tutor_lexicon": step_tutor_lexicon,
+    "ai_quiz": step_ai_quiz,
+}
+
+
+# ============================================
+# 計測
+# ============================================
+def session_state_bytes(at):
+    # アプリの app_session_state_bytes と同じ測り方
+    state = at.session_state
+    items = state.to_dict() if hasattr(state, "to_dict") else state.filtered_state
+    return state_bytes(dict(items))
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(q / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def summarize(values):
+    return {
+        "p50": round(percentile(values, 50), 3),
+        "p95": round(percentile(values, 95), 3),
+        "max": round(max(values), 3) if values else 0.0,
+    }
+
+
+def new_app(mode, timeout):
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout).run()
+    at.sidebar.radio[0].set_value(MODE_LABELS[mode]).run()
+    if at.exception:
+        raise RuntimeError(f"{mode}: {at.exception[0].message}")
+    return at
+
+
+def run_scenario(name, iterations, timeout):
+    # 1回目: 時間だけ（tracemalloc は遅くなるので別に回す）
+    at = new_app(name, timeout)
+    wall_ms = []
+    for _ in range(iterations):
+        for _, action in SCENARIOS[name](at):
+            start = time.perf_counter()
+            action()
+            wall_ms.append((time.perf_counter() - start) * 1000)
+            if at.exception:
+                raise RuntimeError(f"{name}: {at.exception[0].message}")
+
+    # 2回目: メモリ
+    at = new_app(name, timeout)
+    alloc_peak_kb = []
+    retained_kb = []
+    gc.collect()
+    tracemalloc.start()
+    try:
+        for _ in range(iterations):
+            for _, action in SCENARIOS[name](at):
+                before, _ = tracemalloc.get_traced_memory()
+                tracemalloc.reset_peak()
+                action()
+                after, peak = tracemalloc.get_traced_memory()
+                alloc_peak_kb.append((peak - before) / 1024)
+                retained_kb.append((after - before) / 1024)
+    finally:
+        tracemalloc.stop()
+
+    return {
+        "runs": len(wall_ms),
+        "wall_ms": summarize(wall_ms),
+        "alloc_peak_kb": summarize(alloc_peak_kb),
+        "retained_kb": summarize(retained_kb),
+        "session_state_bytes": session_state_bytes(at),
+    }
+
+
+# ============================================
+# しきい値
+# ============================================
+# しきい値のキー -> 結果から値を取り出す方法
+METRICS = {
+    "wall_ms_p50": lambda r: r["wall_ms"]["p50"],
+    "wall_ms_p95": lambda r: r["wall_ms"]["p95"],
+    "alloc_peak_kb_p95": lambda r: r["alloc_peak_kb"]["p95"],
+    "retained_kb_p95": lambda r: r["retained_kb"]["p95"],
+    "session_state_bytes": lambda r: r["session_state_bytes"],
+}
+
+
+def check_thresholds(results, thresholds):
+    failures = []
+    default = thresholds.get("default", {})
+    for name, result in results.items():
+        limits = {**default, **thresholds.get("scenarios", {}).get(name, {})}
+        for metric, limit in limits.items():
+            value = METRICS[metric](result)
+            if value > limit:
+                failures.append({"scenario": name, "metric": metric, "value": value, "limit": limit})
+    return failures
+
+
+def check_baseline(results, baseline, tolerance):
+    failures = []
+    for name, result in results.items():
+        old = baseline.get("scenarios", {}).get(name)
+        if old is None:
+            continue
+        for metric in ("wall_ms_p50", "alloc_peak_kb_p95", "session_state_bytes"):
+            old_value = METRICS[metric](old)
+            value = METRICS[metric](result)
+            if old_value and value > old_value * (1 + tolerance):
+                failures.append({
+                    "scenario": name, "metric": metric, "value": value,
+                    "baseline": old_value, "tolerance": tolerance,
+                })
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", nargs="*", default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="偽クライアントの応答時間（秒）")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--thresholds", help="しきい値のJSON（benchmarks/thresholds.json など）")
+    parser.add_argument("--baseline", help="前回の結果のJSON。tolerance を超えて悪くなったら失敗")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--output", help="結果の書き出し先（省略時は標準出力）")
+    args = parser.parse_args(argv)
+
+    # 実行ごとに新しいストア・キャッシュを使う
+    workdir = tempfile.mkdtemp(prefix="bench-")
+    os.environ["LLM_CACHE_PATH"] = ""
+    os.environ["CONTENT_CACHE_DIR"] = os.path.join(workdir, "content")
+    os.environ["PROGRESS_DB_PATH"] = os.path.join(workdir, "progress.sqlite3")
+    stub_groq.install(args.llm_latency)
+
+    results = {name: run_scenario(name, args.iterations, args.timeout) for name in args.scenarios}
+    failures = []
+    if args.thresholds:
+        with open(args.thresholds, encoding="utf-8") as f:
+            failures += check_thresholds(results, json.load(f))
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            failures += check_baseline(results, json.load(f), args.tolerance)
+
+    report = {
+        "python": sys.version.split()[0],
+        "iterations": args.iterations,
+        "llm_latency": args.llm_latency,
+        "scenarios": results,
+        "failures": failures,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
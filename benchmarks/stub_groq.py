@@ -0,0 +1,129 @@
+import itertools
+import json
+import re
+import threading
+import time
+import types
+
+# ============================================
+# ベンチマーク用のGroqクライアントの代わり
+# ============================================
+# groq.Groq と同じ形（chat.completions.create / with_raw_response / stream=True）で、
+# ネットワークを使わずに決まった応答を返す。
+TUTOR_ANSWER = """📖 読み方: べんきょう
+🇨🇳 中国語の意味: 学习 xuéxí
+📝 例文: 毎日日本語を勉強します。
+💡 覚え方のコツ: 「勉」も「強」も中国語と同じ漢字です。"""
+
+RATE_LIMIT_HEADERS = {
+    "x-ratelimit-remaining-requests": "14000",
+    "x-ratelimit-reset-requests": "6s",
+    "x-ratelimit-remaining-tokens": "100000",
+    "x-ratelimit-reset-tokens": "1s",
+}
+
+_COUNT = re.compile(r"(\d+)個")
+
+
+def _kana(n):
+    # 読み方はひらがなだけにする（番号もかなで表す）
+    digits = "あいうえおかきくけこ"
+    return "".join(digits[int(d)] for d in str(n))
+
+
+def _quiz(n):
+    word = f"熟語{n}"
+    suffix = _kana(n)
+    return {
+        "word": word,
+        "correct_reading": f"じゅくご{suffix}",
+        "wrong_readings": [f"じゅくこ{suffix}", f"しゅくご{suffix}", f"じゅっご{suffix}"],
+        "meaning_chinese": "熟语 shúyǔ",
+        "example": f"{word}を勉強します。",
+    }
+
+
+def _mistake(n):
+    return {
+        "sentence": f"わたしは{n}時に学校が行きます。",
+        "mistake": "が",
+        "correct": "に",
+        "explanation": "「行く」是移动动词，应该用「に」表示目的地。",
+        "tag": "particle",
+    }
+
+
+class StubCompletions:
+    def __init__(self, latency=0.0, start=1):
+        self.latency = latency
+        self.calls = 0
+        self._serial = itertools.count(start)
+        self._lock = threading.Lock()
+        self.with_raw_response = types.SimpleNamespace(create=self._create_raw)
+
+    def content_for(self, messages):
+        # 指示は system、変わる部分は user メッセージにある
+        prompt = "\n".join(message["content"] for message in messages)
+        if '"mistakes"' in prompt:
+            match = _COUNT.search(prompt)
+            count = int(match.group(1)) if match else 1
+            mistakes = [_mistake(next(self._serial)) for _ in range(count)]
+            return json.dumps({"mistakes": mistakes}, ensure_ascii=False)
+        if '"quizzes"' in prompt:
+            match = _COUNT.search(prompt)
+            count = int(match.group(1)) if match else 1
+            quizzes = [_quiz(next(self._serial)) for _ in range(count)]
+            return json.dumps({"quizzes": quizzes}, ensure_ascii=False)
+        if "JSON" in prompt:
+            return json.dumps(_quiz(next(self._serial)), ensure_ascii=False)
+        return TUTOR_ANSWER
+
+    def create(self, **kwargs):
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        content = self.content_for(kwargs["messages"])
+        prompt_tokens = sum(len(message["content"]) for message in kwargs["messages"])
+        usage = types.SimpleNamespace(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=len(content),
+            total_tokens=prompt_tokens + len(content),
+        )
+        if kwargs.get("stream"):
+            return self._stream(content)
+        message = types.SimpleNamespace(content=content)
+        return types.SimpleNamespace(
+            choices=[types.SimpleNamespace(message=message, finish_reason="stop")],
+            usage=usage,
+        )
+
+    def _stream(self, content):
+        for i in range(0, len(content), 8):
+            delta = types.SimpleNamespace(content=content[i:i + 8])
+            yield types.SimpleNamespace(
+                choices=[types.SimpleNamespace(delta=delta, finish_reason=None)], x_groq=None
+            )
+
+    def _create_raw(self, **kwargs):
+        result = self.create(**kwargs)
+        return types.SimpleNamespace(headers=dict(RATE_LIMIT_HEADERS), parse=lambda: result)
+
+
+class StubGroq:
+    latency = 0.0
+    instances = []
+
+    def __init__(self, *args, **kwargs):
+        self.completions = StubCompletions(self.latency)
+        self.chat = types.SimpleNamespace(completions=self.completions)
+        StubGroq.instances.append(self)
+
+
+def install(latency=0.0):
+    """groq.Groq を差し替える（app.py を AppTest で動かす前に呼ぶ）。"""
+    import groq
+
+    StubGroq.latency = latency
+    groq.Groq = StubGroq
+    return StubGroq
@@ -0,0 +1,222 @@
+"""画面に出る文字だけを含む Noto Sans JP のサブセット（WOFF2）を static/fonts/ に作る。
+
+    python build_font.py                       # 元フォントは .cache/fonts/（なければダウンロード）
+    python build_font.py --source NotoSansJP-Regular.otf
+    python build_font.py --check               # 今のコンテンツに合っているかだけ見る
+
+文字は content/*.jsonl の全ての文字列と、そこから規則で作る問題（間違い探し・
+選択肢。content_store.py のストアに入るもの）、app.py・mutations.py・distractors.py の
+文字列リテラル（UIの文言や説明のひな形）、かな・ASCII・記号、fonts/kyoiku_kanji.txt
+（小学校で習う漢字）から集める。
+ファイル名に文字集合のハッシュを入れるので、コンテンツが変わると別のファイルになり
+ブラウザのキャッシュも切り替わる。app.py は static/fonts/manifest.json を読む。
+サブセットにない字（AIの応答など）はCSSの後ろのシステムフォントで表示される。
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import tokenize
+import urllib.request
+from ast import literal_eval
+
+from content_store import CONTENT_DIR, SOURCES, read_jsonl
+from distractors import DISTRACTOR_VERSION, fill_missing
+from mutations import MUTATION_VERSION, generate as generate_mistakes, source_sentences
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+STATIC_FONT_DIR = os.path.join(ROOT, "static", "fonts")
+MANIFEST_PATH = os.path.join(STATIC_FONT_DIR, "manifest.json")
+BASE_KANJI_PATH = os.path.join(ROOT, "fonts", "kyoiku_kanji.txt")
+UI_SOURCES = tuple(os.path.join(ROOT, name) for name in ("app.py", "mutations.py", "distractors.py"))
+FONT_SOURCE = os.environ.get("FONT_SOURCE", os.path.join(ROOT, ".cache", "fonts", "NotoSansJP[wght].ttf"))
+FONT_SOURCE_URL = os.environ.get(
+    "FONT_SOURCE_URL", "https://github.com/google/fonts/raw/main/ofl/notosansjp/NotoSansJP%5Bwght%5D.ttf"
+)
+FONT_FAMILY = "Noto Sans JP Subset"
+# 集め方やサブセットの作り方を変えたら上げる
+SUBSET_VERSION = 1
+
+# いつでも入れておく範囲
+BASE_RANGES = (
+    (0x0020, 0x007E),  # ASCII
+    (0x00A0, 0x00FF),  # ラテン1（ピンインの記号の一部）
+    (0x3000, 0x303F),  # 句読点・かっこ
+    (0x3041, 0x309F),  # ひらがな
+    (0x30A0, 0x30FF),  # カタカナ
+    (0xFF01, 0xFF5E),  # 全角英数・記号
+)
+
+
+# ============================================
+# 文字を集める
+# ============================================
+def _strings(value):
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, dict):
+        for child in value.values():
+            yield from _strings(child)
+    elif isinstance(value, list):
+        for child in value:
+            yield from _strings(child)
+
+
+def content_chars(content_dir=CONTENT_DIR):
+    chars = set()
+    for name in SOURCES:
+        for item in read_jsonl(os.path.join(content_dir, name)):
+            for text in _strings(item):
+                chars.update(text)
+    # ストアを作る時（content_store.build）と同じように規則で作る問題も画面に出る
+    vocab = list(read_jsonl(os.path.join(content_dir, "vocab.jsonl")))
+    mistakes = list(read_jsonl(os.path.join(content_dir, "mistakes.jsonl")))
+    generated = generate_mistakes(source_sentences(vocab, mistakes), existing=[item["sentence"] for item in mistakes])
+    for item in list(fill_missing(vocab)) + list(generated):
+        for text in _strings(item):
+            chars.update(text)
+    return chars
+
+
+def ui_chars(paths=UI_SOURCES):
+    # コメントは画面に出ないので、文字列リテラルだけを見る
+    chars = set()
+    for path in paths:
+        with open(path, "rb") as f:
+            for token in tokenize.tokenize(f.readline):
+                if token.type != tokenize.STRING:
+                    continue
+                try:
+                    value = literal_eval(token.string)
+                except (ValueError, SyntaxError):
+                    # f文字列は式の部分ごと含めてしまう（余分な字が少し入るだけ）
+                    value = token.string
+                if isinstance(value, bytes):
+                    continue
+                chars.update(value)
+    return chars
+
+
+def base_chars(kanji_path=BASE_KANJI_PATH):
+    chars = {chr(code) for start, end in BASE_RANGES for code in range(start, end + 1)}
+    with open(kanji_path, encoding="utf-8") as f:
+        for line in f:
+            if not line.startswith("#"):
+                chars.update(line.strip())
+    return chars
+
+
+def collect_chars(content_dir=CONTENT_DIR):
+    chars = content_chars(content_dir) | ui_chars() | base_chars()
+    # 制御文字は要らない
+    return sorted(c for c in chars if ord(c) >= 0x20 and c not in "\x7f​﻿")
+
+
+def chars_digest(chars):
+    digest = hashlib.sha256(
+        f"subset={SUBSET_VERSION} distractors={DISTRACTOR_VERSION} mutations={MUTATION_VERSION}".encode()
+    )
+    digest.update("".join(chars).encode())
+    return digest.hexdigest()[:12]
+
+
+def read_manifest(path=MANIFEST_PATH):
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def is_current(manifest, content_dir=CONTENT_DIR):
+    return manifest is not None and manifest.get("chars_digest") == chars_digest(collect_chars(content_dir))
+
+
+# ============================================
+# サブセットを作る
+# ============================================
+def fetch_source(path=FONT_SOURCE, url=FONT_SOURCE_URL):
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        print(f"downloading {url}", file=sys.stderr)
+        tmp_path = f"{path}.tmp"
+        urllib.request.urlretrieve(url, tmp_path)
+        os.replace(tmp_path, path)
+    return path
+
+
+def build(source, chars, out_dir=STATIC_FONT_DIR):
+    from fontTools import subset
+    from fontTools.ttLib import TTFont
+
+    digest = chars_digest(chars)
+    name = f"noto-sans-jp-{digest}.woff2"
+    path = os.path.join(out_dir, name)
+    os.makedirs(out_dir, exist_ok=True)
+
+    font = TTFont(source)
+    # 可変フォント（wght軸）はそのまま残し、1ファイルで全ての太さを出す
+    weight = font["fvar"].axes[0] if "fvar" in font else None
+    weights = f"{int(weight.minValue)} {int(weight.maxValue)}" if weight is not None and weight.axisTag == "wght" else "400"
+    options = subset.Options()
+    options.flavor = "woff2"
+    options.layout_features = ["*"]
+    options.name_IDs = []
+    options.notdef_outline = True
+    subsetter = subset.Subsetter(options)
+    subsetter.populate(unicodes=[ord(c) for c in chars])
+    subsetter.subset(font)
+    tmp_path = f"{path}.tmp"
+    font.flavor = "woff2"
+    font.save(tmp_path)
+    os.replace(tmp_path, path)
+
+    manifest = {
+        "file": name,
+        "family": FONT_FAMILY,
+        "weights": weights,
+        "chars_digest": digest,
+        "chars": len(chars),
+        "bytes": os.path.getsize(path),
+        "source": os.path.basename(source),
+        "source_bytes": os.path.getsize(source),
+    }
+    tmp_path = f"{MANIFEST_PATH}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+        f.write("\n")
+    os.replace(tmp_path, MANIFEST_PATH)
+
+    # 古いサブセットを消す
+    for old in os.listdir(out_dir):
+        if old.startswith("noto-sans-jp-") and old.endswith(".woff2") and old != name:
+            os.remove(os.path.join(out_dir, old))
+    return manifest
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--source", default=FONT_SOURCE, help="元のフォント（TTF/OTF）")
+    parser.add_argument("--check", action="store_true", help="作り直しが必要なら終了コード1")
+    parser.add_argument("--force", action="store_true", help="最新でも作り直す")
+    args = parser.parse_args(argv)
+
+    chars = collect_chars()
+    manifest = read_manifest()
+    current = manifest is not None and manifest.get("chars_digest") == chars_digest(chars) \
+        and os.path.exists(os.path.join(STATIC_FONT_DIR, manifest["file"]))
+    if args.check:
+        print("up to date" if current else "stale", file=sys.stderr)
+        return 0 if current else 1
+    if current and not args.force:
+        print(f"{manifest['file']} is up to date ({manifest['chars']} chars, {manifest['bytes']} bytes)",
+              file=sys.stderr)
+        return 0
+    manifest = build(fetch_source(args.source), chars)
+    print(f"{manifest['file']}: {manifest['chars']} chars, {manifest['bytes']} bytes "
+          f"(source {manifest['source_bytes']} bytes)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
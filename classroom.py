@@ -0,0 +1,162 @@
+import secrets
+import threading
+import time
+
+# ============================================
+# クラスで一斉に解く時の集計（プロセスで1つを共有する）
+# ============================================
+# 生徒の解答は (クラス, 問題) ごとのカウンターを1つ足すだけ（O(1)）。カウンターは
+# ロックを分けた shard に置くので、40人が同時に答えても1つのロックを取り合わない。
+# 先生の画面はクラスの問題の数だけカウンターを読む（生徒のセッションは見ない）
+CODE_ALPHABET = "ABCDEFGHJKLMNPQRSTUVWXYZ23456789"  # 見間違えやすい I・O・0・1 は使わない
+CODE_LENGTH = 5
+
+
+class ItemTally:
+    __slots__ = ("correct", "total", "choices", "students")
+
+    def __init__(self):
+        self.correct = 0
+        self.total = 0
+        self.choices = {}  # 選んだ読み -> 人数
+        self.students = set()  # もう答えた生徒（2回目の解答は数えない）
+
+
+class Classroom:
+    __slots__ = ("code", "item_ids", "teacher_id", "created_at")
+
+    def __init__(self, code, item_ids, teacher_id, created_at):
+        self.code = code
+        self.item_ids = tuple(item_ids)
+        self.teacher_id = teacher_id
+        self.created_at = created_at
+
+
+class ClassroomAggregator:
+    """クラスの作成・参加と、問題ごとの正解数・選んだ読みの分布。
+
+    カウンターは (code, item_id) のハッシュで shards 個のどれかに入る。参加した生徒の
+    集合は (code, None) に入る。ttl_seconds を過ぎたクラスは get() で見つからなくなり
+    （その時に消す）、誰も見ていないクラスも次にクラスを作る時に消す。
+    """
+
+    def __init__(self, shards=16, ttl_seconds=6 * 3600):
+        self.ttl_seconds = ttl_seconds
+        self._rooms_lock = threading.Lock()
+        self._rooms = {}  # code -> Classroom
+        # (ロック, (code, item_id) -> ItemTally, 件数)
+        self._shards = [(threading.Lock(), {}, {"joins": 0, "answers": 0, "duplicates": 0})
+                        for _ in range(shards)]
+
+    def _shard(self, code, item_id):
+        return self._shards[hash((code, item_id)) % len(self._shards)]
+
+    @staticmethod
+    def normalize_code(code):
+        return "".join((code or "").split()).upper()
+
+    # ---------- クラス ----------
+    def create(self, item_ids, teacher_id, now=None):
+        now = time.time() if now is None else now
+        with self._rooms_lock:
+            expired = [room for room in self._rooms.values() if now - room.created_at > self.ttl_seconds]
+            for room in expired:
+                del self._rooms[room.code]
+            while True:
+                code = "".join(secrets.choice(CODE_ALPHABET) for _ in range(CODE_LENGTH))
+                if code not in self._rooms:
+                    break
+            room = self._rooms[code] = Classroom(code, item_ids, teacher_id, now)
+        for old in expired:
+            self._drop(old)
+        for key in (None,) + room.item_ids:
+            lock, tallies, _ = self._shard(code, key)
+            with lock:
+                tallies[(code, key)] = ItemTally()
+        return room
+
+    def get(self, code, now=None):
+        """開いているクラス。コードがないか、ttl_seconds を過ぎていれば None。"""
+        now = time.time() if now is None else now
+        with self._rooms_lock:
+            room = self._rooms.get(self.normalize_code(code))
+            if room is None or now - room.created_at <= self.ttl_seconds:
+                return room
+            del self._rooms[room.code]
+        self._drop(room)
+        return None
+
+    def close(self, code):
+        with self._rooms_lock:
+            room = self._rooms.pop(self.normalize_code(code), None)
+        if room is not None:
+            self._drop(room)
+
+    def _drop(self, room):
+        for key in (None,) + room.item_ids:
+            lock, tallies, _ = self._shard(room.code, key)
+            with lock:
+                tallies.pop((room.code, key), None)
+
+    def rooms(self):
+        with self._rooms_lock:
+            return len(self._rooms)
+
+    # ---------- 生徒 ----------
+    def join(self, code, student_id, now=None):
+        """参加できたら Classroom、コードがないかクラスが終わっていれば None。"""
+        room = self.get(code, now)
+        if room is None:
+            return None
+        lock, tallies, stats = self._shard(room.code, None)
+        with lock:
+            members = tallies.get((room.code, None))
+            if members is not None and student_id not in members.students:
+                members.students.add(student_id)
+                stats["joins"] += 1
+        return room
+
+    def record(self, code, item_id, student_id, choice, correct):
+        """1人の解答を足す。クラスが終わっていたり、同じ生徒の2回目だったりすれば False。"""
+        lock, tallies, stats = self._shard(code, item_id)
+        with lock:
+            tally = tallies.get((code, item_id))
+            if tally is None:
+                return False
+            if student_id in tally.students:
+                stats["duplicates"] += 1
+                return False
+            tally.students.add(student_id)
+            tally.total += 1
+            tally.correct += int(correct)
+            tally.choices[choice] = tally.choices.get(choice, 0) + 1
+            stats["answers"] += 1
+            return True
+
+    # ---------- 先生 ----------
+    def snapshot(self, code, now=None):
+        """{"students": 参加人数, "items": [(item_id, 正解数, 解答数, {読み: 人数})]}。なければ None。"""
+        room = self.get(code, now)
+        if room is None:
+            return None
+        items = []
+        students = 0
+        for key in (None,) + room.item_ids:
+            lock, tallies, _ = self._shard(room.code, key)
+            with lock:
+                tally = tallies.get((room.code, key))
+                if tally is None:
+                    continue
+                if key is None:
+                    students = len(tally.students)
+                else:
+                    items.append((key, tally.correct, tally.total, dict(tally.choices)))
+        return {"students": students, "items": items}
+
+    def stats(self):
+        totals = {"joins": 0, "answers": 0, "duplicates": 0}
+        for lock, _, stats in self._shards:
+            with lock:
+                for key, value in stats.items():
+                    totals[key] += value
+        return totals
@@ -0,0 +1,258 @@
+import functools
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import sys
+import threading
+from array import array
+
+from distractors import DISTRACTOR_VERSION, fill_missing
+from mutations import MUTATION_VERSION, generate as generate_mistakes, source_sentences
+
+# ============================================
+# 学習コンテンツのストア（SQLite）
+# ============================================
+# content/*.jsonl が元データ。そこから読み取り専用のSQLiteを作って使う。
+# 元データかスキーマが変わるとファイル名のバージョンが変わり、作り直される。
+SCHEMA_VERSION = 1
+CONTENT_DIR = os.environ.get("CONTENT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "content"))
+CONTENT_CACHE_DIR = os.environ.get("CONTENT_CACHE_DIR", ".cache")
+SOURCES = ("vocab.jsonl", "mistakes.jsonl")
+
+_SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE vocab (
+    id INTEGER PRIMARY KEY,
+    word TEXT NOT NULL,
+    reading TEXT NOT NULL,
+    meaning_chinese TEXT NOT NULL,
+    example TEXT NOT NULL,
+    wrong_readings TEXT,
+    grade INTEGER NOT NULL
+);
+CREATE TABLE mistakes (
+    id INTEGER PRIMARY KEY,
+    sentence TEXT NOT NULL,
+    mistake TEXT NOT NULL,
+    correct TEXT NOT NULL,
+    explanation TEXT NOT NULL,
+    grade INTEGER NOT NULL
+);
+CREATE TABLE tags (
+    kind TEXT NOT NULL,
+    item_id INTEGER NOT NULL,
+    tag TEXT NOT NULL,
+    PRIMARY KEY (kind, tag, item_id)
+) WITHOUT ROWID;
+CREATE INDEX tags_item ON tags (kind, item_id);
+CREATE INDEX vocab_grade ON vocab (grade, id);
+CREATE INDEX vocab_word ON vocab (word);
+CREATE INDEX vocab_quiz ON vocab (grade, id) WHERE wrong_readings IS NOT NULL;
+CREATE INDEX mistakes_grade ON mistakes (grade, id);
+"""
+
+KINDS = ("vocab", "quiz", "mistakes")
+
+
+def read_jsonl(path):
+    if not os.path.exists(path):
+        return
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def content_version(content_dir=CONTENT_DIR):
+    digest = hashlib.sha256(
+        f"schema={SCHEMA_VERSION} distractors={DISTRACTOR_VERSION} mutations={MUTATION_VERSION}".encode()
+    )
+    for name in SOURCES:
+        path = os.path.join(content_dir, name)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                digest.update(name.encode())
+                digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+# ============================================
+# 元データ → SQLite
+# ============================================
+def build(content_dir=CONTENT_DIR, cache_dir=CONTENT_CACHE_DIR):
+    """必要ならストアを作り、そのパスを返す。同じバージョンがあれば何もしない。"""
+    version = content_version(content_dir)
+    path = os.path.join(cache_dir, f"content-{version}.sqlite3")
+    if os.path.exists(path):
+        return path
+
+    os.makedirs(cache_dir, exist_ok=True)
+    # 他のプロセスと同時に作っても壊れないよう、一時ファイルに書いてから置き換える
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    db = sqlite3.connect(tmp_path)
+    try:
+        db.executescript(_SCHEMA)
+        db.execute("INSERT INTO meta VALUES ('schema_version', ?)", (str(SCHEMA_VERSION),))
+        db.execute("INSERT INTO meta VALUES ('content_version', ?)", (version,))
+        # wrong_readings のない単語は規則で選択肢を作り、そのまま熟語クイズに出せるようにする
+        for item in fill_missing(read_jsonl(os.path.join(content_dir, "vocab.jsonl"))):
+            wrong = item.get("wrong_readings")
+            db.execute(
+                "INSERT INTO vocab VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (item["id"], item["word"], item["reading"], item["meaning_chinese"],
+                 item["example"], json.dumps(wrong, ensure_ascii=False) if wrong else None,
+                 item["grade"]),
+            )
+            db.executemany(
+                "INSERT INTO tags VALUES ('vocab', ?, ?)",
+                [(item["id"], tag) for tag in item.get("tags", [])],
+            )
+        # 手で作った間違い探しに、例文から規則で作った問題（mutations.py）を足す
+        mistakes = list(read_jsonl(os.path.join(content_dir, "mistakes.jsonl")))
+        generated = generate_mistakes(
+            source_sentences(read_jsonl(os.path.join(content_dir, "vocab.jsonl")), mistakes),
+            existing=[item["sentence"] for item in mistakes],
+        )
+        for item in mistakes + list(generated):
+            db.execute(
+                "INSERT INTO mistakes VALUES (?, ?, ?, ?, ?, ?)",
+                (item["id"], item["sentence"], item["mistake"], item["correct"],
+                 item["explanation"], item["grade"]),
+            )
+            db.executemany(
+                "INSERT INTO tags VALUES ('mistakes', ?, ?)",
+                [(item["id"], tag) for tag in item.get("tags", [])],
+            )
+        db.commit()
+    finally:
+        db.close()
+    os.replace(tmp_path, path)
+
+    # 古いバージョンを消す（開いているプロセスはそのまま読み続けられる）
+    for name in os.listdir(cache_dir):
+        if name.startswith("content-") and name.endswith(".sqlite3") and name != os.path.basename(path):
+            os.remove(os.path.join(cache_dir, name))
+    return path
+
+
+# ============================================
+# 読み取り
+# ============================================
+class ContentStore:
+    """ビルド済みストアへの読み取り専用アクセス。プロセスで1つを共有する。
+
+    kind は "vocab"（全単語・フラッシュカード）、"quiz"（間違いの選択肢がある単語）、
+    "mistakes"（間違い探し）のどれか。項目は必要になった時に1件ずつ読む。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._db = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        self.version = self._query_one("SELECT value FROM meta WHERE key = 'content_version'")[0]
+        self.get_vocab = functools.lru_cache(maxsize=2048)(self._load_vocab)
+        self.get_mistake = functools.lru_cache(maxsize=1024)(self._load_mistake)
+        self._counts = {}
+        self._all_ids = {}
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def _query_one(self, sql, params=()):
+        with self._lock:
+            return self._db.execute(sql, params).fetchone()
+
+    @staticmethod
+    def _where(kind, grade, tag):
+        table = "mistakes" if kind == "mistakes" else "vocab"
+        clauses, params = [], []
+        if kind == "quiz":
+            clauses.append("wrong_readings IS NOT NULL")
+        if grade is not None:
+            clauses.append("grade = ?")
+            params.append(grade)
+        if tag is not None:
+            clauses.append(f"id IN (SELECT item_id FROM tags WHERE kind = '{table}' AND tag = ?)")
+            params.append(tag)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        return table, where, params
+
+    def count(self, kind, grade=None, tag=None):
+        key = (kind, grade, tag)
+        if key not in self._counts:
+            table, where, params = self._where(kind, grade, tag)
+            self._counts[key] = self._query_one(f"SELECT COUNT(*) FROM {table}{where}", params)[0]
+        return self._counts[key]
+
+    def ids(self, kind, grade=None, tag=None, offset=0, limit=None):
+        """id をページ単位で返す（limit=None で最後まで）。"""
+        table, where, params = self._where(kind, grade, tag)
+        sql = f"SELECT id FROM {table}{where} ORDER BY id LIMIT ? OFFSET ?"
+        return [row[0] for row in self._query(sql, params + [-1 if limit is None else limit, offset])]
+
+    def all_ids(self, kind, grade=None, tag=None):
+        """条件に合う全ての id（昇順）。出題の位置から id を引くのに使う。条件ごとに1回だけ読む。"""
+        key = (kind, grade, tag)
+        if key not in self._all_ids:
+            self._all_ids[key] = array("q", self.ids(kind, grade, tag))
+        return self._all_ids[key]
+
+    def id_at(self, kind, position, grade=None, tag=None):
+        # LIMIT 1 OFFSET position は毎回 position 行を読み飛ばすので、デッキを順に
+        # たどると O(n²) になる。並んだ id の配列を引く（O(1)）
+        ids = self.all_ids(kind, grade, tag)
+        return ids[position] if 0 <= position < len(ids) else None
+
+    def random_id(self, kind, grade=None, tag=None, rng=random):
+        total = self.count(kind, grade, tag)
+        return self.id_at(kind, rng.randrange(total), grade, tag) if total else None
+
+    def grades(self, kind):
+        table, _, _ = self._where(kind, None, None)
+        return [row[0] for row in self._query(f"SELECT DISTINCT grade FROM {table} ORDER BY grade")]
+
+    def find_word(self, word):
+        row = self._query_one("SELECT id FROM vocab WHERE word = ?", (word,))
+        return self.get_vocab(row[0]) if row else None
+
+    def _tags(self, table, item_id):
+        return [row[0] for row in self._query(
+            "SELECT tag FROM tags WHERE kind = ? AND item_id = ?", (table, item_id)
+        )]
+
+    def _load_vocab(self, item_id):
+        row = self._query_one("SELECT * FROM vocab WHERE id = ?", (item_id,))
+        if row is None:
+            return None
+        item = dict(row)
+        item["wrong_readings"] = json.loads(item["wrong_readings"]) if item["wrong_readings"] else []
+        item["tags"] = self._tags("vocab", item_id)
+        return item
+
+    def _load_mistake(self, item_id):
+        row = self._query_one("SELECT * FROM mistakes WHERE id = ?", (item_id,))
+        if row is None:
+            return None
+        item = dict(row)
+        item["tags"] = self._tags("mistakes", item_id)
+        return item
+
+    def page(self, kind, grade=None, tag=None, offset=0, limit=50):
+        load = self.get_mistake if kind == "mistakes" else self.get_vocab
+        return [load(item_id) for item_id in self.ids(kind, grade, tag, offset, limit)]
+
+
+def open_store(content_dir=CONTENT_DIR, cache_dir=CONTENT_CACHE_DIR):
+    return ContentStore(build(content_dir, cache_dir))
+
+
+if __name__ == "__main__":
+    # デプロイ時のビルド用: python content_store.py
+    store = open_store()
+    print(f"{store.path}: vocab={store.count('vocab')} quiz={store.count('quiz')} "
+          f"mistakes={store.count('mistakes')}", file=sys.stderr)
@@ -0,0 +1,367 @@
+import os
+import sys
+import time
+import zlib
+
+# ============================================
+# 読み方クイズの間違いの選択肢（LLMを使わない）
+# ============================================
+# 生徒が実際にやりがちな間違いを規則で作る:
+#   促音を落とす・大きく書く（がっこう → がこう / がつこう）
+#   拗音を大きく書く・取り違える（べんきょう → べんきよう / べんきゅう）
+#   長音を落とす・付ける（せんせい → せんせ）
+#   濁点・半濁点の付け間違い（てんき → てんぎ）
+#   音読み・訓読みの取り違え（家族 → いえぞく、音楽 → おんらく）
+# 規則や表を変えたら上げる（content_store のストアも作り直される）
+DISTRACTOR_VERSION = 1
+
+# 漢字 音読み|訓読み（訓読みは送り仮名を含めた、生徒が思い浮かべやすい形）
+_KANJI_TABLE = """
+日 にち,じつ|ひ,か
+月 げつ,がつ|つき
+火 か|ひ
+水 すい|みず
+木 もく,ぼく|き
+金 きん,こん|かね
+土 ど,と|つち
+山 さん|やま
+川 せん|かわ
+人 じん,にん|ひと
+大 だい,たい|おお
+小 しょう|ちい,こ
+中 ちゅう|なか
+上 じょう|うえ
+下 か,げ|した
+本 ほん|もと
+年 ねん|とし
+手 しゅ|て
+口 こう,く|くち
+目 もく|め
+耳 じ|みみ
+足 そく|あし
+力 りょく,りき|ちから
+男 だん,なん|おとこ
+女 じょ,にょ|おんな
+子 し,す|こ
+名 めい,みょう|な
+前 ぜん|まえ
+後 ご,こう|あと,うしろ
+外 がい,げ|そと
+国 こく|くに
+語 ご|かたり
+会 かい|あい
+社 しゃ|やしろ
+員 いん|
+話 わ|はなし
+読 どく|よみ
+見 けん|み
+行 こう,ぎょう|いき,ゆき
+来 らい|き
+出 しゅつ|で
+入 にゅう|いり,はい
+休 きゅう|やすみ
+雨 う|あめ
+雪 せつ|ゆき
+風 ふう|かぜ
+空 くう|そら
+海 かい|うみ
+花 か|はな
+犬 けん|いぬ
+円 えん|まる
+白 はく|しろ
+赤 せき|あか
+青 せい|あお
+明 めい|あか
+朝 ちょう|あさ
+昼 ちゅう|ひる
+夜 や|よる
+店 てん|みせ
+駅 えき|
+道 どう|みち
+町 ちょう|まち
+村 そん|むら
+毎 まい|
+週 しゅう|
+曜 よう|
+午 ご|
+今 こん|いま
+何 か|なに
+半 はん|なか
+分 ぶん,ふん|わけ
+字 じ|
+文 ぶん,もん|ふみ
+漢 かん|
+英 えい|
+時 じ|とき
+間 かん,けん|あいだ,ま
+教 きょう|おしえ
+室 しつ|むろ
+勉 べん|
+強 きょう,ごう|つよ
+学 がく|まなび
+校 こう|
+友 ゆう|とも
+達 たつ|たち
+先 せん|さき
+生 せい,しょう|いき,なま
+家 か,け|いえ
+族 ぞく|
+天 てん|あめ
+気 き,け|
+食 しょく|たべ
+事 じ|こと
+音 おん,いん|おと
+楽 がく,らく|たのし
+運 うん|はこ
+動 どう|うごき
+宿 しゅく|やど
+題 だい|
+図 ず,と|
+書 しょ|かき
+館 かん|
+病 びょう|やまい
+院 いん|
+電 でん|
+車 しゃ|くるま
+買 ばい|かい
+物 ぶつ,もつ|もの
+料 りょう|
+理 り|
+映 えい|うつり
+画 が,かく|
+写 しゃ|うつし
+真 しん|ま
+新 しん|あたらし
+聞 ぶん,もん|きき
+野 や|の
+菜 さい|な
+果 か|はて
+質 しつ|
+問 もん|とい
+答 とう|こたえ
+経 けい|へ
+済 さい|すみ
+政 せい|
+治 じ,ち|おさめ
+環 かん|
+境 きょう|さかい
+遊 ゆう|あそび
+使 し|つかい
+作 さく,さ|つくり
+思 し|おもい
+言 げん,ごん|いい
+考 こう|かんがえ
+自 じ,し|みずから
+転 てん|ころび
+"""
+
+
+def _parse_table(text):
+    table = {}
+    for line in text.strip().splitlines():
+        kanji, readings = line.split()
+        on, kun = readings.split("|")
+        table[kanji] = (
+            tuple(r for r in on.split(",") if r),
+            tuple(r for r in kun.split(",") if r),
+        )
+    return table
+
+
+KANJI_READINGS = _parse_table(_KANJI_TABLE)
+
+_VOICED = dict(zip("かきくけこさしすせそたてとはひふへほ", "がぎぐげござじずぜぞだでどばびぶべぼ"))
+_SEMI_VOICED = dict(zip("はひふへほ", "ぱぴぷぺぽ"))
+# 濁点・半濁点を付け間違えた時の候補（ぢ・づは出さない）
+_DAKUTEN = {}
+for _plain, _voiced in _VOICED.items():
+    _DAKUTEN.setdefault(_plain, []).append(_voiced)
+    _DAKUTEN.setdefault(_voiced, []).append(_plain)
+for _plain, _semi in _SEMI_VOICED.items():
+    _DAKUTEN[_plain].append(_semi)
+    _DAKUTEN.setdefault(_semi, []).extend([_plain, _VOICED[_plain]])
+    _DAKUTEN[_VOICED[_plain]].append(_semi)
+
+_SMALL_TO_LARGE = {"ゃ": "や", "ゅ": "ゆ", "ょ": "よ"}
+_O_ROW = set("おこごそぞとどのほぼぽもよろょ")
+_E_ROW = set("えけげせぜてでねへべぺめれ")
+_SOKUON_BEFORE = set("くつちき")  # 促音になりやすい語末（がく → がっ）
+
+# 出す順番（同じ数なら先の規則を優先する）
+RULES = ("sokuon", "youon", "long_vowel", "reading_swap", "dakuten")
+
+
+def _to_hiragana(text):
+    return "".join(chr(ord(c) - 0x60) if "ァ" <= c <= "ヶ" else c for c in text)
+
+
+def _is_hiragana(text):
+    return bool(text) and all("ぁ" <= c <= "ゖ" or c == "ー" for c in text)
+
+
+# ============================================
+# 読みを漢字ごとに分ける
+# ============================================
+def _variants(kanji, first, last):
+    """漢字1字の読みと、連濁・促音化した形。(読み, もとの読み, 音/訓)。"""
+    on, kun = KANJI_READINGS.get(kanji, ((), ()))
+    for kind, readings in (("on", on), ("kun", kun)):
+        for reading in readings:
+            yield reading, reading, kind
+            if not first and reading[0] in _VOICED:
+                yield _VOICED[reading[0]] + reading[1:], reading, kind
+            if not first and reading[0] in _SEMI_VOICED:
+                yield _SEMI_VOICED[reading[0]] + reading[1:], reading, kind
+            if not last and len(reading) > 1 and reading[-1] in _SOKUON_BEFORE:
+                yield reading[:-1] + "っ", reading, kind
+
+
+def segment(word, reading):
+    """読みを1字ずつに分ける。[(字, その部分の読み, もとの読み, "on"/"kun"/"kana")] か None。
+
+    表にない漢字や、熟字訓（果物 → くだもの など）は分けられないので None。
+    """
+    word = _to_hiragana(word)
+
+    def walk(i, pos):
+        if i == len(word):
+            return [] if pos == len(reading) else None
+        char = word[i]
+        if _is_hiragana(char):
+            options = [(char, char, "kana")]
+        else:
+            options = _variants(char, i == 0, i == len(word) - 1)
+        for part, base, kind in options:
+            if reading.startswith(part, pos):
+                rest = walk(i + 1, pos + len(part))
+                if rest is not None:
+                    return [(char, part, base, kind)] + rest
+        return None
+
+    return walk(0, 0)
+
+
+# ============================================
+# 間違いの候補
+# ============================================
+def _kana_candidates(reading):
+    for i, c in enumerate(reading):
+        before, after = reading[:i], reading[i + 1:]
+        if c == "っ":
+            yield before + after, "sokuon"
+            yield before + "つ" + after, "sokuon"
+        if c in _SMALL_TO_LARGE:
+            yield before + _SMALL_TO_LARGE[c] + after, "youon"
+            for other in _SMALL_TO_LARGE:
+                if other != c:
+                    yield before + other + after, "youon"
+        if c == "う" and i and (reading[i - 1] in _O_ROW):
+            yield before + after, "long_vowel"
+        if c == "い" and i and reading[i - 1] in _E_ROW:
+            yield before + after, "long_vowel"
+        if c in ("ょ", "ゅ") and not after.startswith("う"):
+            yield before + c + "う" + after, "long_vowel"
+        for other in _DAKUTEN.get(c, ()):
+            if i or other not in _SEMI_VOICED.values():
+                yield before + other + after, "dakuten"
+
+
+def _segment_candidates(segments):
+    parts = [part for _, part, _, _ in segments]
+    for i, (char, part, base, kind) in enumerate(segments):
+        if kind == "kana":
+            continue
+        # 促音にせずに読む（がっこう → がくこう）
+        if part != base and part.endswith("っ"):
+            yield "".join(parts[:i] + [base] + parts[i + 1:]), "sokuon"
+        on, kun = KANJI_READINGS[char]
+        for other in on + kun:
+            if other != base:
+                yield "".join(parts[:i] + [other] + parts[i + 1:]), "reading_swap"
+
+
+def _compose_candidates(word):
+    # 熟字訓などで分けられない時も、全部音読み・全部訓読みで読んだ形は作れる（果物 → かぶつ）
+    for index in (0, 1):
+        parts = []
+        for char in _to_hiragana(word):
+            if _is_hiragana(char):
+                parts.append(char)
+            elif char in KANJI_READINGS:
+                readings = KANJI_READINGS[char][index] or KANJI_READINGS[char][1 - index]
+                parts.append(readings[0])
+            else:
+                break
+        else:
+            yield "".join(parts), "reading_swap"
+
+
+def candidates(word, reading):
+    """規則名 -> 間違いの読みのリスト。同じ読みは1回だけ、長すぎる読みは入れない。"""
+    reading = _to_hiragana(reading)
+    segments = segment(word, reading)
+    found = {rule: [] for rule in RULES}
+    seen = {reading}
+    generated = list(_kana_candidates(reading))
+    if segments:
+        generated += list(_segment_candidates(segments))
+    generated += list(_compose_candidates(word))
+    for text, rule in generated:
+        if text not in seen and 2 <= len(text) <= len(reading) + 2 and _is_hiragana(text):
+            seen.add(text)
+            found[rule].append(text)
+    return found
+
+
+def make_distractors(word, reading, n=3, exclude=()):
+    """word/reading に対する間違いの読みを n 個まで返す。
+
+    規則が偏らないよう、規則ごとに1つずつ順に取る。同じ単語なら毎回同じ結果になる。
+    """
+    found = candidates(word, reading)
+    # 規則の中の順番は単語ごとに決まった並びにする（全部が先頭の字の間違いにならないように）
+    seed = zlib.crc32(f"{word}/{reading}".encode())
+    for options in found.values():
+        if len(options) > 1:
+            shift = seed % len(options)
+            options[:] = options[shift:] + options[:shift]
+    excluded = set(exclude)
+    result = []
+    while len(result) < n and any(found.values()):
+        for rule in RULES:
+            options = found[rule]
+            while options and options[0] in excluded:
+                options.pop(0)
+            if options and len(result) < n:
+                choice = options.pop(0)
+                excluded.add(choice)
+                result.append(choice)
+    return result
+
+
+def fill_missing(items, n=3):
+    """wrong_readings のない単語に間違いの読みを入れる（コーパス全体をまとめて処理する用）。"""
+    for item in items:
+        if not item.get("wrong_readings"):
+            wrong = make_distractors(item["word"], item["reading"], n)
+            if len(wrong) == n:
+                item = dict(item, wrong_readings=wrong)
+        yield item
+
+
+if __name__ == "__main__":
+    # コーパス全体で作ってみて、手で作った選択肢との重なりと速さを見る:
+    #   python distractors.py [content/vocab.jsonl]
+    from content_store import CONTENT_DIR, read_jsonl
+
+    path = sys.argv[1] if len(sys.argv) > 1 else os.path.join(CONTENT_DIR, "vocab.jsonl")
+    items = list(read_jsonl(path))
+    start = time.perf_counter()
+    generated = [make_distractors(item["word"], item["reading"]) for item in items]
+    elapsed = time.perf_counter() - start
+    overlap = 0
+    for item, wrong in zip(items, generated):
+        overlap += len(set(wrong) & set(item.get("wrong_readings") or ()))
+        print(f"{item['word']}\t{item['reading']}\t{'、'.join(wrong)}\t({'、'.join(item.get('wrong_readings') or [])})")
+    print(f"{len(items)} items, {elapsed / max(1, len(items)) * 1e6:.1f} us/item, "
+          f"{overlap} of the hand-written distractors reproduced", file=sys.stderr)
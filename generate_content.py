@@ -0,0 +1,292 @@
+"""AI問題生成と同じプロンプト・難易度で、熟語クイズと間違い探しの問題をまとめて作るコマンド。
+
+asyncio で同時に concurrency 本まで chat completions を呼び、形をチェックして重複
+（熟語クイズは word、間違い探しは sentence）を除いた問題だけを content/*.jsonl に
+1行ずつ追記する。途中で止めても、もう一度同じコマンドを実行すれば続きから作る
+（出力ファイルにある "generated" の問題を数え直す）。トークン数などの累計は
+<出力>.checkpoint.json に残る。
+
+    python generate_content.py quiz --count 2000 --concurrency 8
+    python generate_content.py mistakes --count 500 --levels かんたん ふつう
+    # ローカルのスタブに向ける
+    python loadtest/stub_server.py --port 8790 --mean 0.2 &
+    GROQ_BASE_URL=http://127.0.0.1:8790 GROQ_API_KEY=stub python generate_content.py quiz --count 200
+
+content/*.jsonl が変わるので、次にアプリを起動した時にストアが作り直される。
+"""
+import argparse
+import asyncio
+import functools
+import json
+import os
+import sys
+import time
+from collections import deque
+
+from groq import APIError, AsyncGroq
+
+from content_store import CONTENT_DIR, read_jsonl
+from quiz_gen import (
+    LEVEL_GRADES, QUIZ_LEVEL_DESC, QuizGenerator,
+    MISTAKE_BATCH, QUIZ_BATCH, mistake_batch_request, quiz_batch_request, validate_mistake, validate_quiz,
+)
+
+# app.py の LLM_MODEL と同じもの
+DEFAULT_MODEL = os.environ.get("LLM_MODEL", "llama-3.3-70b-versatile")
+GENERATED_TAG = "generated"
+GRADE_LEVELS = {grade: level for level, grade in LEVEL_GRADES.items()}
+
+
+def vocab_item(item_id, level, quiz):
+    return {
+        "id": item_id,
+        "word": quiz["word"],
+        "reading": quiz["correct_reading"],
+        "meaning_chinese": quiz["meaning_chinese"],
+        "example": quiz["example"],
+        "wrong_readings": quiz["wrong_readings"],
+        "grade": LEVEL_GRADES[level],
+        "tags": [GENERATED_TAG],
+    }
+
+
+def mistake_item(item_id, level, mistake):
+    return {
+        "id": item_id,
+        "sentence": mistake["sentence"],
+        "mistake": mistake["mistake"],
+        "correct": mistake["correct"],
+        "explanation": mistake["explanation"],
+        "grade": LEVEL_GRADES[level],
+        "tags": mistake["tags"] + [GENERATED_TAG],
+    }
+
+
+# 種類ごとの設定
+KINDS = {
+    "quiz": dict(
+        source="vocab.jsonl", build=quiz_batch_request, template=QUIZ_BATCH, validate=validate_quiz,
+        container="quizzes", key="word", to_item=vocab_item,
+    ),
+    "mistakes": dict(
+        source="mistakes.jsonl", build=mistake_batch_request, template=MISTAKE_BATCH, validate=validate_mistake,
+        container="mistakes", key="sentence", to_item=mistake_item,
+    ),
+}
+
+
+# ============================================
+# 出力ファイル（追記のみ）とチェックポイント
+# ============================================
+def repair_tail(path):
+    """中断で途中まで書かれた最後の行を切り落とす。"""
+    if not os.path.exists(path):
+        return
+    with open(path, "rb+") as f:
+        data = f.read()
+        if data and not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+
+
+def load_checkpoint(path):
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    return {"runs": 0, "calls": 0, "tokens": 0, "items": 0, "seconds": 0.0}
+
+
+def save_checkpoint(path, checkpoint):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+class Run:
+    """1回の実行の状態。イベントループの中だけで触るのでロックはいらない。"""
+
+    def __init__(self, kind, out_path, levels, count, batch_size, avoid_limit):
+        self.config = KINDS[kind]
+        self.key = self.config["key"]
+        self.out_path = out_path
+        self.levels = levels
+        self.batch_size = batch_size
+        self.seen = set()
+        self.recent = {level: deque(maxlen=avoid_limit) for level in levels}
+        self.done = {level: 0 for level in levels}
+        self.reserved = {level: 0 for level in levels}
+        self.next_id = 1
+        self.written = 0
+
+        # 元のコンテンツと、前回までに書いた分を読んで重複・番号・進み具合を復元する
+        source = os.path.join(CONTENT_DIR, self.config["source"])
+        repair_tail(out_path)
+        for path in {os.path.abspath(source), os.path.abspath(out_path)}:
+            for item in read_jsonl(path):
+                self.seen.add(item[self.key])
+                self.next_id = max(self.next_id, item["id"] + 1)
+                level = GRADE_LEVELS.get(item.get("grade"))
+                if path == os.path.abspath(out_path) and GENERATED_TAG in item.get("tags", ()) and level in self.done:
+                    self.done[level] += 1
+                    self.recent[level].append(item[self.key])
+        # 難易度ごとに同じ数ずつ作る
+        self.quota = {level: count // len(levels) + (1 if i < count % len(levels) else 0)
+                      for i, level in enumerate(levels)}
+        os.makedirs(os.path.dirname(os.path.abspath(out_path)), exist_ok=True)
+        self._out = open(out_path, "a", encoding="utf-8")
+
+    def remaining(self, level):
+        return self.quota[level] - self.done[level] - self.reserved[level]
+
+    def reserve(self):
+        """一番残りの多い難易度から batch_size 分を取る。もう何もなければ None。"""
+        level = max(self.levels, key=self.remaining)
+        count = min(self.batch_size, self.remaining(level))
+        if count <= 0:
+            return None, 0
+        self.reserved[level] += count
+        return level, count
+
+    def write(self, level, count, items):
+        self.reserved[level] -= count
+        for item in items[:self.quota[level] - self.done[level]]:
+            row = self.config["to_item"](self.next_id, level, item)
+            self._out.write(json.dumps(row, ensure_ascii=False) + "\n")
+            self.next_id += 1
+            self.done[level] += 1
+            self.written += 1
+            self.recent[level].append(item[self.key])
+        self._out.flush()
+
+    def close(self):
+        self._out.flush()
+        os.fsync(self._out.fileno())
+        self._out.close()
+
+
+# ============================================
+# 生成
+# ============================================
+async def worker(run, generator, args, state):
+    while not state["stop"]:
+        level, count = run.reserve()
+        if level is None:
+            return
+        try:
+            items = await generator.agenerate(level, count, list(run.recent[level]), run.seen)
+        except APIError as e:
+            print(f"API error ({level}): {e}", file=sys.stderr)
+            items = []
+        run.write(level, count, items)
+        if items:
+            state["failures"] = 0
+        else:
+            # 何も作れない時は少し待つ。続くようならあきらめる
+            state["failures"] += 1
+            if state["failures"] >= args.max_failures:
+                state["stop"] = True
+                print("too many empty batches; stopping", file=sys.stderr)
+            await asyncio.sleep(min(30.0, 2 ** state["failures"]))
+
+
+async def report_progress(run, start, total):
+    while True:
+        await asyncio.sleep(5)
+        elapsed = time.perf_counter() - start
+        done = sum(run.done.values())
+        print(f"{done}/{total} ({run.written / elapsed:.1f} items/s)", file=sys.stderr, flush=True)
+
+
+async def generate(args):
+    config = KINDS[args.kind]
+    out_path = args.out or os.path.join(CONTENT_DIR, config["source"])
+    checkpoint_path = f"{out_path}.checkpoint.json"
+    checkpoint = load_checkpoint(checkpoint_path)
+    run = Run(args.kind, out_path, args.levels, args.count, args.batch_size, args.avoid_limit)
+
+    client = AsyncGroq(
+        api_key=args.api_key or os.environ.get("GROQ_API_KEY"),
+        base_url=args.base_url,
+        max_retries=args.max_retries,
+    )
+    generator = QuizGenerator(
+        client,
+        functools.partial(config["build"], args.model),
+        json_mode=not args.no_json_mode,
+        max_retries=args.repair_retries,
+        validate=config["validate"],
+        container=config["container"],
+        key=config["key"],
+        label=f"bulk_{args.kind}",
+        template=config["template"],
+    )
+    state = {"stop": False, "failures": 0}
+    start = time.perf_counter()
+    progress = asyncio.create_task(report_progress(run, start, args.count))
+    try:
+        await asyncio.gather(*(worker(run, generator, args, state) for _ in range(args.concurrency)))
+    finally:
+        progress.cancel()
+        run.close()
+        await client.close()
+        elapsed = time.perf_counter() - start
+        stats = generator.stats()
+        checkpoint["runs"] += 1
+        checkpoint["calls"] += stats["calls"]
+        checkpoint["tokens"] += stats["tokens"]
+        checkpoint["items"] += run.written
+        checkpoint["seconds"] += elapsed
+        save_checkpoint(checkpoint_path, checkpoint)
+
+    return {
+        "kind": args.kind,
+        "out": out_path,
+        "target": args.count,
+        "total": sum(run.done.values()),
+        "by_level": run.done,
+        "written": run.written,
+        "seconds": round(elapsed, 2),
+        "items_per_sec": round(run.written / elapsed, 2) if elapsed else 0.0,
+        "tokens_per_item": round(stats["tokens"] / run.written, 1) if run.written else None,
+        "parse_failure_rate": round(stats["parse_failure_rate"], 4),
+        "retry_rate": round(stats["retry_rate"], 4),
+        "invalid_item_rate": round(stats["invalid_item_rate"], 4),
+        "duplicates": stats["duplicates"],
+        "cumulative": {
+            **checkpoint,
+            "tokens_per_item": round(checkpoint["tokens"] / checkpoint["items"], 1) if checkpoint["items"] else None,
+        },
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("kind", choices=list(KINDS))
+    parser.add_argument("--count", type=int, required=True, help="出力ファイルに入れる生成問題の合計")
+    parser.add_argument("--levels", nargs="+", default=list(QUIZ_LEVEL_DESC), choices=list(QUIZ_LEVEL_DESC))
+    parser.add_argument("--concurrency", type=int, default=8, help="同時に投げるリクエストの上限")
+    parser.add_argument("--batch-size", type=int, default=10, help="1回のリクエストで頼む問題数")
+    parser.add_argument("--avoid-limit", type=int, default=50, help="プロンプトに書く「使わない語」の数")
+    parser.add_argument("--repair-retries", type=int, default=2, help="壊れた分を頼み直す回数")
+    parser.add_argument("--max-retries", type=int, default=4, help="429/5xx の時のSDKの再試行回数")
+    parser.add_argument("--max-failures", type=int, default=8, help="続けて空振りしたらやめる回数")
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--base-url", help="省略時は GROQ_BASE_URL（なければ本物のAPI）")
+    parser.add_argument("--api-key", help="省略時は GROQ_API_KEY")
+    parser.add_argument("--no-json-mode", action="store_true")
+    parser.add_argument("--out", help="省略時は content/vocab.jsonl か content/mistakes.jsonl")
+    args = parser.parse_args(argv)
+    if not (args.api_key or os.environ.get("GROQ_API_KEY")):
+        parser.error("GROQ_API_KEY を設定するか --api-key を指定してください")
+
+    try:
+        report = asyncio.run(generate(args))
+    except KeyboardInterrupt:
+        print("interrupted; run the same command again to resume", file=sys.stderr)
+        return 130
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,248 @@
+import hashlib
+import mmap
+import os
+import re
+import struct
+import sys
+from bisect import bisect_left
+
+from content_store import CONTENT_DIR, CONTENT_CACHE_DIR, read_jsonl
+
+# ============================================
+# AIチューター用のローカル辞書（mmapで読むソート済み配列）
+# ============================================
+# content/vocab.jsonl と content/dictionary/ の辞書データから1つのファイルを作る。
+# ファイルはOSのページキャッシュに載るので、複数のワーカープロセスで共有され、
+# 開くのはヘッダーを読むだけ（ミリ秒以下）。元データが変わるとバージョンが変わり作り直す。
+#
+# content/dictionary/ には次のどちらかの形式で置く（1行1語）:
+#   *.tsv   : 単語<TAB>読み<TAB>中国語の意味[<TAB>例文]
+#   *.jsonl : {"word": ..., "reading": ..., "meaning_chinese": ..., "example": ...}
+# 同じ単語が複数あれば content/vocab.jsonl → ファイル名順 の先のものを使う。
+#
+# ファイルの形式（リトルエンディアン）:
+#   ヘッダー      MAGIC, 件数 n, 読みの索引の位置, レコードの位置
+#   オフセット    uint32 × (n + 1)  単語順のレコードの開始位置（レコード領域の先頭から）
+#   読みの索引    uint32 × n        読みの順に並べたレコード番号
+#   レコード      単語 \x1f 読み \x1f 中国語の意味 \x1f 例文（UTF-8、単語のバイト順）
+LEXICON_VERSION = 1
+MAGIC = b"LEX1"
+_HEADER = struct.Struct("<4sIIII")
+_SEP = b"\x1f"
+FIELDS = ("word", "reading", "meaning_chinese", "example")
+DICTIONARY_DIR = os.path.join(CONTENT_DIR, "dictionary")
+# 文章から単語を切り出す時に辞書と照らす最長の長さ（文字）
+MAX_WORD_CHARS = 8
+_KANJI_RUN = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff々〆ヵヶ]+")
+
+
+def _dictionary_files(dictionary_dir):
+    if not os.path.isdir(dictionary_dir):
+        return []
+    return sorted(
+        os.path.join(dictionary_dir, name) for name in os.listdir(dictionary_dir)
+        if name.endswith((".tsv", ".jsonl"))
+    )
+
+
+def _read_tsv(path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            parts = line.rstrip("\r\n").split("\t")
+            if len(parts) >= 3 and not line.startswith("#"):
+                yield dict(zip(FIELDS, parts))
+
+
+def _clean(value):
+    return " ".join(str(value or "").replace("\x1f", " ").split())
+
+
+def read_entries(content_dir=CONTENT_DIR, dictionary_dir=None):
+    """(単語, 読み, 意味, 例文) を優先順に返す。"""
+    dictionary_dir = dictionary_dir or os.path.join(content_dir, "dictionary")
+    sources = [read_jsonl(os.path.join(content_dir, "vocab.jsonl"))]
+    for path in _dictionary_files(dictionary_dir):
+        sources.append(_read_tsv(path) if path.endswith(".tsv") else read_jsonl(path))
+    for source in sources:
+        for item in source:
+            entry = tuple(_clean(item.get(field)) for field in FIELDS)
+            if entry[0] and entry[1] and entry[2]:
+                yield entry
+
+
+def lexicon_version(content_dir=CONTENT_DIR, dictionary_dir=None):
+    # 大きさと更新時刻ではなく中身で決める（チェックアウトやコピーで時刻が変わっても
+    # 作り直さず、同じ大きさで中身だけ変わった時は作り直す）。辞書は大きいので少しずつ読む
+    dictionary_dir = dictionary_dir or os.path.join(content_dir, "dictionary")
+    digest = hashlib.sha256(f"lexicon={LEXICON_VERSION}".encode())
+    for path in [os.path.join(content_dir, "vocab.jsonl")] + _dictionary_files(dictionary_dir):
+        if os.path.exists(path):
+            digest.update(f"{os.path.basename(path)}:{os.path.getsize(path)}:".encode())
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+# ============================================
+# 元データ → 索引ファイル
+# ============================================
+def build(content_dir=CONTENT_DIR, cache_dir=CONTENT_CACHE_DIR, dictionary_dir=None):
+    """必要なら索引を作り、そのパスを返す。同じバージョンがあれば何もしない。"""
+    version = lexicon_version(content_dir, dictionary_dir)
+    path = os.path.join(cache_dir, f"lexicon-{version}.idx")
+    if os.path.exists(path):
+        return path
+
+    entries = {}
+    for entry in read_entries(content_dir, dictionary_dir):
+        entries.setdefault(entry[0].encode(), entry)
+    words = sorted(entries)
+    records, offsets, position = [], [], 0
+    for word in words:
+        record = _SEP.join(field.encode() for field in entries[word])
+        offsets.append(position)
+        records.append(record)
+        position += len(record)
+    offsets.append(position)
+    by_reading = sorted(range(len(words)), key=lambda i: (entries[words[i]][1].encode(), words[i]))
+
+    count = len(words)
+    reading_at = _HEADER.size + 4 * (count + 1)
+    records_at = reading_at + 4 * count
+    os.makedirs(cache_dir, exist_ok=True)
+    # 他のプロセスと同時に作っても壊れないよう、一時ファイルに書いてから置き換える
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, count, reading_at, records_at, 0))
+        f.write(struct.pack(f"<{count + 1}I", *offsets))
+        f.write(struct.pack(f"<{count}I", *by_reading))
+        for record in records:
+            f.write(record)
+    os.replace(tmp_path, path)
+
+    for name in os.listdir(cache_dir):
+        if name.startswith("lexicon-") and name.endswith(".idx") and name != os.path.basename(path):
+            os.remove(os.path.join(cache_dir, name))
+    return path
+
+
+# ============================================
+# 読み取り
+# ============================================
+def _hiragana(text):
+    return "".join(chr(ord(c) - 0x60) if "ァ" <= c <= "ヶ" else c for c in text)
+
+
+class Lexicon:
+    """mmap した索引で単語・読みを引く。検索は二分探索なので O(log n)。"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, reading_at, records_at, _ = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a lexicon index")
+        view = memoryview(self._mm)
+        self._offsets = view[_HEADER.size:reading_at].cast("I")
+        self._by_reading = view[reading_at:records_at].cast("I")
+        self._records_at = records_at
+
+    def __len__(self):
+        return self.count
+
+    def _record(self, index):
+        start = self._records_at + self._offsets[index]
+        return self._mm[start:self._records_at + self._offsets[index + 1]]
+
+    def _word(self, index):
+        record = self._record(index)
+        end = record.find(_SEP)
+        return record[:end]
+
+    def _reading(self, index):
+        return self._record(index).split(_SEP, 2)[1]
+
+    def entry(self, index):
+        return dict(zip(FIELDS, (field.decode() for field in self._record(index).split(_SEP))))
+
+    def _reading_key(self, position):
+        return self._reading(self._by_reading[position])
+
+    def _find_word(self, word):
+        key = word.encode()
+        index = bisect_left(range(self.count), key, key=self._word)
+        if index < self.count and self._word(index) == key:
+            return index
+        return None
+
+    def lookup(self, query):
+        """単語がちょうど一致する項目。なければ読みが一致する最初の項目。どちらもなければ None。"""
+        index = self._find_word(query)
+        if index is not None:
+            return self.entry(index)
+        key = _hiragana(query).encode()
+        position = bisect_left(range(self.count), key, key=self._reading_key)
+        if position < self.count and self._reading_key(position) == key:
+            return self.entry(self._by_reading[position])
+        return None
+
+    def suggest(self, prefix, limit=8):
+        """prefix で始まる単語（なければ読み）の候補。"""
+        if not prefix:
+            return []
+        results = []
+        key = prefix.encode()
+        index = bisect_left(range(self.count), key, key=self._word)
+        while index < self.count and len(results) < limit:
+            word = self._word(index)
+            if not word.startswith(key):
+                break
+            results.append(word.decode())
+            index += 1
+        key = _hiragana(prefix).encode()
+        position = bisect_left(range(self.count), key, key=self._reading_key)
+        while position < self.count and len(results) < limit:
+            if not self._reading_key(position).startswith(key):
+                break
+            word = self._word(self._by_reading[position]).decode()
+            if word not in results:
+                results.append(word)
+            position += 1
+        return results
+
+    def segment(self, text, limit=None):
+        """文章や単語の並びから漢字の単語を出てきた順に重複なしで切り出す。
+
+        漢字の続くところごとに、辞書にある2文字以上の単語を左から最長一致で取る。
+        辞書にない部分はまとめて1語にする（LLMに聞く）。
+        """
+        words = []
+        for run in _KANJI_RUN.findall(text):
+            unknown_from, i = 0, 0
+            while i < len(run):
+                for end in range(min(len(run), i + MAX_WORD_CHARS), i + 1, -1):
+                    if self._find_word(run[i:end]) is not None:
+                        break
+                else:
+                    i += 1
+                    continue
+                if unknown_from < i:
+                    words.append(run[unknown_from:i])
+                words.append(run[i:end])
+                unknown_from = i = end
+            if unknown_from < len(run):
+                words.append(run[unknown_from:])
+        words = list(dict.fromkeys(words))
+        return words if limit is None else words[:limit]
+
+
+def open_lexicon(content_dir=CONTENT_DIR, cache_dir=CONTENT_CACHE_DIR):
+    return Lexicon(build(content_dir, cache_dir))
+
+
+if __name__ == "__main__":
+    # デプロイ時のビルド用: python lexicon.py
+    lexicon = open_lexicon()
+    print(f"{lexicon.path}: {len(lexicon)} entries, {os.path.getsize(lexicon.path)} bytes", file=sys.stderr)
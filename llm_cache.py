@@ -0,0 +1,204 @@
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+
+# ============================================
+# キーの正規化
+# ============================================
+def normalize_query(text):
+    # 全角/半角・前後の空白・連続スペースの違いで別キーにならないようにする
+    text = unicodedata.normalize("NFKC", text or "")
+    return " ".join(text.split())
+
+
+class _Flight:
+    __slots__ = ("event", "value", "error", "abandoned")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+        # 計算していたスレッドが再実行・停止などで止まった（待っていた側がやり直す）
+        self.abandoned = False
+
+
+# ============================================
+# LLM応答キャッシュ（メモリLRU + SQLite）
+# ============================================
+class ResponseCache:
+    """プロセス内で共有するLLM応答キャッシュ。
+
+    1段目はメモリ上のLRU、2段目は再起動後も残るSQLite（db_path指定時のみ）。
+    どちらもTTLと件数上限で古いものから捨てる。同じキーの同時リクエストは
+    1回の計算にまとめる（single-flight）。待つのは wait_timeout 秒までで、
+    それを過ぎたら待っていた側も自分で計算する。
+    """
+
+    def __init__(self, max_entries=2048, ttl_seconds=7 * 24 * 3600,
+                 db_path=None, max_disk_entries=100_000, wait_timeout=60.0):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_disk_entries = max_disk_entries
+        self.wait_timeout = wait_timeout
+        self._memory = OrderedDict()  # key -> (value, created_at)
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._db = None
+        self._db_lock = threading.Lock()
+        self._disk_writes = 0
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "coalesced": 0, "wait_timeouts": 0, "retries": 0}
+        if db_path:
+            self._open_db(db_path)
+
+    @staticmethod
+    def make_key(text, version):
+        return f"v{version}:{normalize_query(text)}"
+
+    # ---------- ディスク層 ----------
+    def _open_db(self, db_path):
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL,"
+            " created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)"
+        )
+        self._db.execute(
+            "DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl_seconds,)
+        )
+        self._db.commit()
+
+    def _disk_get(self, key, now):
+        if self._db is None:
+            return None
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl_seconds:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._db.commit()
+                return None
+            self._db.execute(
+                "UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+            self._db.commit()
+        return row
+
+    def _disk_set(self, key, value, now):
+        if self._db is None:
+            return
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            self._disk_writes += 1
+            # 毎回数えると重いので、ある程度書き込んだら上限チェック
+            if self._disk_writes % 100 == 0:
+                self._db.execute(
+                    "DELETE FROM responses WHERE key IN ("
+                    " SELECT key FROM responses ORDER BY accessed_at DESC"
+                    " LIMIT -1 OFFSET ?)",
+                    (self.max_disk_entries,),
+                )
+            self._db.commit()
+
+    # ---------- メモリ層 ----------
+    def _memory_put(self, key, value, created_at):
+        self._memory[key] = (value, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if now - entry[1] <= self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return entry[0]
+                del self._memory[key]
+        row = self._disk_get(key, now)
+        if row is None:
+            return None
+        with self._lock:
+            self._memory_put(key, row[0], row[1])
+            self.stats["disk_hits"] += 1
+        return row[0]
+
+    def set(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._memory_put(key, value, now)
+        self._disk_set(key, value, now)
+
+    def get_or_compute(self, key, compute):
+        """(値, キャッシュから取れたか) を返す。同じキーの計算は同時に1回だけ。"""
+        while True:
+            value = self.get(key)
+            if value is not None:
+                return value, True
+
+            with self._lock:
+                # get() の後に別スレッドが計算を終えていた場合
+                entry = self._memory.get(key)
+                if entry is not None and time.time() - entry[1] <= self.ttl_seconds:
+                    return entry[0], True
+                flight = self._flights.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self._flights[key] = _Flight()
+                else:
+                    self.stats["coalesced"] += 1
+
+            if leader:
+                return self._lead(key, flight, compute)
+            if not flight.event.wait(self.wait_timeout):
+                # 先に計算している側が返ってこない。待つのをやめて自分で計算する
+                with self._lock:
+                    self.stats["wait_timeouts"] += 1
+                    self.stats["misses"] += 1
+                value = compute()
+                self.set(key, value)
+                return value, False
+            if flight.error is not None:
+                raise flight.error
+            if not flight.abandoned:
+                return flight.value, True
+            # 計算していた側が途中で止まった。最初からやり直す（誰かが新しく計算する）
+            with self._lock:
+                self.stats["retries"] += 1
+
+    def _lead(self, key, flight, compute):
+        try:
+            with self._lock:
+                self.stats["misses"] += 1
+            flight.value = compute()
+            self.set(key, flight.value)
+            return flight.value, False
+        except Exception as e:
+            flight.error = e
+            raise
+        except BaseException:
+            # Streamlit の再実行・停止（StopException など）は待っている側のエラーではない
+            flight.abandoned = True
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.event.set()
@@ -0,0 +1,241 @@
+import logging
+import random
+import re
+import threading
+import time
+import types
+from collections import OrderedDict, deque
+
+import groq
+
+import metrics
+
+logger = logging.getLogger("llm")
+
+# 待てば通る可能性があるエラー
+RETRYABLE_ERRORS = (
+    groq.RateLimitError,
+    groq.InternalServerError,
+    groq.APIConnectionError,
+)
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+
+
+def parse_reset(value):
+    """"2m59.56s" / "7.66s" / "120ms" のようなリセット時間を秒にする。"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    seconds = 0.0
+    for number, unit in _DURATION_PART.findall(value):
+        seconds += float(number) * {"ms": 0.001, "s": 1, "m": 60, "h": 3600}[unit]
+    return seconds
+
+
+def estimate_tokens(kwargs):
+    # だいたいの見積もり（日本語はほぼ1文字1トークン）。正確な値はヘッダーで上書きされる。
+    # max_tokens は実測から決めた値（prompts.py）なので、そのまま出力の見積もりに使う
+    prompt_chars = sum(len(m.get("content") or "") for m in kwargs.get("messages", []))
+    return prompt_chars + kwargs.get("max_tokens", 256)
+
+
+# ============================================
+# レート制限を意識したリクエストスケジューラ
+# ============================================
+class RequestScheduler:
+    """同時実行数を抑え、セッションごとに順番を回してLLMリクエストを通す。
+
+    プロバイダのレスポンスヘッダー（x-ratelimit-*）から残りのリクエスト数・
+    トークン数を追い、使い切ったらリセットまで全体を待たせる。
+    429/5xx/接続エラーはジッター付きの指数バックオフで再試行する。
+    """
+
+    def __init__(self, max_concurrency=4, max_retries=4, base_delay=0.5, max_delay=8.0):
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._cond = threading.Condition()
+        self._active = 0
+        # session_id -> 待っているチケット。並び順がラウンドロビンの順番
+        self._queues = OrderedDict()
+        self.remaining_requests = None
+        self.remaining_tokens = None
+        self._requests_reset_at = 0.0
+        self._tokens_reset_at = 0.0
+        self._paused_until = 0.0
+        self.stats = {"requests": 0, "retries": 0, "rate_limited": 0, "failed": 0}
+
+    # ---------- 順番待ち ----------
+    def _head(self):
+        for queue in self._queues.values():
+            return queue[0]
+        return None
+
+    def _budget_wait(self, estimate, now):
+        # リセット時刻を過ぎた分は、次のヘッダーが来るまで「わからない」に戻す
+        if self.remaining_requests is not None and now >= self._requests_reset_at:
+            self.remaining_requests = None
+        if self.remaining_tokens is not None and now >= self._tokens_reset_at:
+            self.remaining_tokens = None
+        waits = [self._paused_until - now]
+        if self.remaining_requests is not None and self.remaining_requests <= 0:
+            waits.append(self._requests_reset_at - now)
+        if self.remaining_tokens is not None and self.remaining_tokens < estimate:
+            waits.append(self._tokens_reset_at - now)
+        return max(waits)
+
+    def acquire(self, session_id, estimate=0):
+        start = time.perf_counter()
+        ticket = object()
+        with self._cond:
+            self._queues.setdefault(session_id, deque()).append(ticket)
+            while True:
+                if self._active < self.max_concurrency and self._head() is ticket:
+                    wait = self._budget_wait(estimate, time.monotonic())
+                    if wait <= 0:
+                        break
+                    self._cond.wait(timeout=wait)
+                else:
+                    self._cond.wait()
+            queue = self._queues.pop(session_id)
+            queue.popleft()
+            if queue:
+                # 同じセッションの次のリクエストは列の最後に回す
+                self._queues[session_id] = queue
+            self._active += 1
+            if self.remaining_requests is not None:
+                self.remaining_requests -= 1
+            if self.remaining_tokens is not None:
+                self.remaining_tokens -= estimate
+            self._cond.notify_all()
+        metrics.LLM_QUEUE_SECONDS.observe(time.perf_counter() - start)
+
+    def load(self):
+        """実行中と順番待ちのリクエスト数。"""
+        with self._cond:
+            return {"active": self._active, "queued": sum(len(q) for q in self._queues.values())}
+
+    def release(self):
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+    # ---------- レート制限の追跡 ----------
+    def observe(self, headers):
+        if headers is None:
+            return
+        now = time.monotonic()
+        with self._cond:
+            remaining = headers.get("x-ratelimit-remaining-requests")
+            if remaining is not None:
+                self.remaining_requests = int(float(remaining))
+                self._requests_reset_at = now + (parse_reset(headers.get("x-ratelimit-reset-requests")) or 0)
+            remaining = headers.get("x-ratelimit-remaining-tokens")
+            if remaining is not None:
+                self.remaining_tokens = int(float(remaining))
+                self._tokens_reset_at = now + (parse_reset(headers.get("x-ratelimit-reset-tokens")) or 0)
+            retry_after = parse_reset(headers.get("retry-after"))
+            if retry_after:
+                self._paused_until = max(self._paused_until, now + retry_after)
+            self._cond.notify_all()
+
+    def _backoff(self, attempt):
+        # full jitter
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    # ---------- 実行 ----------
+    def run(self, session_id, call, estimate=0, stream=False):
+        """call() は with_raw_response の応答を返す関数。parse() した結果を返す。
+
+        stream=True の時は実行枠を返さずに持ったままにし、ストリームを
+        読み終わる（または close() される）まで同時実行数に数える。
+        """
+        for attempt in range(self.max_retries + 1):
+            self.acquire(session_id, estimate)
+            try:
+                raw = call()
+            except RETRYABLE_ERRORS as e:
+                self.release()
+                response = getattr(e, "response", None)
+                self.observe(response.headers if response is not None else None)
+                with self._cond:
+                    if isinstance(e, groq.RateLimitError):
+                        self.stats["rate_limited"] += 1
+                    if attempt == self.max_retries:
+                        self.stats["failed"] += 1
+                        raise
+                    self.stats["retries"] += 1
+                delay = self._backoff(attempt)
+                logger.warning("retrying after %s (attempt %d, %.2fs)", type(e).__name__, attempt + 1, delay)
+                time.sleep(delay)
+                continue
+            except Exception:
+                self.release()
+                with self._cond:
+                    self.stats["failed"] += 1
+                raise
+
+            self.observe(raw.headers)
+            with self._cond:
+                self.stats["requests"] += 1
+            try:
+                result = raw.parse()
+            except Exception:
+                self.release()
+                raise
+            if stream:
+                return _ScheduledStream(result, self.release)
+            self.release()
+            return result
+
+
+class _ScheduledStream:
+    # 読み終わるか close() された時に実行枠を返すストリーム
+    def __init__(self, stream, release):
+        self._stream = stream
+        self._release = release
+        self._released = False
+
+    def __iter__(self):
+        try:
+            yield from self._stream
+        finally:
+            self.close()
+
+    def close(self):
+        if not self._released:
+            self._released = True
+            self._release()
+            if hasattr(self._stream, "close"):
+                self._stream.close()
+
+
+# ============================================
+# Groqクライアントと同じ形で使えるラッパー
+# ============================================
+class ScheduledClient:
+    """client.chat.completions.create(...) をスケジューラ経由で呼ぶ。
+
+    session_id はリクエストを出したセッションを返す関数（公平な順番待ちに使う）。
+    """
+
+    def __init__(self, client, scheduler, session_id=lambda: "default"):
+        self.client = client
+        self.scheduler = scheduler
+        self.session_id = session_id
+        self.chat = types.SimpleNamespace(
+            completions=types.SimpleNamespace(create=self.create)
+        )
+
+    def create(self, **kwargs):
+        return self.scheduler.run(
+            self.session_id(),
+            lambda: self.client.chat.completions.with_raw_response.create(**kwargs),
+            estimate=estimate_tokens(kwargs),
+            stream=bool(kwargs.get("stream")),
+        )
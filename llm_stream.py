@@ -0,0 +1,162 @@
+import json
+import logging
+import re
+import threading
+import time
+
+import metrics
+
+logger = logging.getLogger("llm")
+
+
+# ============================================
+# ストリーミング呼び出し（TTFT・合計時間をログとメトリクスに出す）
+# ============================================
+def stream_chat(client, label, template=None, units=1, **kwargs):
+    """Groqのストリーミング応答を文字列のジェネレータとして返す。
+
+    st.write_stream にそのまま渡せる。途中で close() されても計測ログは出す。
+    template（PromptTemplate）を渡すと usage をそのテンプレートの記録に入れる。
+    """
+    start = time.perf_counter()
+    first_token_at = None
+    usage = None
+    finish_reason = None
+    stream = client.chat.completions.create(stream=True, **kwargs)
+    try:
+        for chunk in stream:
+            # Groq は最後のチャンクの x_groq.usage にトークン数を入れてくる
+            x_groq = getattr(chunk, "x_groq", None)
+            usage = getattr(x_groq, "usage", None) or usage
+            if not chunk.choices:
+                continue
+            finish_reason = getattr(chunk.choices[0], "finish_reason", None) or finish_reason
+            delta = chunk.choices[0].delta.content
+            if delta:
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                yield delta
+    finally:
+        if hasattr(stream, "close"):
+            stream.close()
+        total = time.perf_counter() - start
+        ttft = (first_token_at - start) if first_token_at is not None else total
+        logger.info("%s stream ttft=%.3fs total=%.3fs", label, ttft, total)
+        metrics.LLM_TTFT_SECONDS.observe(ttft, label=label)
+        metrics.LLM_TOTAL_SECONDS.observe(total, label=label)
+        metrics.observe_usage(label, usage)
+        if template is not None:
+            template.observe(usage, finish_reason, units)
+
+
+def complete_chat(client, label, template=None, units=1, **kwargs):
+    # ストリーミングしない場合も同じ形式でログを出す（TTFT = 合計）
+    start = time.perf_counter()
+    response = client.chat.completions.create(**kwargs)
+    total = time.perf_counter() - start
+    logger.info("%s ttft=%.3fs total=%.3fs", label, total, total)
+    metrics.LLM_TTFT_SECONDS.observe(total, label=label)
+    metrics.LLM_TOTAL_SECONDS.observe(total, label=label)
+    metrics.observe_usage(label, getattr(response, "usage", None))
+    if template is not None:
+        template.observe(getattr(response, "usage", None), response.choices[0].finish_reason, units)
+    return response.choices[0].message.content
+
+
+class StreamBuffer:
+    """別スレッドで読んだストリームの断片をためておき、描画する側が届いた順に読む。
+
+    キャッシュの計算（single-flight）の中では feed() で読み切るだけにして st.* を呼ばない。
+    描画する側は started() で最初の断片を待ち、イテレータを st.write_stream に渡す。
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._chunks = []
+        self._closed = False
+
+    def feed(self, stream):
+        """stream を最後まで読み、つないだ文字列を返す。"""
+        try:
+            for chunk in stream:
+                with self._cond:
+                    self._chunks.append(chunk)
+                    self._cond.notify_all()
+        finally:
+            self.close()
+        with self._cond:
+            return "".join(self._chunks)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def started(self, timeout=None):
+        """最初の断片が届いたら True。届かないまま閉じたら False。"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._chunks or self._closed, timeout)
+            return bool(self._chunks)
+
+    def __iter__(self):
+        index = 0
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: len(self._chunks) > index or self._closed)
+                chunks = self._chunks[index:]
+            if not chunks:
+                return
+            index += len(chunks)
+            yield "".join(chunks)
+
+
+# ============================================
+# 途中までのJSONから確定したフィールドを取り出す
+# ============================================
+_SEPARATOR = re.compile(r"[\s,]*")
+_WHITESPACE = re.compile(r"\s*")
+_COLON = re.compile(r"\s*:")
+_DECODER = json.JSONDecoder()
+
+
+class PartialJSONObject:
+    """トップレベルのJSONオブジェクトを少しずつ読み、値が閉じたキーから fields に入れる。"""
+
+    def __init__(self):
+        self.buffer = ""
+        self.fields = {}
+        self._pos = None
+
+    def feed(self, text):
+        self.buffer += text
+        if self._pos is None:
+            start = self.buffer.find("{")
+            if start == -1:
+                return self.fields
+            self._pos = start + 1
+
+        buffer = self.buffer
+        while True:
+            pos = _SEPARATOR.match(buffer, self._pos).end()
+            if pos >= len(buffer) or buffer[pos] == "}":
+                break
+            try:
+                key, end = _DECODER.raw_decode(buffer, pos)
+            except ValueError:
+                break
+            colon = _COLON.match(buffer, end)
+            if not isinstance(key, str) or colon is None:
+                break
+            value_start = _WHITESPACE.match(buffer, colon.end()).end()
+            try:
+                value, end = _DECODER.raw_decode(buffer, value_start)
+            except ValueError:
+                break
+            # 数値などは続きが来るかもしれないので、区切り文字が見えるまで待つ
+            if not isinstance(value, (str, list, dict)) and (
+                end >= len(buffer) or buffer[end] not in ",} \r\n\t"
+            ):
+                break
+            self.fields[key] = value
+            self._pos = end
+        return self.fields
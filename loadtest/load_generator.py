@@ -0,0 +1,456 @@
+"""同時に使う生徒の数を増やしながら、1操作あたりの待ち時間を測る負荷試験。
+
+`streamlit run app.py` を本番と同じように1プロセスで立て、ブラウザと同じ
+WebSocket（/_stcore/stream、protobuf の BackMsg/ForwardMsg）で N 人分のセッションを
+つなぐ。各生徒は熟語クイズ・チューター・問題生成などを混ぜて操作し、
+ボタンを押してからスクリプトの実行が終わるまでを1操作の時間として数える。
+スコア表示の run_every による自動の再実行も、ブラウザと同じように送る。
+
+出力は段階（同時セッション数）ごとの p50/p95/p99、1秒あたりの操作数、
+サーバープロセスのRSS。LLMは stub_server.py をサブプロセスで立てて使う。
+
+    python loadtest/load_generator.py --sessions 5 10 20 40 --duration 30
+    python loadtest/load_generator.py --sessions 40 --mix quiz=50,tutor=30,ai_quiz=20 --error-429 0.05
+    python loadtest/load_generator.py --app-url http://127.0.0.1:8501 --app-pid 12345
+
+WebSocket クライアントには websockets を使う（streamlit の依存に入っている）。
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+import websockets
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+LOADTEST_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(LOADTEST_DIR)
+APP_PATH = os.path.join(ROOT_DIR, "app.py")
+sys.path.insert(0, os.path.join(ROOT_DIR, "benchmarks"))
+
+from bench_app import MODE_LABELS, percentile  # noqa: E402
+
+DEFAULT_MIX = "quiz=35,mistake=15,flashcard=20,tutor=10,tutor_lexicon=5,ai_quiz=15"
+# チューターで調べる言葉。辞書（lexicon.py）にないのでLLMを呼ぶ（同じ言葉が続けば
+# AIの応答のキャッシュに当たるので、当たるものと当たらないものが混ざる）
+TUTOR_WORDS = ["旅行", "散歩", "趣味", "季節", "文化", "歴史", "地図", "漢字", "手紙", "会議"]
+# 辞書にある言葉（LLMを呼ばずにすぐ出す）
+LEXICON_WORDS = ["勉強", "学校", "友達", "電車", "天気", "料理", "図書館", "先生", "時間"]
+ALERT_KINDS = {1: "error", 2: "busy"}  # Alert.Format の ERROR / WARNING
+
+
+# ============================================
+# 1人分のブラウザ
+# ============================================
+class Session:
+    """WebSocket 1本分。画面に出ている要素を覚えておき、ボタンや入力欄を操作する。"""
+
+    def __init__(self, url, timeout, query_string=""):
+        self.url = url
+        self.timeout = timeout
+        self.query_string = query_string  # 例: "learner=abc"（同じ学習者として開く）
+        self.ws = None
+        self.elements = {}  # delta_path -> (generation, fragment_id, Element)
+        self.values = {}  # widget id -> WidgetState（押しっぱなしにならない値だけ）
+        self.auto_reruns = {}  # fragment_id -> [interval, next_due]
+        self.generation = 0
+        self.scope = None  # 実行中の再実行の対象（None は全体）
+
+    async def connect(self):
+        ws_url = self.url.replace("http", "ws", 1).rstrip("/") + "/_stcore/stream"
+        self.ws = await websockets.connect(
+            ws_url, subprotocols=["streamlit"], max_size=None, open_timeout=self.timeout
+        )
+        return await self.rerun()
+
+    async def close(self):
+        if self.ws is not None:
+            await self.ws.close()
+
+    async def rerun(self, trigger=None, fragment_id="", auto=False):
+        """BackMsg を送り、スクリプトの実行が終わるまでの時間（ms）と出たアラートを返す。"""
+        msg = BackMsg()
+        state = msg.rerun_script
+        state.query_string = self.query_string
+        state.fragment_id = fragment_id
+        state.is_auto_rerun = auto
+        for value in self.values.values():
+            state.widget_states.widgets.add().CopyFrom(value)
+        if trigger is not None:
+            state.widget_states.widgets.add(id=trigger, trigger_value=True)
+        start = time.perf_counter()
+        await self.ws.send(msg.SerializeToString())
+        await asyncio.wait_for(self._until_finished(), self.timeout)
+        return (time.perf_counter() - start) * 1000, self._alerts()
+
+    async def _until_finished(self):
+        while True:
+            msg = ForwardMsg()
+            msg.ParseFromString(await self.ws.recv())
+            kind = msg.WhichOneof("type")
+            if kind == "new_session":
+                self.generation += 1
+                fragments = set(msg.new_session.fragment_ids_this_run)
+                self.scope = fragments or None
+                if not fragments:
+                    self.auto_reruns.clear()
+            elif kind == "delta" and msg.delta.WhichOneof("type") == "new_element":
+                path = tuple(msg.metadata.delta_path)
+                self.elements[path] = (self.generation, msg.delta.fragment_id, msg.delta.new_element)
+            elif kind == "auto_rerun":
+                interval = msg.auto_rerun.interval
+                self.auto_reruns[msg.auto_rerun.fragment_id] = [interval, time.monotonic() + interval]
+            elif kind == "script_finished":
+                if msg.script_finished == ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                    continue
+                self._drop_stale()
+                return
+
+    def _drop_stale(self):
+        # 今回の実行で描き直されなかった要素は画面から消えている
+        for path, (generation, fragment_id, _) in list(self.elements.items()):
+            if generation < self.generation and (self.scope is None or fragment_id in self.scope):
+                del self.elements[path]
+
+    def _alerts(self):
+        kinds = []
+        for generation, _, element in self.elements.values():
+            if generation != self.generation:
+                continue
+            kind = element.WhichOneof("type")
+            if kind == "exception":
+                kinds.append("exception")
+            elif kind == "alert" and element.alert.format in ALERT_KINDS:
+                kinds.append(ALERT_KINDS[element.alert.format])
+        return kinds
+
+    def _widgets(self, kind, match):
+        found = [
+            (fragment_id, getattr(element, kind))
+            for _, fragment_id, element in self.elements.values()
+            if element.WhichOneof("type") == kind and match(getattr(element, kind))
+        ]
+        if not found:
+            raise LookupError(f"{kind} not found")
+        return found
+
+    # ---- 操作 ----
+    async def click(self, label):
+        fragment_id, button = self._widgets("button", lambda b: b.label == label)[0]
+        return await self.rerun(trigger=button.id, fragment_id=fragment_id)
+
+    async def click_keyed(self, prefix, rng):
+        """key が prefix で始まるボタン（選択肢）のどれかを押す。"""
+        found = self._widgets("button", lambda b: b.id.rsplit("-", 1)[-1].startswith(prefix))
+        fragment_id, button = rng.choice(found)
+        return await self.rerun(trigger=button.id, fragment_id=fragment_id)
+
+    async def type(self, label, text):
+        fragment_id, widget = self._widgets("text_input", lambda w: w.label == label)[0]
+        self.values[widget.id] = WidgetState(id=widget.id, string_value=text)
+        return await self.rerun(fragment_id=fragment_id)
+
+    async def choose_mode(self, mode):
+        _, radio = self._widgets("radio", lambda r: MODE_LABELS[mode] in r.options)[0]
+        self.values[radio.id] = WidgetState(id=radio.id, string_value=MODE_LABELS[mode])
+        return await self.rerun()
+
+    async def auto_rerun_due(self):
+        """run_every の時間が来たフラグメントを再実行する（ブラウザのタイマーの代わり）。"""
+        now = time.monotonic()
+        for fragment_id, timer in list(self.auto_reruns.items()):
+            if timer[1] <= now:
+                timer[1] = now + timer[0]
+                await self.rerun(fragment_id=fragment_id, auto=True)
+                return True
+        return False
+
+
+# ============================================
+# 各モードの操作（bench_app.py と同じ流れ）
+# ============================================
+def step_quiz(session, rng):
+    yield "answer", lambda: session.click_keyed("opt_", rng)
+    yield "new", lambda: session.click("🆕 新しい問題")
+
+
+def step_mistake(session, rng):
+    yield "type", lambda: session.type("間違いはどこ？（間違っている部分を入力）", rng.choice(["が", "を", "に"]))
+    yield "check", lambda: session.click("答え合わせ")
+    yield "new", lambda: session.click("🆕 新しい問題")
+
+
+def step_flashcard(session, rng):
+    yield "flip", lambda: session.click("🔄 めくる")
+    yield "grade", lambda: session.click(rng.choice(["⭕ 覚えてた", "❌ 忘れてた"]))
+
+
+def step_tutor(session, rng):
+    yield "type", lambda: session.type("🔤 調べたい漢字・熟語を入力", rng.choice(TUTOR_WORDS))
+    yield "lookup", lambda: session.click("📚 意味を調べる")
+
+
+def step_tutor_lexicon(session, rng):
+    yield "type", lambda: session.type("🔤 調べたい漢字・熟語を入力", rng.choice(LEXICON_WORDS))
+    yield "lookup", lambda: session.click("📚 意味を調べる")
+
+
+def step_ai_quiz(session, rng):
+    yield "generate", lambda: session.click("🎲 新しい問題を作る")
+    yield "answer", lambda: session.click_keyed("ai_opt_", rng)
+
+
+SCENARIOS = {
+    "quiz": step_quiz,
+    "mistake": step_mistake,
+    "flashcard": step_flashcard,
+    "tutor": step_tutor,
+    "tutor_lexicon": step_tutor_lexicon,
+    "ai_quiz": step_ai_quiz,
+}
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, weight = part.split("=")
+        if name not in SCENARIOS:
+            raise SystemExit(f"unknown scenario in --mix: {name}")
+        mix[name] = float(weight)
+    return mix
+
+
+def count(counter, key):
+    counter[key] = counter.get(key, 0) + 1
+
+
+async def think(session, seconds):
+    # 考えている間も run_every の再実行は届く
+    deadline = time.monotonic() + seconds
+    auto = 0
+    while time.monotonic() < deadline:
+        if await session.auto_rerun_due():
+            auto += 1
+        else:
+            await asyncio.sleep(min(0.05, max(0.0, deadline - time.monotonic())))
+    return auto
+
+
+async def learner(index, url, mix, deadline, args, results):
+    rng = random.Random(index)
+    names, weights = zip(*mix.items())
+    session = Session(url, args.timeout)
+    try:
+        await session.connect()
+        mode = None
+        while time.monotonic() < deadline:
+            name = rng.choices(names, weights)[0]
+            try:
+                if name != mode:
+                    elapsed, _ = await session.choose_mode(name)
+                    results["interactions"].append((name, elapsed))
+                    mode = name
+                for _, action in SCENARIOS[name](session, rng):
+                    if time.monotonic() >= deadline:
+                        break
+                    elapsed, alerts = await action()
+                    results["interactions"].append((name, elapsed))
+                    for kind in alerts:
+                        count(results["errors"], kind)
+                    results["auto_reruns"] += await think(session, rng.uniform(0, 2 * args.think_time))
+            except (LookupError, asyncio.TimeoutError) as e:
+                # 画面が思った状態でない / 時間切れ。つなぎ直してモードから選び直す
+                count(results["errors"], type(e).__name__)
+                await session.close()
+                session = Session(url, args.timeout)
+                await session.connect()
+                mode = None
+    except (OSError, websockets.WebSocketException) as e:
+        count(results["errors"], type(e).__name__)
+    finally:
+        await session.close()
+
+
+# ============================================
+# サーバーのRSS
+# ============================================
+def rss_mb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+async def sample_rss(pid, samples, stop):
+    while not stop.is_set():
+        value = rss_mb(pid)
+        if value is not None:
+            samples.append(value)
+        try:
+            await asyncio.wait_for(stop.wait(), 0.5)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def run_level(sessions, url, pid, mix, args):
+    results = {"interactions": [], "errors": {}, "auto_reruns": 0}
+    samples = []
+    stop = asyncio.Event()
+    rss_start = rss_mb(pid) if pid else None
+    sampler = asyncio.create_task(sample_rss(pid, samples, stop)) if pid else None
+
+    start = time.monotonic()
+    deadline = start + args.duration
+    await asyncio.gather(*(learner(i, url, mix, deadline, args, results) for i in range(sessions)))
+    elapsed = time.monotonic() - start
+    stop.set()
+    if sampler:
+        await sampler
+
+    latencies = [ms for _, ms in results["interactions"]]
+    per_scenario = {}
+    for name in mix:
+        values = [ms for n, ms in results["interactions"] if n == name]
+        if values:
+            per_scenario[name] = {
+                "count": len(values),
+                "p50_ms": round(percentile(values, 50), 1),
+                "p95_ms": round(percentile(values, 95), 1),
+            }
+    return {
+        "sessions": sessions,
+        "interactions": len(latencies),
+        "auto_reruns": results["auto_reruns"],
+        "errors": results["errors"],
+        "throughput_per_s": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50), 1),
+        "p95_ms": round(percentile(latencies, 95), 1),
+        "p99_ms": round(percentile(latencies, 99), 1),
+        "rss_mb_start": round(rss_start, 1) if rss_start else None,
+        "rss_mb_peak": round(max(samples), 1) if samples else None,
+        "per_scenario": per_scenario,
+    }
+
+
+# ============================================
+# サーバーの起動
+# ============================================
+def start_stub(args):
+    command = [
+        sys.executable, os.path.join(LOADTEST_DIR, "stub_server.py"),
+        "--port", str(args.stub_port), "--latency", args.latency, "--mean", str(args.mean),
+        "--sigma", str(args.sigma), "--error-429", str(args.error_429),
+        "--error-500", str(args.error_500),
+    ]
+    process = subprocess.Popen(command, stderr=subprocess.PIPE, text=True)
+    process.stderr.readline()  # "listening on ..." を待つ
+    return process, f"http://127.0.0.1:{args.stub_port}"
+
+
+def start_app(args, llm_url):
+    # 実行ごとに新しいストア・キャッシュを使う
+    workdir = tempfile.mkdtemp(prefix="loadtest-")
+    env = dict(
+        os.environ,
+        GROQ_BASE_URL=llm_url,
+        GROQ_API_KEY=os.environ.get("GROQ_API_KEY", "stub"),
+        LLM_CACHE_PATH=os.path.join(workdir, "llm_cache.sqlite3"),
+        CONTENT_CACHE_DIR=os.path.join(workdir, "content"),
+        PROGRESS_DB_PATH=os.path.join(workdir, "progress.sqlite3"),
+    )
+    command = [
+        sys.executable, "-m", "streamlit", "run", APP_PATH,
+        "--server.headless", "true", "--server.port", str(args.app_port),
+        "--browser.gatherUsageStats", "false",
+    ]
+    process = subprocess.Popen(command, env=env, cwd=ROOT_DIR,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{args.app_port}"
+    for _ in range(120):
+        try:
+            with urllib.request.urlopen(url + "/_stcore/health", timeout=1) as response:
+                if response.status == 200:
+                    return process, url
+        except OSError:
+            time.sleep(0.5)
+    process.terminate()
+    raise SystemExit("streamlit did not start")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, nargs="+", default=[5, 10, 20, 40])
+    parser.add_argument("--duration", type=float, default=30.0, help="各段階の秒数")
+    parser.add_argument("--mix", default=DEFAULT_MIX)
+    parser.add_argument("--think-time", type=float, default=2.0, help="操作の間の平均待ち（秒）")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--slo-ms", type=float, default=1000.0, help="p95 がこれを超えたら劣化とみなす")
+    parser.add_argument("--app-url", help="既に動いているアプリ。省略時は streamlit run で起動する")
+    parser.add_argument("--app-pid", type=int, help="--app-url のサーバーのPID（RSSを測る）")
+    parser.add_argument("--app-port", type=int, default=8599)
+    parser.add_argument("--llm-url", help="既に動いている互換サーバー。省略時は stub_server.py を起動する")
+    parser.add_argument("--stub-port", type=int, default=8790)
+    parser.add_argument("--latency", choices=["fixed", "uniform", "lognormal"], default="lognormal")
+    parser.add_argument("--mean", type=float, default=0.8)
+    parser.add_argument("--sigma", type=float, default=0.4)
+    parser.add_argument("--error-429", type=float, default=0.0)
+    parser.add_argument("--error-500", type=float, default=0.0)
+    parser.add_argument("--output")
+    args = parser.parse_args(argv)
+
+    mix = parse_mix(args.mix)
+    processes = []
+    levels = []
+    url, llm_url = args.app_url, args.llm_url
+    try:
+        if not url and not llm_url:
+            stub, llm_url = start_stub(args)
+            processes.append(stub)
+        pid = args.app_pid
+        if not url:
+            app, url = start_app(args, llm_url)
+            processes.append(app)
+            pid = app.pid
+        for sessions in args.sessions:
+            level = asyncio.run(run_level(sessions, url, pid, mix, args))
+            levels.append(level)
+            print(f"{sessions:4d} sessions: p50={level['p50_ms']}ms p95={level['p95_ms']}ms "
+                  f"p99={level['p99_ms']}ms {level['throughput_per_s']}/s rss={level['rss_mb_peak']}MB",
+                  file=sys.stderr, flush=True)
+    finally:
+        for process in processes:
+            process.terminate()
+
+    within_slo = [level["sessions"] for level in levels if level["p95_ms"] <= args.slo_ms]
+    report = {
+        "app_url": url,
+        "llm_url": llm_url,
+        "mix": mix,
+        "duration_s": args.duration,
+        "think_time_s": args.think_time,
+        "slo_ms": args.slo_ms,
+        "max_sessions_within_slo": max(within_slo) if within_slo else 0,
+        "levels": levels,
+    }
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
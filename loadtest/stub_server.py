@@ -0,0 +1,218 @@
+"""Groq（OpenAI互換）の chat completions を真似するローカルサーバー。
+
+負荷試験で本物のAPIを叩かないためのもの。応答時間の分布、トークンの
+ストリーミング、429/500 の注入を設定できる。
+
+    python loadtest/stub_server.py --port 8790 --latency lognormal --mean 0.8 --error-429 0.05
+    GROQ_BASE_URL=http://127.0.0.1:8790 streamlit run app.py
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+from stub_groq import RATE_LIMIT_HEADERS, StubCompletions  # noqa: E402
+
+PATHS = ("/openai/v1/chat/completions", "/v1/chat/completions")
+
+
+# ============================================
+# 応答時間の分布
+# ============================================
+def make_latency(kind, mean, sigma):
+    if kind == "fixed":
+        return lambda: mean
+    if kind == "uniform":
+        return lambda: random.uniform(max(0.0, mean - sigma), mean + sigma)
+    if kind == "lognormal":
+        # 平均が mean になるように mu を決める
+        mu = math.log(mean) - sigma ** 2 / 2 if mean > 0 else 0.0
+        return lambda: random.lognormvariate(mu, sigma) if mean > 0 else 0.0
+    raise ValueError(f"unknown latency distribution: {kind}")
+
+
+class StubConfig:
+    def __init__(self, latency, ttft_ratio=0.2, error_429=0.0, error_500=0.0,
+                 retry_after=1.0, chunk_chars=4):
+        self.latency = latency
+        self.ttft_ratio = ttft_ratio
+        self.error_429 = error_429
+        self.error_500 = error_500
+        self.retry_after = retry_after
+        self.chunk_chars = chunk_chars
+        # 立て直しても前と同じ単語を返さないよう、番号は毎回ちがう所から始める
+        self.completions = StubCompletions(start=random.randrange(1, 10 ** 6))
+        self.stats = {"requests": 0, "streams": 0, "429": 0, "500": 0}
+        self.lock = threading.Lock()
+
+    def count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+
+# ============================================
+# HTTPハンドラ
+# ============================================
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, body, headers=None):
+        data = json.dumps(body, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self._send_json(200, self.config.stats)
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        config = self.config
+        length = int(self.headers.get("Content-Length") or 0)
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if self.path not in PATHS:
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+        config.count("requests")
+
+        roll = random.random()
+        if roll < config.error_429:
+            config.count("429")
+            self._send_json(
+                429,
+                {"error": {"message": "Rate limit reached", "type": "tokens", "code": "rate_limit_exceeded"}},
+                {"retry-after": str(config.retry_after), **RATE_LIMIT_HEADERS,
+                 "x-ratelimit-remaining-requests": "0"},
+            )
+            return
+        if roll < config.error_429 + config.error_500:
+            config.count("500")
+            self._send_json(500, {"error": {"message": "Internal Server Error", "type": "internal_server_error"}})
+            return
+
+        content = config.completions.content_for(request.get("messages", [{"content": ""}]))
+        prompt_tokens = sum(len(m.get("content") or "") for m in request.get("messages", []))
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(content),
+            "total_tokens": prompt_tokens + len(content),
+        }
+        total = config.latency()
+        base = {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:24]}",
+            "created": int(time.time()),
+            "model": request.get("model", "stub"),
+            "system_fingerprint": "stub",
+        }
+        if request.get("stream"):
+            config.count("streams")
+            self._stream(base, content, usage, total)
+            return
+
+        time.sleep(total)
+        self._send_json(200, {
+            **base,
+            "object": "chat.completion",
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+                "logprobs": None,
+            }],
+            "usage": usage,
+        }, RATE_LIMIT_HEADERS)
+
+    def _stream(self, base, content, usage, total):
+        config = self.config
+        chunks = [content[i:i + config.chunk_chars] for i in range(0, len(content), config.chunk_chars)]
+        ttft = total * config.ttft_ratio
+        per_chunk = (total - ttft) / max(1, len(chunks))
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        for key, value in RATE_LIMIT_HEADERS.items():
+            self.send_header(key, value)
+        self.end_headers()
+
+        def send(payload):
+            data = f"data: {payload}\n\n".encode()
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+            self.wfile.flush()
+
+        time.sleep(ttft)
+        for i, text in enumerate(chunks):
+            if i:
+                time.sleep(per_chunk)
+            send(json.dumps({
+                **base,
+                "object": "chat.completion.chunk",
+                "choices": [{"index": 0, "delta": {"role": "assistant", "content": text}, "finish_reason": None}],
+            }, ensure_ascii=False))
+        send(json.dumps({
+            **base,
+            "object": "chat.completion.chunk",
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+            "x_groq": {"usage": usage},
+        }, ensure_ascii=False))
+        send("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+def serve(port, config, host="127.0.0.1"):
+    handler = type("ConfiguredHandler", (Handler,), {"config": config})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8790)
+    parser.add_argument("--latency", choices=["fixed", "uniform", "lognormal"], default="lognormal")
+    parser.add_argument("--mean", type=float, default=0.8, help="応答全体の平均時間（秒）")
+    parser.add_argument("--sigma", type=float, default=0.4, help="uniform は幅、lognormal は σ")
+    parser.add_argument("--ttft-ratio", type=float, default=0.2, help="ストリーミングで最初のトークンまでの割合")
+    parser.add_argument("--error-429", type=float, default=0.0, help="429を返す確率")
+    parser.add_argument("--error-500", type=float, default=0.0, help="500を返す確率")
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    args = parser.parse_args(argv)
+
+    config = StubConfig(
+        make_latency(args.latency, args.mean, args.sigma),
+        ttft_ratio=args.ttft_ratio,
+        error_429=args.error_429,
+        error_500=args.error_500,
+        retry_after=args.retry_after,
+    )
+    server = serve(args.port, config, args.host)
+    print(f"stub LLM listening on http://{args.host}:{args.port}", file=sys.stderr, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
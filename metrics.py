@@ -0,0 +1,270 @@
+import bisect
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger("metrics")
+
+# ============================================
+# Prometheus テキスト形式のメトリクス（依存なしの最小限の実装）
+# ============================================
+# 記録（observe / inc）はロック1つと二分探索だけなので、ホットパスで呼んでよい。
+# 既存のクラスが持っている stats の dict は、読み出す時に値を取る「コレクター」で出す
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def total(self):
+        with self._lock:
+            return sum(self._values.values())
+
+    def collect(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_labels(self.labels, key)} {_number(value)}" for key, value in values]
+        return lines
+
+
+class Histogram:
+    """バケットごとの件数・合計・件数を持つ。summary() で管理画面用の概算を出す。"""
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        # labels -> [バケットごとの件数（最後は +Inf）, 合計, 件数]
+        self._series = {}
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def summary(self):
+        """labels -> {count, mean, p50, p95}。分位点はバケットの上限で近似する。"""
+        with self._lock:
+            series = {key: (list(counts), total, count) for key, (counts, total, count) in self._series.items()}
+        result = {}
+        for key, (counts, total, count) in sorted(series.items()):
+            quantiles = {}
+            for name, q in (("p50", 0.5), ("p95", 0.95)):
+                rank, seen = q * count, 0
+                for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                    seen += bucket_count
+                    if seen >= rank:
+                        quantiles[name] = bound
+                        break
+            result[key] = {"count": count, "mean": total / count if count else 0.0, **quantiles}
+        return result
+
+    def collect(self):
+        with self._lock:
+            series = {key: (list(counts), total, count) for key, (counts, total, count) in self._series.items()}
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for key, (counts, total, count) in sorted(series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_labels(self.labels, key, [('le', _number(bound))])} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labels, key)} {count}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = OrderedDict()
+        self._collectors = OrderedDict()
+
+    def add(self, metric):
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def register(self, name, help, kind, read, label=None):
+        """読み出す時に read() を呼んで値を出す。同じ name で登録し直すと置き換える。
+
+        read() は数値、または label の値 -> 数値の dict を返す。
+        """
+        with self._lock:
+            self._collectors[name] = (help, kind, read, label)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors.items())
+        lines = []
+        for metric in metrics:
+            lines += metric.collect()
+        for name, (help, kind, read, label) in collectors:
+            try:
+                values = read()
+            except Exception:
+                logger.exception("collector %s failed", name)
+                continue
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+            if isinstance(values, dict):
+                lines += [f"{name}{_labels((label,), (key,))} {_number(value)}" for key, value in values.items()]
+            else:
+                lines.append(f"{name} {_number(values)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def register_stats(name, help, stats, label="event"):
+    """既存クラスの stats の dict（数え上げ）をカウンターとして出す。"""
+    REGISTRY.register(name, help, "counter", lambda: dict(stats()), label)
+
+
+def register_gauge(name, help, read, label=None):
+    REGISTRY.register(name, help, "gauge", read, label)
+
+
+def lru_stats(cached):
+    """functools.lru_cache の当たり・外れ。"""
+    info = cached.cache_info()
+    return {"hits": info.hits, "misses": info.misses}
+
+
+class SessionTracker:
+    """最近 window 秒以内に実行があったセッションを数える。
+
+    使っていないタブも定期的に再実行されるフラグメント（app.py の session_upkeep。
+    SESSION_CHECK_SECONDS ごと）で touch されるので、window をその間隔より長くすれば
+    開いているタブはずっと数えられる。
+    """
+
+    def __init__(self, window=120.0):
+        self.window = window
+        self._lock = threading.Lock()
+        self._last_seen = {}
+        self._pruned_at = time.monotonic()
+
+    def _prune(self, now):
+        cutoff = now - self.window
+        for session_id in [s for s, seen in self._last_seen.items() if seen < cutoff]:
+            del self._last_seen[session_id]
+        self._pruned_at = now
+
+    def touch(self, session_id):
+        now = time.monotonic()
+        with self._lock:
+            self._last_seen[session_id] = now
+            # /metrics を誰も読まなくても閉じたタブの分がたまらないようにする（window に1回）
+            if now - self._pruned_at > self.window:
+                self._prune(now)
+
+    def active(self):
+        with self._lock:
+            self._prune(time.monotonic())
+            return len(self._last_seen)
+
+
+# ============================================
+# アプリ全体で使うメトリクス
+# ============================================
+SCRIPT_SECONDS = REGISTRY.add(Histogram(
+    "app_script_run_seconds",
+    "Script run duration. run=full is a whole-page run, run=fragment a rerun of one mode's fragment.",
+    ("mode", "run"),
+))
+LLM_QUEUE_SECONDS = REGISTRY.add(Histogram(
+    "llm_queue_seconds", "Time an LLM request waited in the scheduler before being sent.",
+))
+LLM_TTFT_SECONDS = REGISTRY.add(Histogram(
+    "llm_ttft_seconds", "Time to first token, including queue wait (equals total when not streaming).", ("label",),
+))
+LLM_TOTAL_SECONDS = REGISTRY.add(Histogram(
+    "llm_total_seconds", "Total LLM call duration, including queue wait.", ("label",),
+))
+TUTOR_ANSWERS = REGISTRY.add(Counter(
+    "tutor_answers_total", "AI tutor answers by source: lexicon (no LLM call), cache or llm.", ("source",),
+))
+LLM_TOKENS = REGISTRY.add(Counter(
+    "llm_tokens_total", "Tokens reported by the provider.", ("label", "type"),
+))
+
+
+def observe_usage(label, usage):
+    # Groq の usage（prompt_tokens / completion_tokens）。ないこともある
+    if usage is None:
+        return
+    LLM_TOKENS.inc(getattr(usage, "prompt_tokens", 0) or 0, label=label, type="prompt")
+    LLM_TOKENS.inc(getattr(usage, "completion_tokens", 0) or 0, label=label, type="completion")
+
+
+# ============================================
+# /metrics を返すバックグラウンドのHTTPサーバー
+# ============================================
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_exporter(port, address="0.0.0.0"):
+    """デーモンスレッドで /metrics を返し始める。ポートが使えない時は None。"""
+    try:
+        server = ThreadingHTTPServer((address, port), _Handler)
+    except OSError as e:
+        logger.warning("metrics exporter not started on %s:%d: %s", address, port, e)
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-exporter", daemon=True).start()
+    logger.info("metrics exporter listening on %s:%d", address, port)
+    return server
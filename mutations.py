@@ -0,0 +1,262 @@
+import os
+import re
+import sys
+import time
+
+# ============================================
+# 間違い探しの問題を規則で作る（LLMを使わない）
+# ============================================
+# 正しい例文に、中国人の生徒がやりがちな間違いを1か所だけ入れる:
+#   助詞の取り違え（が↔に、を↔に、を↔が）         学校に行きます → 学校が行きます
+#   な形容詞に「い」を付ける                         好きです → 好きいです
+#   い形容詞の「い」を落とす                         面白いです → 面白です
+#   ます形の作り間違い（でます・辞書形＋ます）       できます → でます、行きます → 行くます
+#   い形容詞と「ので」の間に「な」を入れる           暑いので → 暑いなので
+# 規則や表を変えたら上げる（content_store のストアも作り直される）
+MUTATION_VERSION = 2
+# 手で作った問題と重ならない id にする
+GENERATED_ID_BASE = 1_000_000
+MUTATION_TAG = "rule"
+
+# 出す順番（同じ文なら先の規則の問題を先に出す）
+RULES = ("particle", "na-adjective", "i-adjective", "masu-form", "node")
+
+_KANJI = r"[㐀-鿿々〆ヵヶ]"
+_KANJI_CHAR = re.compile(_KANJI)
+_NOUN_END = r"[㐀-鿿々〆ヵヶァ-ヺー0-9０-９]"
+# 助詞の前は名詞の終わり（漢字・カタカナ・数字）の時だけ。ひらがなの後ろの「が」「に」は
+# 単語の一部（ありがとう・にほん）のことが多いので見ない
+_PARTICLE = re.compile(rf"(?<={_NOUN_END})([がにを])(?=[぀-ヿ㐀-鿿])")
+_PREDICATE = re.compile(r"[^。、！？!?\s]{1,10}")
+
+# (正しい助詞, 間違えた助詞) -> 説明。{predicate} は助詞の後ろの述語
+PARTICLE_SWAPS = {
+    "が": ("に", "を"),
+    "に": ("が", "を"),
+    "を": ("に", "が"),
+}
+PARTICLE_EXPLANATIONS = {
+    ("に", "が"): "「{predicate}」前面用「に」表示地点、对象或时间，不用「が」。",
+    ("に", "を"): "「{predicate}」前面用「に」表示地点、对象或时间，不用「を」。",
+    ("を", "に"): "「{predicate}」的宾语用「を」表示，不用「に」。",
+    ("を", "が"): "「{predicate}」的宾语用「を」表示，不用「が」。",
+    ("が", "に"): "「{predicate}」前面用「が」表示主语，不用「に」。",
+    ("が", "を"): "「{predicate}」前面用「が」（上手・得意・ある等都用「が」），不用「を」。",
+}
+# 入れ替えても正しい文になる時は作らない（間違い探しの答えが2つになる）
+# 述語によっては両方とも使う助詞の組: 運動を好きです・友達と会いました
+PARTICLE_ALTERNATIVES = {
+    frozenset("がを"): ("好き", "大好き", "嫌い", "大嫌い", "欲しい"),
+    frozenset("にと"): ("会い", "会う", "会っ", "会わ", "会え", "話し", "話す", "相談", "結婚"),
+}
+# 人を表す名詞のあとの「が」は主語として読める: 先生が質問します・友達が会いました
+PERSON_NOUNS = (
+    "先生", "友達", "友だち", "学生", "生徒", "子供", "子ども", "人", "私", "彼", "彼女",
+    "母", "父", "兄", "姉", "弟", "妹", "家族", "両親", "医者", "店員",
+)
+
+# な形容詞（「い」で終わるもの〈きれい・嫌い〉と、「い」を足すと別の語になるもの
+# 〈上手い〉は、「い」を足す間違いにならないので入れない）
+NA_ADJECTIVES = (
+    "大好き", "好き", "下手", "静か", "元気", "有名", "便利", "大切", "大丈夫", "簡単", "親切",
+    "暇", "得意", "苦手", "安全", "自由", "丈夫", "にぎやか", "賑やか", "新鮮", "大事", "大変", "不便",
+    "心配", "残念", "特別", "必要", "真面目", "まじめ", "同じ", "色々", "いろいろ",
+)
+# い形容詞（「いい」は「い」を落とすと別の語に見えるので入れない）
+I_ADJECTIVES = (
+    "楽しい", "面白い", "おもしろい", "暑い", "寒い", "熱い", "冷たい", "赤い", "青い", "白い", "黒い",
+    "大きい", "小さい", "新しい", "古い", "高い", "安い", "低い", "長い", "短い", "早い", "速い", "遅い",
+    "多い", "少ない", "おいしい", "美味しい", "難しい", "易しい", "優しい", "やさしい", "忙しい",
+    "嬉しい", "うれしい", "悲しい", "広い", "狭い", "強い", "弱い", "近い", "遠い", "暖かい", "涼しい",
+    "明るい", "暗い", "重い", "軽い", "痛い", "若い", "かわいい", "可愛い", "眠い", "甘い", "辛い",
+    "危ない", "汚い", "美しい", "正しい", "寂しい", "細かい", "太い", "細い", "厚い", "薄い",
+)
+_NA_ADJECTIVE = re.compile(
+    "(" + "|".join(sorted(map(re.escape, NA_ADJECTIVES), key=len, reverse=True)) + ")(?=です|でした|じゃ|だ)"
+)
+_I_ADJECTIVE = re.compile(
+    "(" + "|".join(sorted(map(re.escape, I_ADJECTIVES), key=len, reverse=True)) + ")(?=です|でした|ので|。|$)"
+)
+_I_ADJECTIVE_NODE = re.compile(
+    "(" + "|".join(sorted(map(re.escape, I_ADJECTIVES), key=len, reverse=True)) + ")(?=ので)"
+)
+
+# ます形: い段＋ます → う段＋ます（辞書形にそのまま「ます」を付ける間違い）
+_I_TO_U = dict(zip("いきぎしちにびみり", "うくぐすつぬぶむる"))
+_MASU = re.compile(rf"({_KANJI}+)([いきぎしちにびみり])(ます|ました|ません)")
+# 形が崩れる決まった間違い（正しい形, 間違えた形, 説明）
+MASU_ERRORS = (
+    ("できます", "でます", "「できる」的ます形是「できます」，不是「でます」。"),
+    ("できました", "でました", "「できる」的ます形是「できました」，不是「でました」。"),
+    ("できません", "でません", "「できる」的否定是「できません」，不是「でません」。"),
+)
+
+
+# ============================================
+# 1つの文から作る
+# ============================================
+def _script(char):
+    if "ぁ" <= char <= "ゖ":
+        return "hiragana"
+    if "ァ" <= char <= "ヺ" or char == "ー":
+        return "katakana"
+    return "kanji" if _KANJI_CHAR.match(char) else char
+
+
+def _unique_span(sentence, start, end, correct_sentence):
+    """間違えた部分 [start, end) を、文の中で1回だけ出てくるまで左に広げる。
+
+    前の語（漢字・カタカナ・ひらがなの続くところ）ごと広げる（「火に」ではなく「花火に」）。
+    (間違えた部分, 直した部分) を返す。左に広げられなくなったら None。
+    """
+    offset = len(correct_sentence) - len(sentence)
+    while sentence.count(sentence[start:end]) != 1:
+        if start == 0:
+            return None
+        start -= 1
+        while start > 0 and _script(sentence[start - 1]) == _script(sentence[start]):
+            start -= 1
+    # 正しい文の同じ範囲（変えたのは end より前の1か所だけなので、end から後ろはずれない）
+    return sentence[start:end], correct_sentence[start:end + offset]
+
+
+def _item(correct_sentence, start, end, replacement, explanation, tag):
+    sentence = correct_sentence[:start] + replacement + correct_sentence[end:]
+    span = _unique_span(sentence, start, start + len(replacement), correct_sentence)
+    if span is None or not span[0]:
+        return None
+    mistake, correct = span
+    return {
+        "sentence": sentence,
+        "mistake": mistake,
+        "correct": correct,
+        "explanation": explanation,
+        "tags": [tag, MUTATION_TAG],
+    }
+
+
+def _also_correct(before, right, wrong, predicate):
+    """right を wrong にしても正しい文として読めるか。before は助詞の前の部分。"""
+    if wrong == "が" and before.endswith(PERSON_NOUNS):
+        return True
+    return predicate.startswith(PARTICLE_ALTERNATIVES.get(frozenset((right, wrong)), ()))
+
+
+def _particle(sentence):
+    for match in _PARTICLE.finditer(sentence):
+        right = match.group(1)
+        predicate = _PREDICATE.match(sentence, match.end())
+        predicate = predicate.group(0) if predicate else sentence[match.end():]
+        for wrong in PARTICLE_SWAPS[right]:
+            if _also_correct(sentence[:match.start()], right, wrong, predicate):
+                continue
+            yield _item(sentence, match.start(), match.end(), wrong,
+                        PARTICLE_EXPLANATIONS[(right, wrong)].format(predicate=predicate), "particle")
+
+
+def _na_adjective(sentence):
+    for match in _NA_ADJECTIVE.finditer(sentence):
+        adjective = match.group(1)
+        yield _item(sentence, match.start(), match.end(), adjective + "い",
+                    f"「{adjective}」是な形容词，后面直接加「です」，不需要加「い」。", "na-adjective")
+
+
+def _i_adjective(sentence):
+    for match in _I_ADJECTIVE.finditer(sentence):
+        adjective = match.group(1)
+        yield _item(sentence, match.start(), match.end(), adjective[:-1],
+                    f"「{adjective}」是い形容词，需要「い」结尾。", "i-adjective")
+
+
+def _masu_form(sentence):
+    for right, wrong, explanation in MASU_ERRORS:
+        start = sentence.find(right)
+        if start != -1:
+            yield _item(sentence, start, start + len(right), wrong, explanation, "masu-form")
+    for match in _MASU.finditer(sentence):
+        stem, kana, ending = match.groups()
+        if kana == "し" and len(stem) > 1:
+            continue  # 「勉強します」などの「する」は辞書形に「ます」を付ける間違いにならない
+        dictionary = stem + _I_TO_U[kana]
+        yield _item(sentence, match.start(), match.end(), dictionary + ending,
+                    f"「ます」要接在ます形后面：「{stem}{kana}{ending}」，不能直接接辞书形「{dictionary}」。",
+                    "verb-form")
+
+
+def _node(sentence):
+    for match in _I_ADJECTIVE_NODE.finditer(sentence):
+        adjective = match.group(1)
+        yield _item(sentence, match.start(), match.end(), adjective + "な",
+                    f"い形容词后面直接加「ので」：「{adjective}ので」，不需要「な」。", "i-adjective")
+
+
+_RULES = {
+    "particle": _particle,
+    "na-adjective": _na_adjective,
+    "i-adjective": _i_adjective,
+    "masu-form": _masu_form,
+    "node": _node,
+}
+
+
+def mutate(sentence):
+    """正しい文1つから作れる間違い探しの問題を全部返す（文が同じものは1つだけ）。"""
+    items, seen = [], {sentence}
+    for rule in RULES:
+        for item in _RULES[rule](sentence):
+            if item is not None and item["sentence"] not in seen:
+                seen.add(item["sentence"])
+                items.append(item)
+    return items
+
+
+# ============================================
+# コーパス全体
+# ============================================
+def source_sentences(vocab, mistakes):
+    """(正しい文, 学年) を重複なしで返す。単語の例文と、手で作った問題を直した文。"""
+    seen = set()
+    for item in vocab:
+        if item.get("example") and item["example"] not in seen:
+            seen.add(item["example"])
+            yield item["example"], item["grade"]
+    for item in mistakes:
+        sentence = item["sentence"].replace(item["mistake"], item["correct"], 1)
+        if sentence not in seen:
+            seen.add(sentence)
+            yield sentence, item["grade"]
+
+
+def generate(sentences, existing=(), start_id=GENERATED_ID_BASE):
+    """(文, 学年) の並びから問題を作る。id は start_id からの連番（同じ入力なら毎回同じ）。
+
+    existing（手で作った問題の文）と同じ文の問題は作らない。
+    """
+    seen = set(existing)
+    next_id = start_id
+    for sentence, grade in sentences:
+        for item in mutate(sentence):
+            if item["sentence"] in seen:
+                continue
+            seen.add(item["sentence"])
+            yield dict(item, id=next_id, grade=grade)
+            next_id += 1
+
+
+if __name__ == "__main__":
+    # コーパス全体で作ってみて、手で作った問題をいくつ作り直せるかと速さを見る:
+    #   python mutations.py [content_dir]
+    from content_store import CONTENT_DIR, read_jsonl
+
+    content_dir = sys.argv[1] if len(sys.argv) > 1 else CONTENT_DIR
+    vocab = list(read_jsonl(os.path.join(content_dir, "vocab.jsonl")))
+    mistakes = list(read_jsonl(os.path.join(content_dir, "mistakes.jsonl")))
+    sentences = list(source_sentences(vocab, mistakes))
+    start = time.perf_counter()
+    items = list(generate(sentences))
+    elapsed = time.perf_counter() - start
+    reproduced = {item["sentence"] for item in items} & {item["sentence"] for item in mistakes}
+    for item in items:
+        print(f"{item['sentence']}\t{item['mistake']} → {item['correct']}\t{','.join(item['tags'])}\t{item['explanation']}")
+    print(f"{len(sentences)} sentences, {len(items)} items, {elapsed / max(1, len(items)) * 1e6:.1f} us/item, "
+          f"{len(reproduced)} of {len(mistakes)} hand-written mistakes reproduced", file=sys.stderr)
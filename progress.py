@@ -0,0 +1,283 @@
+import atexit
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger("progress")
+
+# ============================================
+# 学習者ごとの解答記録とスコア
+# ============================================
+# 解答は追記だけのログ（progress_log）に残し、日ごと・全期間の集計
+# （progress_daily / progress_total）も同じトランザクションで更新する。
+# スコアの表示は集計の1行を読むだけで、ログは数え直さない
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS progress_log (
+    learner_id TEXT NOT NULL,
+    answered_at REAL NOT NULL,
+    mode TEXT NOT NULL,
+    item_id TEXT NOT NULL,
+    correct INTEGER NOT NULL,
+    latency_ms INTEGER
+);
+CREATE TABLE IF NOT EXISTS progress_daily (
+    learner_id TEXT NOT NULL,
+    day TEXT NOT NULL,
+    correct INTEGER NOT NULL,
+    total INTEGER NOT NULL,
+    PRIMARY KEY (learner_id, day)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS progress_total (
+    learner_id TEXT PRIMARY KEY,
+    correct INTEGER NOT NULL,
+    total INTEGER NOT NULL,
+    last_answered_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS learner_state (
+    learner_id TEXT NOT NULL,
+    key TEXT NOT NULL,
+    saved_at REAL NOT NULL,
+    value BLOB NOT NULL,
+    PRIMARY KEY (learner_id, key)
+) WITHOUT ROWID;
+"""
+
+_UPSERT_DAILY = (
+    "INSERT INTO progress_daily VALUES (?, ?, ?, ?)"
+    " ON CONFLICT (learner_id, day) DO UPDATE SET"
+    " correct = correct + excluded.correct, total = total + excluded.total"
+)
+_UPSERT_TOTAL = (
+    "INSERT INTO progress_total VALUES (?, ?, ?, ?)"
+    " ON CONFLICT (learner_id) DO UPDATE SET"
+    " correct = correct + excluded.correct, total = total + excluded.total,"
+    " last_answered_at = max(last_answered_at, excluded.last_answered_at)"
+)
+
+
+class Score:
+    __slots__ = ("day", "today_correct", "today_total", "correct", "total")
+
+    def __init__(self, day, today_correct=0, today_total=0, correct=0, total=0):
+        self.day = day
+        self.today_correct = today_correct
+        self.today_total = today_total
+        self.correct = correct
+        self.total = total
+
+    def add(self, day, correct):
+        if day != self.day:
+            self.day, self.today_correct, self.today_total = day, 0, 0
+        self.today_correct += int(correct)
+        self.today_total += 1
+        self.correct += int(correct)
+        self.total += 1
+
+
+class ProgressStore:
+    """解答の記録。record() はメモリにためるだけで、スレッドがまとめてSQLiteに書く。
+
+    スコアは学習者ごとにメモリに持ち、初めて使う時だけ集計テーブルから1行ずつ読む。
+    日付の区切りは utc_offset_hours の時差で決める。
+    """
+
+    def __init__(self, db_path, flush_interval=1.0, batch_size=500, utc_offset_hours=8,
+                 max_cached_learners=10000):
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.utc_offset = utc_offset_hours * 3600
+        self.max_cached_learners = max_cached_learners
+        # 書き込み用と読み取り用で接続を分ける（WALなので読み取りは書き込みを待たない）
+        self._db = self._connect(db_path)
+        self._db.executescript(_SCHEMA)
+        self._db.commit()
+        self._reader = self._connect(db_path)
+        self._reader_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._cond = threading.Condition()
+        self._log = []
+        self._deltas = {}  # (learner_id, day) -> [正解数, 解答数, 最後の時刻]
+        # 書き出し中でまだコミットしていない分と、コミットした回数
+        self._flushing = {}
+        self._generation = 0
+        self._scores = OrderedDict()  # learner_id -> Score（古いものから捨てる）
+        self.stats = {"recorded": 0, "flushed": 0, "flushes": 0, "loads": 0, "state_saves": 0, "state_loads": 0,
+                      "flush_errors": 0}
+        threading.Thread(target=self._run, name="progress-writer", daemon=True).start()
+        # 終了時に残りを書き出す
+        atexit.register(self.flush)
+
+    @staticmethod
+    def _connect(db_path):
+        db = sqlite3.connect(db_path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        # 同じファイルを使う SRSStore や別プロセスと書き込みが重なった時は待つ
+        db.execute("PRAGMA busy_timeout=5000")
+        return db
+
+    def day_of(self, timestamp):
+        return time.strftime("%Y-%m-%d", time.gmtime(timestamp + self.utc_offset))
+
+    # ---------- スコア ----------
+    def _score(self, learner_id, day):
+        with self._cond:
+            score = self._scores.get(learner_id)
+            if score is not None:
+                self._scores.move_to_end(learner_id)
+                return score
+        while True:
+            with self._cond:
+                generation = self._generation
+            with self._reader_lock:
+                today = self._reader.execute(
+                    "SELECT correct, total FROM progress_daily WHERE learner_id = ? AND day = ?",
+                    (learner_id, day),
+                ).fetchone() or (0, 0)
+                total = self._reader.execute(
+                    "SELECT correct, total FROM progress_total WHERE learner_id = ?", (learner_id,)
+                ).fetchone() or (0, 0)
+            with self._cond:
+                # 読んでいる間にコミットされたら、どこまで含まれているかわからないので読み直す
+                if self._generation != generation:
+                    continue
+                self.stats["loads"] += 1
+                score = self._scores.get(learner_id)
+                if score is not None:
+                    return score
+                score = Score(day, today[0], today[1], total[0], total[1])
+                # まだコミットしていない分を足す（メモリから捨てた学習者を読み直した時）
+                for deltas in (self._flushing, self._deltas):
+                    for (pending_learner, pending_day), (correct, count, _) in deltas.items():
+                        if pending_learner == learner_id:
+                            score.correct += correct
+                            score.total += count
+                            if pending_day == day:
+                                score.today_correct += correct
+                                score.today_total += count
+                self._scores[learner_id] = score
+                while len(self._scores) > self.max_cached_learners:
+                    self._scores.popitem(last=False)
+                return score
+
+    def scores(self, learner_id, now=None):
+        """(今日の正解数, 今日の解答数, 全期間の正解数, 全期間の解答数)"""
+        day = self.day_of(time.time() if now is None else now)
+        score = self._score(learner_id, day)
+        with self._cond:
+            if score.day != day:
+                return 0, 0, score.correct, score.total
+            return score.today_correct, score.today_total, score.correct, score.total
+
+    # ---------- 記録 ----------
+    def record(self, learner_id, mode, item_id, correct, latency=None, now=None):
+        """latency は問題を出してから答えるまでの秒数（わからなければ None）。"""
+        now = time.time() if now is None else now
+        day = self.day_of(now)
+        score = self._score(learner_id, day)
+        with self._cond:
+            score.add(day, correct)
+            self._log.append((
+                learner_id, now, mode, str(item_id), int(correct),
+                None if latency is None else int(latency * 1000),
+            ))
+            delta = self._deltas.setdefault((learner_id, day), [0, 0, now])
+            delta[0] += int(correct)
+            delta[1] += 1
+            delta[2] = now
+            self.stats["recorded"] += 1
+            if len(self._log) >= self.batch_size:
+                self._cond.notify()
+
+    def pending(self):
+        with self._cond:
+            return len(self._log)
+
+    # ---------- セッションから退避した状態 ----------
+    def save_state(self, learner_id, values, now=None):
+        """{key: bytes} を学習者ごとに保存する（同じ key は上書き）。たまにしか呼ばれないのですぐ書く。"""
+        now = time.time() if now is None else now
+        with self._flush_lock, self._db:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO learner_state VALUES (?, ?, ?, ?)",
+                [(learner_id, key, now, value) for key, value in values.items()],
+            )
+        with self._cond:
+            self.stats["state_saves"] += 1
+
+    def load_state(self, learner_id):
+        """save_state() で保存した {key: bytes}。なければ空の dict。"""
+        with self._reader_lock:
+            rows = self._reader.execute(
+                "SELECT key, value FROM learner_state WHERE learner_id = ?", (learner_id,)
+            ).fetchall()
+        with self._cond:
+            self.stats["state_loads"] += 1
+        return dict(rows)
+
+    def flush(self):
+        with self._flush_lock:
+            with self._cond:
+                log, deltas = self._log, self._deltas
+                self._log, self._deltas = [], {}
+                self._flushing = deltas
+            if not log:
+                with self._cond:
+                    self._flushing = {}
+                return
+            try:
+                self._write(log, deltas)
+                # コミットと _flushing を空にするのを _cond の中で一緒にする。間があくと、
+                # _score() がコミット済みの行と _flushing の両方を同じ世代として数えてしまう
+                with self._cond:
+                    self._db.commit()
+                    self._flushing = {}
+                    self._generation += 1
+                    self.stats["flushed"] += len(log)
+                    self.stats["flushes"] += 1
+            except BaseException:
+                self._db.rollback()
+                # 書けなかった分は先頭に戻す（次の flush で書き直す。スコアにも数えたまま）
+                with self._cond:
+                    self._flushing = {}
+                    self._log[:0] = log
+                    for key, (correct, count, last) in deltas.items():
+                        delta = self._deltas.setdefault(key, [0, 0, last])
+                        delta[0] += correct
+                        delta[1] += count
+                        delta[2] = max(delta[2], last)
+                    self.stats["flush_errors"] += 1
+                raise
+
+    def _write(self, log, deltas):
+        """ログと集計を書く（コミットは flush() でする）。"""
+        totals = {}
+        for (learner_id, _), (correct, count, last) in deltas.items():
+            total = totals.setdefault(learner_id, [0, 0, last])
+            total[0] += correct
+            total[1] += count
+            total[2] = max(total[2], last)
+        self._db.executemany("INSERT INTO progress_log VALUES (?, ?, ?, ?, ?, ?)", log)
+        self._db.executemany(_UPSERT_DAILY, [
+            (learner_id, day, correct, count)
+            for (learner_id, day), (correct, count, _) in deltas.items()
+        ])
+        self._db.executemany(_UPSERT_TOTAL, [
+            (learner_id, correct, count, last) for learner_id, (correct, count, last) in totals.items()
+        ])
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait(timeout=self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                # DBがロックされている・ディスクがいっぱいなど。解答は残っているので次の回にまた書く
+                logger.exception("progress flush failed; %d answers kept for the next try", self.pending())
@@ -0,0 +1,158 @@
+import math
+import threading
+from collections import deque
+
+import metrics
+
+# ============================================
+# プロンプトのテンプレートと出力トークンの予算
+# ============================================
+# どのテンプレートも同じ system メッセージで始める。先頭が1バイトも変わらないので
+# プロバイダ側のプレフィックスキャッシュが全ての呼び出しで効く。
+# テンプレートごとの指示（固定）→ 変わる部分（user メッセージ）の順に並べる
+SYSTEM_PREFIX = """あなたは中国の小学生に日本語を教える優しい先生で、日本語の教材も作ります。
+- 読み方はひらがなで書く
+- 中国語は簡体字で書き、ピンインを付ける
+- 小学生にもわかる短い言葉で、指定された形式だけで答える（前置きやまとめは書かない）"""
+
+# max_tokens を実測から決めるのに必要な件数・使う分位点・余裕
+MIN_SAMPLES = 20
+BUDGET_QUANTILE = 0.99
+BUDGET_HEADROOM = 1.25
+MAX_SAMPLES = 512
+
+TEMPLATE_TOKENS = metrics.REGISTRY.add(metrics.Counter(
+    "llm_template_tokens_total", "Tokens by prompt template (cached = prompt tokens served from the provider's prefix cache).",
+    ("template", "type"),
+))
+TEMPLATE_TRUNCATED = metrics.REGISTRY.add(metrics.Counter(
+    "llm_template_truncated_total", "Responses cut off by max_tokens (finish_reason=length).", ("template",),
+))
+
+# テンプレート名 -> PromptTemplate（作った時に登録される）
+LEDGER = {}
+
+
+def quantile(values, q):
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+class PromptTemplate:
+    """1種類のLLM呼び出し。request() が chat.completions.create の引数を作る。
+
+    max_tokens は1単位（1回答・1問）あたりの出力トークン数の p99 に余裕を足したもの。
+    実測が MIN_SAMPLES 件たまるまでは unit_tokens を使う。途中で切れた応答は
+    予算が足りなかった印として2倍の値で記録し、そのあと MIN_SAMPLES 回は p99 ではなく
+    最大値を使う（1回の切れ方で確実に予算が増える）。
+    """
+
+    def __init__(self, name, instructions, user, temperature=0.7, unit_tokens=256, overhead_tokens=0,
+                 min_tokens=64, max_tokens=4096):
+        self.name = name
+        self.system = f"{SYSTEM_PREFIX}\n\n{instructions}"
+        self.user = user
+        self.temperature = temperature
+        self.unit_tokens = unit_tokens
+        self.overhead_tokens = overhead_tokens
+        self.min_tokens = min_tokens
+        self.max_tokens = max_tokens
+        self._lock = threading.Lock()
+        self._samples = deque(maxlen=MAX_SAMPLES)
+        self._truncated_at = None  # 最後に切れた時の calls
+        self.stats = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0, "truncated": 0}
+        LEDGER[name] = self
+
+    def unit_budget(self):
+        with self._lock:
+            samples = list(self._samples)
+            growing = self._truncated_at is not None and self.stats["calls"] - self._truncated_at < MIN_SAMPLES
+        if growing:
+            return math.ceil(max(samples) * BUDGET_HEADROOM)
+        if len(samples) < MIN_SAMPLES:
+            return self.unit_tokens
+        return math.ceil(quantile(samples, BUDGET_QUANTILE) * BUDGET_HEADROOM)
+
+    def token_limit(self, units=1):
+        limit = self.overhead_tokens + units * self.unit_budget()
+        return max(self.min_tokens, min(self.max_tokens, limit))
+
+    def request(self, model, units=1, **fields):
+        return dict(
+            model=model,
+            messages=[
+                {"role": "system", "content": self.system},
+                {"role": "user", "content": self.user.format(**fields)},
+            ],
+            temperature=self.temperature,
+            max_tokens=self.token_limit(units),
+        )
+
+    def observe(self, usage, finish_reason=None, units=1):
+        """応答1回分の usage を記録する（usage がなければ何もしない）。"""
+        if usage is None:
+            return
+        prompt = getattr(usage, "prompt_tokens", 0) or 0
+        completion = getattr(usage, "completion_tokens", 0) or 0
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = getattr(details, "cached_tokens", 0) or 0
+        truncated = finish_reason == "length"
+        per_unit = max(0, completion - self.overhead_tokens) / max(1, units)
+        with self._lock:
+            self._samples.append(per_unit * 2 if truncated else per_unit)
+            self.stats["calls"] += 1
+            self.stats["prompt_tokens"] += prompt
+            self.stats["completion_tokens"] += completion
+            self.stats["cached_tokens"] += cached
+            self.stats["truncated"] += int(truncated)
+            if truncated:
+                self._truncated_at = self.stats["calls"]
+        TEMPLATE_TOKENS.inc(prompt, template=self.name, type="prompt")
+        TEMPLATE_TOKENS.inc(completion, template=self.name, type="completion")
+        TEMPLATE_TOKENS.inc(cached, template=self.name, type="cached")
+        if truncated:
+            TEMPLATE_TRUNCATED.inc(template=self.name)
+
+    def summary(self):
+        with self._lock:
+            stats = dict(self.stats)
+            samples = list(self._samples)
+        calls = stats["calls"] or 1
+        return {
+            "template": self.name,
+            "calls": stats["calls"],
+            "prompt_avg": round(stats["prompt_tokens"] / calls, 1),
+            "completion_avg": round(stats["completion_tokens"] / calls, 1),
+            "unit_p99": quantile(samples, BUDGET_QUANTILE) if samples else None,
+            "max_tokens": self.token_limit(),
+            "cached_ratio": round(stats["cached_tokens"] / (stats["prompt_tokens"] or 1), 3),
+            "truncated": stats["truncated"],
+        }
+
+
+metrics.register_gauge(
+    "llm_template_max_tokens", "Current max_tokens for one unit of each prompt template.",
+    lambda: {name: template.token_limit() for name, template in LEDGER.items()}, label="template",
+)
+
+
+# ============================================
+# AIチューター（クイズ・間違い探しのテンプレートは quiz_gen.py）
+# ============================================
+TUTOR = PromptTemplate(
+    "tutor",
+    """漢字・熟語を1つ受け取り、次の4行だけで答える:
+📖 読み方: （ひらがな）
+🇨🇳 中国語の意味: （簡体字、ピンイン付き）
+📝 例文: （簡単な日本語の例文を1つ）
+💡 覚え方のコツ: （中国語との関連や覚えやすいヒント）""",
+    "「{word}」",
+    unit_tokens=320,
+)
+TUTOR_HINT = PromptTemplate(
+    "tutor_hint",
+    """単語と読み方・中国語の意味を受け取り、次の1行だけで答える:
+💡 覚え方のコツ: （中国語との関連や覚えやすいヒント）""",
+    "「{word}」（読み方: {reading}、中国語の意味: {meaning_chinese}）",
+    unit_tokens=160,
+)
@@ -0,0 +1,326 @@
+import json
+import logging
+import re
+import threading
+import unicodedata
+
+from distractors import make_distractors
+from llm_stream import complete_chat
+from prompts import PromptTemplate
+
+logger = logging.getLogger("llm")
+
+
+# ============================================
+# クイズの形のチェックと修復
+# ============================================
+QUIZ_FIELDS = ("word", "correct_reading", "wrong_readings", "meaning_chinese", "example")
+WRONG_READINGS = 3
+MAX_WORD_LENGTH = 12
+_READING = re.compile(r"[ぁ-ゖー]+")  # ひらがなと長音符だけ
+_LIST_SEPARATOR = re.compile(r"[、,，/\s]+")
+
+
+def _text(value):
+    if not isinstance(value, str):
+        return None
+    value = unicodedata.normalize("NFKC", value).strip()
+    return value or None
+
+
+def _reading(value):
+    # カタカナで返ってきた読みはひらがなに直す
+    value = _text(value)
+    if value is None:
+        return None
+    return "".join(chr(ord(c) - 0x60) if "ァ" <= c <= "ヶ" else c for c in value)
+
+
+def validate_quiz(item):
+    """1問分をチェックし、直せるところは直す。(quiz, 問題点のリスト) を返す。
+
+    直せない時は quiz が None。誤答は重複と正解を除いて3つちょうどにそろえ、
+    足りない分は distractors の規則で補う（モデルに頼み直さない）。
+    """
+    if not isinstance(item, dict):
+        return None, ["not an object"]
+    problems = []
+    word = _text(item.get("word"))
+    if word is None or len(word) > MAX_WORD_LENGTH:
+        problems.append("word")
+    correct = _reading(item.get("correct_reading"))
+    if correct is None or not _READING.fullmatch(correct):
+        problems.append("correct_reading")
+
+    wrong = item.get("wrong_readings")
+    if isinstance(wrong, str):
+        wrong = _LIST_SEPARATOR.split(wrong)
+    wrong_readings = []
+    for value in wrong if isinstance(wrong, list) else []:
+        value = _reading(value)
+        if value and _READING.fullmatch(value) and value != correct and value not in wrong_readings:
+            wrong_readings.append(value)
+    if word is not None and correct is not None and len(wrong_readings) < WRONG_READINGS:
+        wrong_readings += make_distractors(
+            word, correct, WRONG_READINGS - len(wrong_readings), exclude=wrong_readings
+        )
+    if len(wrong_readings) < WRONG_READINGS:
+        problems.append("wrong_readings")
+
+    meaning = _text(item.get("meaning_chinese"))
+    if meaning is None:
+        problems.append("meaning_chinese")
+    example = _text(item.get("example"))
+    if example is None:
+        problems.append("example")
+    if problems:
+        return None, problems
+    return {
+        "word": word,
+        "correct_reading": correct,
+        "wrong_readings": wrong_readings[:WRONG_READINGS],
+        "meaning_chinese": meaning,
+        "example": example,
+    }, []
+
+
+def extract_json(text):
+    """モデルの出力からJSONを取り出す。JSONモードならそのまま読めるはず。
+
+    読めない時は ```json ... ``` や前後の説明文を取り除いて、最初の { から
+    最後の } までを読む。それでもだめなら None。
+    """
+    text = text.strip()
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+    text = re.sub(r"```(?:json)?\s*", "", text)
+    start = text.find("{")
+    end = text.rfind("}")
+    if start == -1 or end == -1:
+        return None
+    try:
+        return json.loads(text[start:end + 1])
+    except ValueError:
+        return None
+
+
+# ============================================
+# 間違い探しの問題のチェック
+# ============================================
+MISTAKE_TAGS = ("particle", "i-adjective", "na-adjective", "masu-form", "verb-form", "kanji")
+
+
+def validate_mistake(item):
+    """間違い探し1問分をチェックする。(item, 問題点のリスト) を返す。
+
+    mistake は sentence の中にちょうど1回出てくること（答え合わせがぶれないように）。
+    """
+    if not isinstance(item, dict):
+        return None, ["not an object"]
+    problems = []
+    sentence = _text(item.get("sentence"))
+    mistake = _text(item.get("mistake"))
+    correct = _text(item.get("correct"))
+    explanation = _text(item.get("explanation"))
+    if sentence is None:
+        problems.append("sentence")
+    if mistake is None or sentence is None or sentence.count(mistake) != 1:
+        problems.append("mistake")
+    if correct is None or correct == mistake:
+        problems.append("correct")
+    if explanation is None:
+        problems.append("explanation")
+    if problems:
+        return None, problems
+    tag = _text(item.get("tag"))
+    return {
+        "sentence": sentence,
+        "mistake": mistake,
+        "correct": correct,
+        "explanation": explanation,
+        "tags": [tag] if tag in MISTAKE_TAGS else [],
+    }, []
+
+
+# ============================================
+# プロンプト
+# ============================================
+QUIZ_LEVEL_DESC = {
+    "かんたん": "小学1-2年生レベルの簡単な漢字（日、月、火、水、山、川など）",
+    "ふつう": "小学3-4年生レベルの漢字（勉強、学校、友達など）",
+    "むずかしい": "小学5-6年生レベルの漢字（経済、政治、環境など）"
+}
+# コンテンツに入れる時の学年（難易度の範囲の下の学年）
+LEVEL_GRADES = {"かんたん": 1, "ふつう": 3, "むずかしい": 5}
+
+
+# 共通の system メッセージ（prompts.SYSTEM_PREFIX）のあとに付く固定の指示。
+# 変わる部分（難易度・個数・避ける語）は user メッセージに入れる
+_QUIZ_ITEM = '{"word": "熟語", "correct_reading": "正しい読み方", "wrong_readings": ["間違い1", "間違い2", "間違い3"], ' \
+    '"meaning_chinese": "中国語の意味（ピンイン付き）", "example": "例文"}'
+
+QUIZ = PromptTemplate(
+    "quiz",
+    f"""熟語の読み方クイズを作る。wrong_readings は正しい読み方と違う3つの読み方。
+次のJSONだけで答える:
+{_QUIZ_ITEM}""",
+    "{level}から1つの熟語を選んでください。",
+    unit_tokens=200,
+)
+QUIZ_BATCH = PromptTemplate(
+    "quiz_batch",
+    f"""熟語の読み方クイズをいくつか作る。熟語はすべて異なるものにし、wrong_readings は正しい読み方と違う3つの読み方。
+次のJSONだけで答える:
+{{"quizzes": [{_QUIZ_ITEM}]}}""",
+    "{level}から{count}個の熟語を選んでください。\n次の熟語は使わないでください: {avoid}",
+    unit_tokens=120,
+    overhead_tokens=16,
+)
+MISTAKE_BATCH = PromptTemplate(
+    "mistake_batch",
+    f"""短い日本語の文を作り、それぞれに中国人の生徒がしやすい間違いを1か所だけ入れる。
+mistake は sentence の中の間違っている部分をそのまま抜き出したもの、correct はそこを直したもの。
+explanation は中国語（簡体字）で短く書く。tag は {"、".join(MISTAKE_TAGS)} のどれか。
+次のJSONだけで答える:
+{{"mistakes": [{{"sentence": "間違いを含む文", "mistake": "間違っている部分", "correct": "正しい形", "explanation": "説明（中国語）", "tag": "particle"}}]}}""",
+    "{level}を使った文を{count}個作ってください。\n次の文とは違う文にしてください:\n{avoid}",
+    temperature=0.8,
+    unit_tokens=150,
+    overhead_tokens=16,
+)
+
+
+def quiz_request(model, difficulty):
+    return QUIZ.request(model, level=QUIZ_LEVEL_DESC[difficulty])
+
+
+def quiz_batch_request(model, difficulty, count, avoid_words):
+    avoid = "、".join(avoid_words) if avoid_words else "なし"
+    return QUIZ_BATCH.request(model, units=count, level=QUIZ_LEVEL_DESC[difficulty], count=count, avoid=avoid)
+
+
+def mistake_batch_request(model, difficulty, count, avoid_sentences):
+    avoid = "\n".join(avoid_sentences) if avoid_sentences else "なし"
+    return MISTAKE_BATCH.request(model, units=count, level=QUIZ_LEVEL_DESC[difficulty], count=count, avoid=avoid)
+
+
+# ============================================
+# まとめて生成し、足りない分だけ頼み直す
+# ============================================
+class QuizGenerator:
+    """N問を1回の呼び出しで作り、形が正しい問題だけを返す。
+
+    build_request(level, count, avoid) は chat.completions.create に渡す引数のdict。
+    JSONモード（response_format）で頼み、壊れていた問題の数だけを max_retries 回まで
+    頼み直す。それでも足りなければ、そろった分だけ返す。間違い探しなど別の種類も
+    validate・container（応答のリストのキー）・key（重複を見るフィールド）を変えて使う。
+    template を渡すと、応答のトークン数を1問あたりでそのテンプレートの記録に入れる。
+    """
+
+    def __init__(self, client, build_request, json_mode=True, max_retries=2,
+                 validate=validate_quiz, container="quizzes", key="word", label="quiz_batch", template=None):
+        self.client = client
+        self.build_request = build_request
+        self.template = template
+        self.json_mode = json_mode
+        self.max_retries = max_retries
+        self.validate = validate
+        self.container = container
+        self.key = key
+        self.label = label
+        self._lock = threading.Lock()
+        self._stats = {
+            "calls": 0, "retries": 0, "parse_failures": 0, "tokens": 0,
+            "items_requested": 0, "items_valid": 0, "items_invalid": 0, "duplicates": 0,
+        }
+
+    def _count(self, **values):
+        with self._lock:
+            for key, value in values.items():
+                self._stats[key] += value
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        calls = stats["calls"] or 1
+        items = stats["items_valid"] + stats["items_invalid"] or 1
+        stats["parse_failure_rate"] = stats["parse_failures"] / calls
+        stats["retry_rate"] = stats["retries"] / calls
+        stats["invalid_item_rate"] = stats["items_invalid"] / items
+        return stats
+
+    def record(self, parsed, valid):
+        """ストリーミングで1問作った結果も同じ統計に入れる。"""
+        self._count(
+            calls=1, items_requested=1, parse_failures=0 if parsed else 1,
+            items_valid=1 if valid else 0, items_invalid=0 if valid or not parsed else 1,
+        )
+
+    def _kwargs(self, level, count, avoid):
+        kwargs = self.build_request(level, count, avoid)
+        if self.json_mode:
+            kwargs["response_format"] = {"type": "json_object"}
+        return kwargs
+
+    def _items(self, text):
+        data = extract_json(text)
+        if isinstance(data, dict) and isinstance(data.get(self.container), list):
+            return data[self.container]
+        if isinstance(data, dict) and self.key in data:
+            return [data]  # 1問だけ頼んだ時にリストで包まずに返すことがある
+        self._count(parse_failures=1)
+        logger.warning("%s unparsable response (%d chars)", self.label, len(text))
+        return []
+
+    def _accept(self, items, accepted, seen, count):
+        invalid = duplicates = 0
+        for item in items:
+            item, problems = self.validate(item)
+            if item is None:
+                invalid += 1
+                logger.info("%s invalid item: %s", self.label, ",".join(problems))
+            elif item[self.key] in seen:
+                duplicates += 1
+            elif len(accepted) < count:
+                seen.add(item[self.key])
+                accepted.append(item)
+        self._count(items_invalid=invalid, duplicates=duplicates)
+
+    def generate(self, level, count, avoid_words=(), seen=None):
+        """avoid_words はプロンプトに書く語、seen は重複とみなす語の集合（省略時は avoid_words）。"""
+        accepted = []
+        seen = set(avoid_words) if seen is None else seen
+        avoid = list(avoid_words)
+        for attempt in range(self.max_retries + 1):
+            missing = count - len(accepted)
+            if missing <= 0:
+                break
+            self._count(calls=1, retries=1 if attempt else 0, items_requested=missing)
+            kwargs = self._kwargs(level, missing, avoid + [item[self.key] for item in accepted])
+            # 安全フィルタなどで本文がない（None）応答もある。読めなかった応答として頼み直す
+            text = complete_chat(self.client, self.label, self.template, missing, **kwargs) or ""
+            self._accept(self._items(text), accepted, seen, count)
+        self._count(items_valid=len(accepted))
+        return accepted
+
+    async def agenerate(self, level, count, avoid_words=(), seen=None):
+        """generate の asyncio 版。client は AsyncGroq。使ったトークン数も数える。"""
+        accepted = []
+        seen = set(avoid_words) if seen is None else seen
+        avoid = list(avoid_words)
+        for attempt in range(self.max_retries + 1):
+            missing = count - len(accepted)
+            if missing <= 0:
+                break
+            self._count(calls=1, retries=1 if attempt else 0, items_requested=missing)
+            kwargs = self._kwargs(level, missing, avoid + [item[self.key] for item in accepted])
+            response = await self.client.chat.completions.create(**kwargs)
+            if response.usage is not None:
+                self._count(tokens=response.usage.total_tokens)
+            if self.template is not None:
+                self.template.observe(response.usage, response.choices[0].finish_reason, missing)
+            self._accept(self._items(response.choices[0].message.content or ""), accepted, seen, count)
+        self._count(items_valid=len(accepted))
+        return accepted
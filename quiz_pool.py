@@ -0,0 +1,122 @@
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger("llm")
+
+
+# ============================================
+# 難易度ごとの事前生成クイズプール
+# ============================================
+class QuizPool:
+    """難易度ごとに出題待ちのクイズを貯めておくプロセス共通のプール。
+
+    generate_batch(level, count, avoid_words) はクイズのdictのリストを返す関数。
+    どれかの難易度が low_water を下回るとバックグラウンドのスレッドが
+    target まで補充する。同じ word はプール内で重複させない。
+    """
+
+    def __init__(self, generate_batch, levels, low_water=3, target=8,
+                 batch_size=4, recent_limit=200):
+        self.generate_batch = generate_batch
+        self.levels = list(levels)
+        self.low_water = low_water
+        self.target = target
+        self.batch_size = batch_size
+        self._pools = {level: deque() for level in self.levels}
+        # 最近出した単語（補充時に同じ単語を頼まないため）
+        self._recent = {level: deque(maxlen=recent_limit) for level in self.levels}
+        self._filling = set()
+        self._cond = threading.Condition()
+        self._thread = None
+        self.stats = {"served": 0, "empty": 0, "generated": 0, "duplicates": 0, "errors": 0}
+
+    def start(self):
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="quiz-pool", daemon=True
+                )
+                self._thread.start()
+        return self
+
+    def size(self, level):
+        with self._cond:
+            return len(self._pools[level])
+
+    def pop(self, level, seen_words=()):
+        """まだ見ていない単語のクイズを1つ取り出す。なければ None。"""
+        with self._cond:
+            pool = self._pools[level]
+            quiz = None
+            for i, candidate in enumerate(pool):
+                if candidate["word"] not in seen_words:
+                    quiz = candidate
+                    del pool[i]
+                    break
+            if quiz is None:
+                self.stats["empty"] += 1
+            else:
+                self.stats["served"] += 1
+                self._recent[level].append(quiz["word"])
+            if len(pool) < self.low_water:
+                self._cond.notify()
+            return quiz
+
+    def add(self, level, quizzes):
+        with self._cond:
+            pool = self._pools[level]
+            words = {quiz["word"] for quiz in pool}
+            added = 0
+            for quiz in quizzes:
+                if quiz["word"] in words:
+                    self.stats["duplicates"] += 1
+                    continue
+                words.add(quiz["word"])
+                pool.append(quiz)
+                added += 1
+            self.stats["generated"] += added
+            return added
+
+    # ---------- バックグラウンド補充 ----------
+    def _needs_refill(self, level):
+        # low_water を割ったら、target まで埋まるまで続けて補充する
+        size = len(self._pools[level])
+        return size < self.low_water or (level in self._filling and size < self.target)
+
+    def _next_level(self):
+        # 一番足りていない難易度から補充する
+        for level in sorted(self.levels, key=lambda lv: len(self._pools[lv])):
+            if self._needs_refill(level):
+                return level
+        return None
+
+    def _run(self):
+        backoff = 1.0
+        while True:
+            with self._cond:
+                level = self._next_level()
+                while level is None:
+                    self._cond.wait()
+                    level = self._next_level()
+                self._filling.add(level)
+                count = min(self.batch_size, self.target - len(self._pools[level]))
+                avoid = {quiz["word"] for quiz in self._pools[level]}
+                avoid.update(self._recent[level])
+            try:
+                added = self.add(level, self.generate_batch(level, count, sorted(avoid)))
+            except Exception:
+                logger.exception("quiz pool refill failed (level=%s)", level)
+                with self._cond:
+                    self.stats["errors"] += 1
+                added = 0
+            with self._cond:
+                if len(self._pools[level]) >= self.target:
+                    self._filling.discard(level)
+            if added:
+                backoff = 1.0
+            else:
+                # APIが落ちている・重複しか返ってこない間に叩き続けないよう待つ
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 60.0)
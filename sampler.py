@@ -0,0 +1,215 @@
+import heapq
+import random
+import struct
+import sys
+from array import array
+
+# ============================================
+# 重み付きの出題順（フェニック木）
+# ============================================
+# 重みは整数で持つ（足し引きしても誤差が出ない）。BASE_WEIGHT がふつうの問題の重み
+BASE_WEIGHT = 4
+# 前に出してから1周分（size 問）以上たった問題・まだ出していない問題に足す重み。
+# 間が短いほど少なくなる
+STALE_WEIGHT = BASE_WEIGHT
+# 間違えた回数・答えた回数は1バイトで持ち、あふれる前に両方を半分にする（割合は変わらない）
+MAX_COUNT = 255
+# dumps() の形式を変えたら上げる（古い形式は読まずに新しく始める）
+STATE_VERSION = 1
+_HEADER = struct.Struct("<BIIdII")  # 形式, size, cooldown, error_boost, draws, rounds
+# 戻す予定1つ分（4つの整数のタプル）の大きさ
+_WAITING_BYTES = sys.getsizeof((0, 0, 0, 0)) + 4 * sys.getsizeof(2**20)
+
+
+class FenwickTree:
+    """重みの累積和の木。1つの重みの変更と、累積和からの位置の検索が O(log n)。
+
+    各位置の重みは木から計算できるので、別の配列は持たない（1問あたり4バイト）。
+    """
+
+    def __init__(self, weights):
+        self.size = len(weights)
+        self._tree = array("i", [0]) + array("i", weights)
+        # O(n) で作る
+        for i in range(1, self.size + 1):
+            parent = i + (i & -i)
+            if parent <= self.size:
+                self._tree[parent] += self._tree[i]
+        self._top = 1 << (self.size.bit_length() - 1) if self.size else 0
+
+    @classmethod
+    def frombytes(cls, data):
+        """tobytes() で書き出した木をそのまま読む（作り直さない）。"""
+        tree = cls([])
+        tree._tree = array("i")
+        tree._tree.frombytes(data)
+        tree.size = len(tree._tree) - 1
+        tree._top = 1 << (tree.size.bit_length() - 1) if tree.size else 0
+        return tree
+
+    def tobytes(self):
+        return self._tree.tobytes()
+
+    def add(self, position, delta):
+        i = position + 1
+        while i <= self.size:
+            self._tree[i] += delta
+            i += i & -i
+
+    def prefix(self, end):
+        """位置 0..end-1 の重みの合計。"""
+        total = 0
+        while end > 0:
+            total += self._tree[end]
+            end -= end & -end
+        return total
+
+    def total(self):
+        return self.prefix(self.size)
+
+    def weight(self, position):
+        return self.prefix(position + 1) - self.prefix(position)
+
+    def find(self, value):
+        """累積和が value を超える最初の位置（0 <= value < total()）。"""
+        position = 0
+        step = self._top
+        while step:
+            next_position = position + step
+            if next_position <= self.size and self._tree[next_position] <= value:
+                position = next_position
+                value -= self._tree[next_position]
+            step >>= 1
+        return position
+
+
+class AdaptiveSampler:
+    """1セッション分の出題順。問題は 0..size-1 の位置で扱う。
+
+    出した問題の重みを0にし、正解した問題は1周のあいだもう出さない。間違えた問題だけは
+    同じ周のうちに、cooldown 問あとに半分の重みで、2*cooldown 問あとに間違えた率に応じた重みで戻る。
+    全部出し終わったら次の周を始める（直前 cooldown 問に出したものは除く）。
+    重みは 基本 + 間違えた率の分 + 前に出してからの間の分。間の分は重みを置く時
+    （周の始めと間違えた問題を戻す時）に決め、木に入れたあとは増やさない
+    （毎回全部の重みを増やすと O(n) かかる）。
+    1回の出題は O(log n)、周の切り替えだけ O(n)（n 問に1回なので平均 O(1)）。
+    問題ごとの記録は配列に持つ（1問あたり10バイト。セッションに入れても大きくならない）。
+    rng を渡さなければ random モジュールの共有の乱数を使う。
+    """
+
+    def __init__(self, size, cooldown=5, error_boost=3.0, rng=None):
+        self.size = size
+        # 問題が少ない時でも、周の始めに半分は出せるようにする
+        self.cooldown = max(0, min(cooldown, size // 2))
+        self.error_boost = error_boost
+        self.rng = rng or random
+        self.tree = FenwickTree([BASE_WEIGHT + STALE_WEIGHT] * size)
+        self.draws = 0
+        self.rounds = 1
+        self.last_seen = array("I", bytes(4 * size))  # 位置 -> 出した時の draws（0 はまだ出していない）
+        self.misses = array("B", bytes(size))  # 位置 -> 間違えた回数
+        self.attempts = array("B", bytes(size))  # 位置 -> 答えた回数
+        self._waiting = []  # (戻す draws, 段階, 位置, 出した時の draws)
+
+    def _set(self, position, weight):
+        self.tree.add(position, weight - self.tree.weight(position))
+
+    def approx_bytes(self):
+        """おおよそのバイト数（配列の大きさと戻す予定の数から。中身はたどらない）。"""
+        return (sys.getsizeof(self) + sys.getsizeof(vars(self)) + sys.getsizeof(self.tree._tree)
+                + sys.getsizeof(self.last_seen) + sys.getsizeof(self.misses) + sys.getsizeof(self.attempts)
+                + sys.getsizeof(self._waiting) + len(self._waiting) * _WAITING_BYTES)
+
+    def error_rate(self, position):
+        return self.misses[position] / (self.attempts[position] + 1)
+
+    def _stale_weight(self, position):
+        seen_at = self.last_seen[position]
+        if not seen_at:
+            return STALE_WEIGHT
+        return STALE_WEIGHT * min(self.size, self.draws - seen_at) // self.size
+
+    def _weight(self, position):
+        return (BASE_WEIGHT + round(BASE_WEIGHT * self.error_boost * self.error_rate(position))
+                + self._stale_weight(position))
+
+    def _release(self):
+        while self._waiting and self._waiting[0][0] <= self.draws:
+            _, stage, position, seen_at = heapq.heappop(self._waiting)
+            if self.last_seen[position] != seen_at:
+                continue  # そのあとにもう一度出した
+            if stage == 0:
+                self._set(position, max(1, self._weight(position) // 2))
+                heapq.heappush(self._waiting, (seen_at + 2 * self.cooldown, 1, position, seen_at))
+            else:
+                self._set(position, self._weight(position))
+
+    def _new_round(self):
+        self.rounds += 1
+        recent = self.draws - self.cooldown
+        weights = [0 if self.last_seen[p] > recent else self._weight(p) for p in range(self.size)]
+        self.tree = FenwickTree(weights)
+        self._waiting = [
+            (seen_at + self.cooldown, 1, position, seen_at)
+            for position, seen_at in enumerate(self.last_seen) if seen_at > recent
+        ]
+        heapq.heapify(self._waiting)
+
+    def draw(self):
+        """次の問題の位置。問題がなければ None。"""
+        if self.size == 0:
+            return None
+        self.draws += 1
+        self._release()
+        if self.tree.total() <= 0:
+            self._new_round()
+        position = self.tree.find(self.rng.randrange(self.tree.total()))
+        self._set(position, 0)
+        self.last_seen[position] = self.draws
+        return position
+
+    def record(self, position, correct):
+        """答えた結果。間違えた問題は少しあとに重みを上げて戻す。"""
+        if self.attempts[position] == MAX_COUNT:
+            self.attempts[position] //= 2
+            self.misses[position] //= 2
+        self.attempts[position] += 1
+        if not correct:
+            self.misses[position] += 1
+            seen_at = self.last_seen[position] or self.draws
+            heapq.heappush(self._waiting, (seen_at + self.cooldown, 0, position, seen_at))
+
+    # ---------- 退避と読み直し ----------
+    def dumps(self):
+        """乱数以外の状態をバイト列にする（しばらく使わないセッションを退避する時）。"""
+        waiting = array("I", [value for entry in self._waiting for value in entry])
+        return b"".join((
+            _HEADER.pack(STATE_VERSION, self.size, self.cooldown, self.error_boost, self.draws, self.rounds),
+            self.tree.tobytes(), self.last_seen.tobytes(), self.misses.tobytes(), self.attempts.tobytes(),
+            waiting.tobytes(),
+        ))
+
+    @classmethod
+    def loads(cls, data, rng=None):
+        """dumps() の結果から作り直す。形式が違えば None。"""
+        if len(data) < _HEADER.size or data[0] != STATE_VERSION:
+            return None
+        _, size, cooldown, error_boost, draws, rounds = _HEADER.unpack_from(data)
+        if len(data) < _HEADER.size + 4 * (size + 1) + 6 * size:
+            return None
+        sampler = cls(0, rng=rng)
+        sampler.size, sampler.cooldown, sampler.error_boost = size, cooldown, error_boost
+        sampler.draws, sampler.rounds = draws, rounds
+        offset = _HEADER.size
+        end = offset + 4 * (size + 1)
+        sampler.tree = FenwickTree.frombytes(data[offset:end])
+        for name, typecode, length in (("last_seen", "I", 4 * size), ("misses", "B", size), ("attempts", "B", size)):
+            offset, end = end, end + length
+            values = array(typecode)
+            values.frombytes(data[offset:end])
+            setattr(sampler, name, values)
+        waiting = array("I")
+        waiting.frombytes(data[end:])
+        sampler._waiting = [tuple(waiting[i:i + 4]) for i in range(0, len(waiting), 4)]
+        heapq.heapify(sampler._waiting)
+        return sampler
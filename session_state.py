@@ -0,0 +1,152 @@
+import sys
+import threading
+import time
+
+# ============================================
+# session_state に入れる小さな記録
+# ============================================
+# 1つのセッションに dict や文字列を何個もコピーしない。問題は id（整数）で持ち、
+# 答えた結果は True / False で持つ。記録は __slots__ のクラスにする（__dict__ を持たない）
+
+
+class Round:
+    """出している1問。item は問題の id（AI問題生成は GeneratedQuiz）。
+
+    result は None（まだ答えていない）・True（正解）・False（不正解）。
+    """
+
+    __slots__ = ("item", "result")
+
+    def __init__(self, item, result=None):
+        self.item = item
+        self.result = result
+
+    @property
+    def answered(self):
+        return self.result is not None
+
+
+class GeneratedQuiz:
+    """AIが作った読み方クイズ1問（プールやLLMから来る dict の必要なところだけ）。"""
+
+    __slots__ = ("word", "reading", "wrong_readings", "meaning_chinese", "example")
+
+    def __init__(self, word, reading, wrong_readings, meaning_chinese, example):
+        self.word = word
+        self.reading = reading
+        self.wrong_readings = tuple(wrong_readings)
+        self.meaning_chinese = meaning_chinese
+        self.example = example
+
+    @classmethod
+    def from_dict(cls, quiz):
+        return cls(quiz["word"], quiz["correct_reading"], quiz["wrong_readings"],
+                   quiz["meaning_chinese"], quiz["example"])
+
+
+def dump_words(words):
+    return "\n".join(sorted(words)).encode("utf-8")
+
+
+def load_words(data):
+    return set(data.decode("utf-8").split("\n")) if data else set()
+
+
+# ============================================
+# セッションごとの大きさ
+# ============================================
+def state_bytes(obj, seen=None):
+    """オブジェクトのおおよそのバイト数（中身もたどる）。関数やモジュールはたどらない。
+
+    大きくなるもの（デッキ・出題順）は approx_bytes() の見積もりを使い、中身はたどらない
+    （1万枚のデッキでも測るのに時間がかからない）。
+    """
+    seen = set() if seen is None else seen
+    if id(obj) in seen or callable(obj) or isinstance(obj, type(sys)):
+        return 0
+    seen.add(id(obj))
+    approx_bytes = getattr(obj, "approx_bytes", None)
+    if approx_bytes is not None and not isinstance(obj, type):
+        return approx_bytes()
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(state_bytes(k, seen) + state_bytes(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(state_bytes(item, seen) for item in obj)
+    else:
+        if hasattr(obj, "__dict__"):
+            size += state_bytes(vars(obj), seen)
+        for slot in getattr(type(obj), "__slots__", ()):
+            if hasattr(obj, slot):
+                size += state_bytes(getattr(obj, slot), seen)
+    return size
+
+
+class SessionMemory:
+    """セッションごとの session_state のバイト数と、最後に操作した時刻。
+
+    measure() は定期的に再実行されるフラグメントから呼ぶ。window 秒測られていない
+    セッション（閉じたタブ）は数えず、消す。window は測る間隔より長くする（同じ長さだと
+    1回ごとに入ったり外れたりする）。
+    """
+
+    def __init__(self, window=120.0):
+        self.window = window
+        self._lock = threading.Lock()
+        self._sessions = {}  # session_id -> [バイト数, 最後に操作した時刻, 最後に測った時刻]
+        self._pruned_at = time.monotonic()
+        self.stats = {"spills": 0, "restores": 0}
+
+    def _prune(self, now):
+        cutoff = now - self.window
+        for session_id in [s for s, session in self._sessions.items() if session[2] < cutoff]:
+            del self._sessions[session_id]
+        self._pruned_at = now
+
+    def _session(self, session_id, now):
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = self._sessions[session_id] = [0, now, now]
+        return session
+
+    def active(self, session_id, now=None):
+        """ユーザーが操作した（ページ全体かモードのフラグメントが実行された）。"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._session(session_id, now)[1] = now
+
+    def measure(self, session_id, nbytes, now=None):
+        """今の大きさを記録し、最後に操作してからの秒数を返す。"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            session = self._session(session_id, now)
+            session[0] = nbytes
+            session[2] = now
+            # /metrics を誰も読まなくても閉じたタブの分がたまらないようにする（window に1回）
+            if now - self._pruned_at > self.window:
+                self._prune(now)
+            return now - session[1]
+
+    def spilled(self):
+        with self._lock:
+            self.stats["spills"] += 1
+
+    def restored(self):
+        with self._lock:
+            self.stats["restores"] += 1
+
+    def size(self, session_id):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            return session[0] if session else 0
+
+    def summary(self):
+        """{"total": 合計, "max": 一番大きいセッション, "mean": 平均} のバイト数。"""
+        with self._lock:
+            self._prune(time.monotonic())
+            sizes = [session[0] for session in self._sessions.values()]
+        return {
+            "total": sum(sizes),
+            "max": max(sizes, default=0),
+            "mean": sum(sizes) // len(sizes) if sizes else 0,
+        }
@@ -0,0 +1,236 @@
+import atexit
+import heapq
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+logger = logging.getLogger("srs")
+
+# ============================================
+# 間隔反復（SM-2）のフラッシュカード
+# ============================================
+DAY = 24 * 3600
+RELEARN_SECONDS = 10 * 60  # 忘れたカードはこのあとにもう一度出す
+MIN_EASE = 1.3
+START_EASE = 2.5
+
+
+class CardState:
+    __slots__ = ("card_id", "due", "interval", "ease", "reps", "lapses")
+
+    def __init__(self, card_id, due=0.0, interval=0.0, ease=START_EASE, reps=0, lapses=0):
+        self.card_id = card_id
+        self.due = due
+        self.interval = interval  # 日数
+        self.ease = ease
+        self.reps = reps
+        self.lapses = lapses
+
+    def as_row(self, learner_id):
+        return (learner_id, self.card_id, self.due, self.interval, self.ease, self.reps, self.lapses)
+
+
+# Deck.approx_bytes() で使う1枚分の大きさ。状態は id と3つの小数を持つ（reps・lapses は
+# 小さい整数なので共有される）。ヒープの要素は状態と同じ due・card_id を指すタプルだけ
+CARD_BYTES = sys.getsizeof(CardState(0)) + sys.getsizeof(10**6) + 3 * sys.getsizeof(0.0)
+HEAP_ENTRY_BYTES = sys.getsizeof((0.0, 0))
+
+
+def schedule(state, knew, now):
+    """SM-2 で次の出題日を決める。「覚えてた」は q=4、「忘れてた」は q=1 として扱う。"""
+    quality = 4 if knew else 1
+    state.ease = max(MIN_EASE, state.ease + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+    if knew:
+        state.reps += 1
+        if state.reps == 1:
+            state.interval = 1.0
+        elif state.reps == 2:
+            state.interval = 6.0
+        else:
+            state.interval = round(state.interval * state.ease, 1)
+        state.due = now + state.interval * DAY
+    else:
+        state.reps = 0
+        state.lapses += 1
+        state.interval = 0.0
+        state.due = now + RELEARN_SECONDS
+    return state
+
+
+class Deck:
+    """1人の学習者のカードの状態と、期限順のヒープ。
+
+    まだ一度も出していないカードは状態を持たず、card_at(new_cursor) から順に
+    デッキに入れていく。次のカードを選ぶのはヒープの先頭を見るだけ（O(log n)）。
+    """
+
+    def __init__(self, learner_id, deck_size, card_at, states=(), new_cursor=0):
+        self.learner_id = learner_id
+        self.deck_size = deck_size
+        self.card_at = card_at
+        self.new_cursor = new_cursor
+        self.states = {state.card_id: state for state in states}
+        self._heap = [(state.due, state.card_id) for state in self.states.values()]
+        heapq.heapify(self._heap)
+
+    def approx_bytes(self):
+        """おおよそのバイト数。カードを1枚ずつたどらず、枚数から見積もる。"""
+        return (sys.getsizeof(self) + sys.getsizeof(vars(self)) + sys.getsizeof(self.states)
+                + sys.getsizeof(self._heap) + len(self.states) * CARD_BYTES + len(self._heap) * HEAP_ENTRY_BYTES)
+
+    def _top(self):
+        # 古くなったヒープの要素（再スケジュール済み）は捨てる
+        while self._heap:
+            due, card_id = self._heap[0]
+            if self.states[card_id].due == due:
+                return due, card_id
+            heapq.heappop(self._heap)
+        return None
+
+    def _next_new(self):
+        while self.new_cursor < self.deck_size:
+            card_id = self.card_at(self.new_cursor)
+            if card_id is not None and card_id not in self.states:
+                return card_id
+            self.new_cursor += 1
+        return None
+
+    def next_card(self, now=None):
+        """期限が来たカード → まだ出していないカード → 一番期限の近いカード の順に選ぶ。"""
+        now = time.time() if now is None else now
+        top = self._top()
+        if top is not None and top[0] <= now:
+            return top[1]
+        card_id = self._next_new()
+        if card_id is not None:
+            return card_id
+        return top[1] if top is not None else None
+
+    def review(self, card_id, knew, now=None):
+        now = time.time() if now is None else now
+        if card_id not in self.states:
+            self.states[card_id] = CardState(card_id)
+            # 出し終わった新しいカードの分だけカーソルを進める
+            self._next_new()
+        state = schedule(self.states[card_id], knew, now)
+        heapq.heappush(self._heap, (state.due, card_id))
+        # 期限切れの要素がたまりすぎたら作り直す
+        if len(self._heap) > 2 * len(self.states) + 64:
+            self._heap = [(s.due, s.card_id) for s in self.states.values()]
+            heapq.heapify(self._heap)
+        return state
+
+
+# ============================================
+# 学習者ごとの状態の保存（まとめ書き）
+# ============================================
+class SRSStore:
+    """カードの状態をSQLiteに保存する。書き込みはためておき、スレッドでまとめて流す。"""
+
+    def __init__(self, db_path, flush_interval=2.0, batch_size=500):
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS srs_state ("
+            " learner_id TEXT NOT NULL, card_id INTEGER NOT NULL,"
+            " due REAL NOT NULL, interval REAL NOT NULL, ease REAL NOT NULL,"
+            " reps INTEGER NOT NULL, lapses INTEGER NOT NULL,"
+            " PRIMARY KEY (learner_id, card_id)) WITHOUT ROWID"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS srs_learner ("
+            " learner_id TEXT PRIMARY KEY, new_cursor INTEGER NOT NULL)"
+        )
+        self._db.commit()
+        # flush（入れ替え〜書き込み）と load の読み込みを一つずつにする。書き込み中の
+        # 状態を load が読み落とさないように
+        self._flush_lock = threading.Lock()
+        self._pending = {}  # (learner_id, card_id) -> row
+        self._cursors = {}
+        self._cond = threading.Condition()
+        self.stats = {"flushes": 0, "flush_errors": 0}
+        threading.Thread(target=self._run, name="srs-writer", daemon=True).start()
+        # 終了時に残りを書き出す
+        atexit.register(self.flush)
+
+    def load(self, learner_id, deck_size, card_at):
+        with self._flush_lock:
+            try:
+                self._flush()
+            except Exception:
+                logger.exception("srs flush before load failed; using the unwritten states")
+            rows = self._db.execute(
+                "SELECT card_id, due, interval, ease, reps, lapses FROM srs_state WHERE learner_id = ?",
+                (learner_id,),
+            ).fetchall()
+            cursor = self._db.execute(
+                "SELECT new_cursor FROM srs_learner WHERE learner_id = ?", (learner_id,)
+            ).fetchone()
+            new_cursor = cursor[0] if cursor else 0
+            # 書けなかった分（まだ _pending にある）は DB より新しい
+            with self._cond:
+                states = {row[0]: row[1:] for row in rows}
+                for (pending_learner, card_id), row in self._pending.items():
+                    if pending_learner == learner_id:
+                        states[card_id] = row[2:]
+                new_cursor = self._cursors.get(learner_id, new_cursor)
+        states = [CardState(card_id, *values) for card_id, values in states.items()]
+        return Deck(learner_id, deck_size, card_at, states, new_cursor)
+
+    def save(self, deck, state):
+        with self._cond:
+            self._pending[(deck.learner_id, state.card_id)] = state.as_row(deck.learner_id)
+            self._cursors[deck.learner_id] = deck.new_cursor
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify()
+
+    def pending(self):
+        with self._cond:
+            return len(self._pending)
+
+    def flush(self):
+        with self._flush_lock:
+            self._flush()
+
+    def _flush(self):
+        with self._cond:
+            pending, cursors = self._pending, self._cursors
+            self._pending, self._cursors = {}, {}
+        if not pending and not cursors:
+            return
+        try:
+            with self._db:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO srs_state VALUES (?, ?, ?, ?, ?, ?, ?)", list(pending.values())
+                )
+                self._db.executemany("INSERT OR REPLACE INTO srs_learner VALUES (?, ?)", list(cursors.items()))
+        except BaseException:
+            # 書けなかった分は戻す。そのあとに保存された新しい状態があればそちらを残す
+            with self._cond:
+                for key, row in pending.items():
+                    self._pending.setdefault(key, row)
+                for learner_id, new_cursor in cursors.items():
+                    self._cursors.setdefault(learner_id, new_cursor)
+                self.stats["flush_errors"] += 1
+            raise
+        with self._cond:
+            self.stats["flushes"] += 1
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait(timeout=self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                # DBがロックされている・ディスクがいっぱいなど。状態は残っているので次の回にまた書く
+                logger.exception("srs flush failed; %d card states kept for the next try", self.pending())
@@ -0,0 +1,17 @@
+import build_font
+from content_store import open_store
+
+
+def test_subset_covers_generated_items(tmp_path):
+    chars = set(build_font.collect_chars())
+    store = open_store(cache_dir=str(tmp_path))
+    for item in store.page("mistakes", limit=None) + store.page("quiz", limit=None):
+        for text in build_font._strings(item):
+            assert set(text) <= chars, text
+
+
+def test_digest_follows_rule_versions(monkeypatch):
+    chars = build_font.collect_chars()
+    digest = build_font.chars_digest(chars)
+    monkeypatch.setattr(build_font, "MUTATION_VERSION", build_font.MUTATION_VERSION + 1)
+    assert build_font.chars_digest(chars) != digest
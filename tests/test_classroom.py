@@ -0,0 +1,58 @@
+import threading
+
+from classroom import ClassroomAggregator
+
+
+def test_join_record_and_snapshot():
+    aggregator = ClassroomAggregator(shards=4)
+    room = aggregator.create([1, 2], "teacher", now=0)
+    assert aggregator.join(room.code.lower(), "s1", now=1) is room
+    assert aggregator.join(room.code, "s2", now=1) is room
+    assert aggregator.record(room.code, 1, "s1", "がっこう", True)
+    assert aggregator.record(room.code, 1, "s2", "がくこう", False)
+    # 同じ生徒の2回目・クラスにない問題は数えない
+    assert not aggregator.record(room.code, 1, "s1", "がっこう", True)
+    assert not aggregator.record(room.code, 3, "s1", "がっこう", True)
+    assert aggregator.snapshot(room.code, now=2) == {
+        "students": 2,
+        "items": [(1, 1, 2, {"がっこう": 1, "がくこう": 1}), (2, 0, 0, {})],
+    }
+    assert aggregator.stats() == {"joins": 2, "answers": 2, "duplicates": 1}
+
+
+def test_expired_class_is_gone_on_get():
+    aggregator = ClassroomAggregator(ttl_seconds=60)
+    room = aggregator.create([1], "teacher", now=0)
+    assert aggregator.get(room.code, now=60) is room
+    assert aggregator.get(room.code, now=61) is None
+    assert aggregator.rooms() == 0
+    # 消したクラスには参加も解答もできない
+    assert aggregator.join(room.code, "s1", now=61) is None
+    assert aggregator.snapshot(room.code, now=61) is None
+    assert not aggregator.record(room.code, 1, "s1", "がっこう", True)
+
+
+def test_create_drops_other_expired_classes():
+    aggregator = ClassroomAggregator(ttl_seconds=60)
+    old = aggregator.create([1], "teacher", now=0)
+    new = aggregator.create([1], "teacher", now=100)
+    assert aggregator.rooms() == 1
+    assert aggregator.get(old.code, now=100) is None
+    assert aggregator.get(new.code, now=100) is new
+
+
+def test_concurrent_answers_are_all_counted():
+    aggregator = ClassroomAggregator(shards=4)
+    room = aggregator.create(range(10), "teacher")
+
+    def student(number):
+        for item_id in range(10):
+            aggregator.record(room.code, item_id, f"s{number}", "a", number % 2 == 0)
+
+    threads = [threading.Thread(target=student, args=(number,)) for number in range(40)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    items = aggregator.snapshot(room.code)["items"]
+    assert [(correct, total) for _, correct, total, _ in items] == [(20, 40)] * 10
@@ -0,0 +1,25 @@
+import pytest
+
+from content_store import open_store
+
+
+@pytest.fixture(scope="module")
+def store(tmp_path_factory):
+    return open_store(cache_dir=str(tmp_path_factory.mktemp("content")))
+
+
+@pytest.mark.parametrize("kind", ["vocab", "quiz", "mistakes"])
+def test_id_at_matches_ordered_ids(store, kind):
+    ids = store.ids(kind)
+    assert [store.id_at(kind, position) for position in range(len(ids))] == ids
+    assert store.id_at(kind, len(ids)) is None
+    assert store.id_at(kind, -1) is None
+
+
+def test_id_at_with_filters(store):
+    grade = store.grades("vocab")[0]
+    ids = store.ids("vocab", grade=grade)
+    assert ids and len(ids) == store.count("vocab", grade=grade)
+    assert [store.id_at("vocab", position, grade=grade) for position in range(len(ids))] == ids
+    # 条件ごとに1回だけ読む
+    assert store.all_ids("vocab", grade=grade) is store.all_ids("vocab", grade=grade)
@@ -0,0 +1,38 @@
+import json
+import os
+
+from lexicon import build, lexicon_version
+
+
+def write_vocab(content_dir, reading):
+    item = {"word": "学校", "reading": reading, "meaning_chinese": "学校", "example": "学校に行きます。"}
+    with open(os.path.join(content_dir, "vocab.jsonl"), "w", encoding="utf-8") as f:
+        f.write(json.dumps(item, ensure_ascii=False) + "\n")
+
+
+def test_version_follows_content_not_mtime(tmp_path):
+    write_vocab(tmp_path, "がっこう")
+    version = lexicon_version(str(tmp_path))
+    path = tmp_path / "vocab.jsonl"
+    os.utime(path, ns=(0, 0))
+    assert lexicon_version(str(tmp_path)) == version
+    # 同じ大きさで中身だけ変わる
+    write_vocab(tmp_path, "がくこう")
+    os.utime(path, ns=(0, 0))
+    assert lexicon_version(str(tmp_path)) != version
+
+
+def test_dictionary_files_change_the_version(tmp_path):
+    write_vocab(tmp_path, "がっこう")
+    version = lexicon_version(str(tmp_path))
+    (tmp_path / "dictionary").mkdir()
+    (tmp_path / "dictionary" / "extra.tsv").write_text("先生\tせんせい\t老师\n", encoding="utf-8")
+    assert lexicon_version(str(tmp_path)) != version
+
+
+def test_build_reuses_the_same_version(tmp_path):
+    write_vocab(tmp_path, "がっこう")
+    cache = tmp_path / "cache"
+    path = build(str(tmp_path), str(cache))
+    os.utime(tmp_path / "vocab.jsonl", ns=(0, 0))
+    assert build(str(tmp_path), str(cache)) == path
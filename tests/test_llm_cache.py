@@ -0,0 +1,135 @@
+import threading
+import time
+
+import pytest
+
+from llm_cache import ResponseCache, normalize_query
+
+
+class Interrupted(BaseException):
+    """Streamlit の StopException / RerunException の代わり（Exception ではない）。"""
+
+
+def start_follower(cache, key, compute, results):
+    def run():
+        try:
+            results.append(cache.get_or_compute(key, compute))
+        except BaseException as e:  # noqa: BLE001 テストで結果として見る
+            results.append(e)
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def wait_for_flight(cache, key):
+    # フォロワーが待ち始めるまで（coalesced が増えるまで）待つ
+    for _ in range(200):
+        if cache.stats["coalesced"]:
+            return
+        time.sleep(0.01)
+    raise AssertionError("follower did not join the flight")
+
+
+def test_normalize_query():
+    assert normalize_query("　勉強  する ") == "勉強 する"
+    assert ResponseCache.make_key("ｶﾞｸ", 2) == "v2:ガク"
+
+
+def test_hit_after_compute(tmp_path):
+    cache = ResponseCache(db_path=str(tmp_path / "cache.sqlite3"))
+    assert cache.get_or_compute("k", lambda: "answer") == ("answer", False)
+    assert cache.get_or_compute("k", lambda: pytest.fail("recomputed")) == ("answer", True)
+    # ディスク層からも読める
+    reopened = ResponseCache(db_path=str(tmp_path / "cache.sqlite3"))
+    assert reopened.get("k") == "answer"
+    assert reopened.stats["disk_hits"] == 1
+
+
+def test_concurrent_requests_share_one_compute():
+    cache = ResponseCache()
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        release.wait(5)
+        return "answer"
+
+    results = []
+    leader = start_follower(cache, "k", compute, results)
+    while not cache._flights:
+        time.sleep(0.01)
+    follower = start_follower(cache, "k", compute, results)
+    wait_for_flight(cache, "k")
+    release.set()
+    leader.join(5)
+    follower.join(5)
+    assert len(calls) == 1
+    assert sorted(results) == [("answer", False), ("answer", True)]
+
+
+def test_leader_error_is_raised_to_followers():
+    cache = ResponseCache()
+    release = threading.Event()
+
+    def failing():
+        release.wait(5)
+        raise ValueError("boom")
+
+    results = []
+    leader = start_follower(cache, "k", failing, results)
+    while not cache._flights:
+        time.sleep(0.01)
+    follower = start_follower(cache, "k", lambda: "unused", results)
+    wait_for_flight(cache, "k")
+    release.set()
+    leader.join(5)
+    follower.join(5)
+    assert [type(r) for r in results] == [ValueError, ValueError]
+    assert cache.get("k") is None
+
+
+def test_interrupted_leader_hands_over_to_follower():
+    cache = ResponseCache()
+    release = threading.Event()
+
+    def interrupted():
+        release.wait(5)
+        raise Interrupted()
+
+    results = []
+    leader = start_follower(cache, "k", interrupted, results)
+    while not cache._flights:
+        time.sleep(0.01)
+    follower = start_follower(cache, "k", lambda: "answer", results)
+    wait_for_flight(cache, "k")
+    release.set()
+    leader.join(5)
+    follower.join(5)
+    # 止まった側だけが Interrupted になり、待っていた側は None ではなく自分で計算した値を返す
+    assert isinstance(results[0], Interrupted)
+    assert results[1] == ("answer", False)
+    assert cache.stats["retries"] == 1
+    assert cache.get("k") == "answer"
+
+
+def test_follower_stops_waiting_after_timeout():
+    cache = ResponseCache(wait_timeout=0.05)
+    release = threading.Event()
+    results = []
+    leader = start_follower(cache, "k", lambda: release.wait(5) and "slow", results)
+    while not cache._flights:
+        time.sleep(0.01)
+    assert cache.get_or_compute("k", lambda: "fast") == ("fast", False)
+    assert cache.stats["wait_timeouts"] == 1
+    release.set()
+    leader.join(5)
+
+
+def test_expired_entries_are_recomputed(monkeypatch):
+    cache = ResponseCache(ttl_seconds=10)
+    now = [1000.0]
+    monkeypatch.setattr("llm_cache.time.time", lambda: now[0])
+    cache.set("k", "old")
+    now[0] += 11
+    assert cache.get_or_compute("k", lambda: "new") == ("new", False)
@@ -0,0 +1,70 @@
+import threading
+import types
+
+from llm_stream import PartialJSONObject, StreamBuffer, stream_chat
+
+
+def chunk(text, finish_reason=None):
+    choice = types.SimpleNamespace(delta=types.SimpleNamespace(content=text), finish_reason=finish_reason)
+    return types.SimpleNamespace(choices=[choice], x_groq=None)
+
+
+class FakeClient:
+    def __init__(self, chunks):
+        create = lambda **kwargs: iter(chunks)  # noqa: E731
+        self.chat = types.SimpleNamespace(completions=types.SimpleNamespace(create=create))
+
+
+def test_stream_chat_yields_content():
+    client = FakeClient([chunk("こん"), chunk(None), chunk("にちは", "stop")])
+    assert "".join(stream_chat(client, "test")) == "こんにちは"
+
+
+def test_stream_buffer_reads_while_feeding():
+    buffer = StreamBuffer()
+    release = threading.Event()
+
+    def stream():
+        yield "a"
+        release.wait(5)
+        yield "b"
+
+    result = []
+    feeder = threading.Thread(target=lambda: result.append(buffer.feed(stream())))
+    feeder.start()
+    assert buffer.started(timeout=5)
+    reader = iter(buffer)
+    assert next(reader) == "a"
+    release.set()
+    assert "".join(reader) == "b"
+    feeder.join(5)
+    assert result == ["ab"]
+
+
+def test_stream_buffer_closed_without_chunks():
+    # 他のセッションが計算していた時は feed() が呼ばれずに閉じる
+    buffer = StreamBuffer()
+    buffer.close()
+    assert not buffer.started()
+    assert list(buffer) == []
+
+
+def test_stream_buffer_closes_on_error():
+    buffer = StreamBuffer()
+
+    def broken():
+        yield "a"
+        raise RuntimeError("cut")
+
+    try:
+        buffer.feed(broken())
+    except RuntimeError:
+        pass
+    assert list(buffer) == ["a"]
+
+
+def test_partial_json_fields_appear_when_closed():
+    parser = PartialJSONObject()
+    assert parser.feed('{"word": "勉') == {}
+    assert parser.feed('強", "count": 1') == {"word": "勉強"}
+    assert parser.feed("2}") == {"word": "勉強", "count": 12}
@@ -0,0 +1,21 @@
+import time
+
+from metrics import SessionTracker
+
+
+def test_session_tracker_counts_recent_sessions():
+    tracker = SessionTracker(window=60)
+    tracker.touch("a")
+    tracker.touch("b")
+    tracker.touch("a")
+    assert tracker.active() == 2
+
+
+def test_session_tracker_prunes_closed_tabs_on_touch():
+    tracker = SessionTracker(window=0.05)
+    tracker.touch("closed")
+    time.sleep(0.1)
+    # /metrics を読まなくても古いセッションは消える
+    tracker.touch("open")
+    assert list(tracker._last_seen) == ["open"]
+    assert tracker.active() == 1
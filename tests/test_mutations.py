@@ -0,0 +1,55 @@
+import pytest
+
+from mutations import GENERATED_ID_BASE, MUTATION_TAG, generate, mutate
+
+
+def sentences(correct):
+    return {item["sentence"] for item in mutate(correct)}
+
+
+@pytest.mark.parametrize("correct, also_correct", [
+    # 人のあとの「が」は主語として読める
+    ("先生に質問します。", "先生が質問します。"),
+    ("昨日、友達に会いました。", "昨日、友達が会いました。"),
+    # 好き は「を」も使う
+    ("運動が好きです。", "運動を好きです。"),
+    ("果物が好きです。", "果物を好きです。"),
+])
+def test_particle_swaps_skip_sentences_that_are_still_correct(correct, also_correct):
+    assert also_correct not in sentences(correct)
+
+
+@pytest.mark.parametrize("correct, mistake", [
+    ("わたしは学校に行きます。", "わたしは学校が行きます。"),
+    ("昨日、友達に会いました。", "昨日、友達を会いました。"),
+    ("運動が好きです。", "運動に好きです。"),
+    ("彼女は歌が上手です。", "彼女は歌を上手です。"),
+    ("先生に質問します。", "先生を質問します。"),
+])
+def test_particle_swaps_still_make_real_mistakes(correct, mistake):
+    assert mistake in sentences(correct)
+
+
+def test_item_marks_only_the_changed_part():
+    items = {item["sentence"]: item for item in mutate("わたしは学校に行きます。")}
+    item = items["わたしは学校が行きます。"]
+    assert (item["mistake"], item["correct"]) == ("が", "に")
+    assert item["tags"] == ["particle", MUTATION_TAG]
+
+
+@pytest.mark.parametrize("correct, mistake, tag", [
+    ("本を読むのが好きです。", "本を読むのが好きいです。", "na-adjective"),
+    ("この本は面白いです。", "この本は面白です。", "i-adjective"),
+    ("日本語を話すことができます。", "日本語を話すことがでます。", "masu-form"),
+    ("今日は暑いので、アイスを食べます。", "今日は暑いなので、アイスを食べます。", "i-adjective"),
+])
+def test_other_rules(correct, mistake, tag):
+    items = {item["sentence"]: item for item in mutate(correct)}
+    assert tag in items[mistake]["tags"]
+
+
+def test_generate_skips_existing_and_numbers_items():
+    items = list(generate([("わたしは学校に行きます。", 1)], existing=["わたしは学校が行きます。"]))
+    assert "わたしは学校が行きます。" not in {item["sentence"] for item in items}
+    assert [item["id"] for item in items] == list(range(GENERATED_ID_BASE, GENERATED_ID_BASE + len(items)))
+    assert {item["grade"] for item in items} == {1}
@@ -0,0 +1,124 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from progress import ProgressStore
+
+DAY = 24 * 3600
+
+
+class FailingDB:
+    """最初の failures 回の書き込みで sqlite のエラーを出す接続の代わり。"""
+
+    def __init__(self, db, failures=1):
+        self.db = db
+        self.failures = failures
+
+    def __enter__(self):
+        return self.db.__enter__()
+
+    def __exit__(self, *exc):
+        return self.db.__exit__(*exc)
+
+    def execute(self, *args):
+        return self.db.execute(*args)
+
+    def commit(self):
+        return self.db.commit()
+
+    def rollback(self):
+        return self.db.rollback()
+
+    def executemany(self, *args):
+        if self.failures:
+            self.failures -= 1
+            raise sqlite3.OperationalError("database is locked")
+        return self.db.executemany(*args)
+
+
+@pytest.fixture
+def store(tmp_path):
+    # 書き込みスレッドが勝手に flush しないよう間隔を長くする
+    return ProgressStore(str(tmp_path / "progress.sqlite3"), flush_interval=3600, utc_offset_hours=0)
+
+
+def test_scores_count_today_and_all_time(store):
+    now = 10 * DAY + 3600
+    store.record("a", "quiz", 1, True, now=now - DAY)
+    store.record("a", "quiz", 2, True, now=now)
+    store.record("a", "quiz", 3, False, now=now)
+    assert store.scores("a", now=now) == (1, 2, 2, 3)
+    assert store.scores("b", now=now) == (0, 0, 0, 0)
+
+
+def test_scores_survive_flush_and_reopen(store, tmp_path):
+    now = time.time()
+    store.record("a", "quiz", 1, True, latency=1.5, now=now)
+    store.record("a", "mistakes", 2, False, now=now)
+    store.flush()
+    reopened = ProgressStore(str(tmp_path / "progress.sqlite3"), flush_interval=3600, utc_offset_hours=0)
+    assert reopened.scores("a", now=now) == (1, 2, 1, 2)
+    rows = reopened._reader.execute("SELECT mode, item_id, correct, latency_ms FROM progress_log ORDER BY item_id")
+    assert rows.fetchall() == [("quiz", "1", 1, 1500), ("mistakes", "2", 0, None)]
+
+
+def test_failed_flush_keeps_the_batch(store, tmp_path):
+    now = time.time()
+    store.record("a", "quiz", 1, True, now=now)
+    real_db = store._db
+    store._db = FailingDB(real_db)
+    with pytest.raises(sqlite3.OperationalError):
+        store.flush()
+    assert store.pending() == 1
+    assert store._flushing == {}
+    assert store.stats["flush_errors"] == 1
+    # 失敗のあとに来た解答と一緒に書き直す
+    store.record("a", "quiz", 2, False, now=now)
+    store.flush()
+    assert store.pending() == 0
+    reopened = ProgressStore(str(tmp_path / "progress.sqlite3"), flush_interval=3600, utc_offset_hours=0)
+    assert reopened.scores("a", now=now) == (1, 2, 1, 2)
+
+
+def test_score_read_during_commit_counts_the_batch_once(store):
+    now = time.time()
+    store.record("a", "quiz", 1, True, now=now)
+    store.record("a", "quiz", 2, False, now=now)
+    # メモリのスコアを捨てて、コミットした直後に別スレッドで読み直させる
+    store._scores.clear()
+    result = []
+
+    class ReadAfterCommit(FailingDB):
+        def commit(self):
+            self.db.commit()
+            self.read()
+
+        def __exit__(self, *exc):
+            self.db.__exit__(*exc)
+            self.read()
+
+        def read(self):
+            reader = threading.Thread(target=lambda: result.append(store.scores("a", now=now)))
+            reader.start()
+            reader.join(0.2)
+            self.reader = reader
+
+    store._db = ReadAfterCommit(store._db, failures=0)
+    store.flush()
+    store._db.reader.join(5)
+    assert result == [(1, 2, 1, 2)]
+    assert store.scores("a", now=now) == (1, 2, 1, 2)
+
+
+def test_writer_thread_survives_errors(tmp_path):
+    store = ProgressStore(str(tmp_path / "progress.sqlite3"), flush_interval=0.05)
+    store._db = FailingDB(store._db, failures=2)
+    store.record("a", "quiz", 1, True)
+    for _ in range(200):
+        if store.stats["flushed"]:
+            break
+        time.sleep(0.02)
+    assert store.stats["flush_errors"] == 2
+    assert store.stats["flushed"] == 1
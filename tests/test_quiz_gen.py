@@ -0,0 +1,43 @@
+import json
+import types
+
+from quiz_gen import QuizGenerator, quiz_batch_request
+
+QUIZ = {"word": "学校", "correct_reading": "がっこう", "wrong_readings": ["がくこう", "がっこ", "かっこう"],
+        "meaning_chinese": "学校", "example": "学校に行きます。"}
+
+
+def response(content):
+    message = types.SimpleNamespace(content=content)
+    choice = types.SimpleNamespace(message=message, finish_reason="stop")
+    return types.SimpleNamespace(choices=[choice], usage=None)
+
+
+class FakeClient:
+    def __init__(self, contents):
+        contents = iter(contents)
+        create = lambda **kwargs: response(next(contents))  # noqa: E731
+        self.chat = types.SimpleNamespace(completions=types.SimpleNamespace(create=create))
+
+
+def generator(contents, **kwargs):
+    return QuizGenerator(FakeClient(contents), lambda level, count, avoid: quiz_batch_request("m", level, count, avoid),
+                         **kwargs)
+
+
+def test_generate_returns_valid_items():
+    quizzes = generator([json.dumps({"quizzes": [QUIZ]}, ensure_ascii=False)]).generate("かんたん", 1)
+    assert [quiz["word"] for quiz in quizzes] == ["学校"]
+
+
+def test_generate_retries_after_empty_content():
+    gen = generator([None, json.dumps({"quizzes": [QUIZ]}, ensure_ascii=False)])
+    assert [quiz["word"] for quiz in gen.generate("かんたん", 1)] == ["学校"]
+    stats = gen.stats()
+    assert (stats["calls"], stats["retries"], stats["parse_failures"]) == (2, 1, 1)
+
+
+def test_generate_gives_up_on_empty_content():
+    gen = generator([None, None], max_retries=1)
+    assert gen.generate("かんたん", 1) == []
+    assert gen.stats()["parse_failures"] == 2
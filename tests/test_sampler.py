@@ -0,0 +1,75 @@
+import random
+
+import pytest
+
+from sampler import BASE_WEIGHT, STALE_WEIGHT, AdaptiveSampler, FenwickTree
+
+
+def test_fenwick_prefix_and_find_match_a_plain_list():
+    rng = random.Random(1)
+    weights = [rng.randrange(0, 10) for _ in range(37)]
+    tree = FenwickTree(weights)
+    for _ in range(50):
+        position, delta = rng.randrange(37), rng.randrange(-3, 4)
+        delta = max(delta, -weights[position])
+        weights[position] += delta
+        tree.add(position, delta)
+    assert [tree.prefix(end) for end in range(38)] == [sum(weights[:end]) for end in range(38)]
+    assert [tree.weight(p) for p in range(37)] == weights
+    for value in range(tree.total()):
+        position = tree.find(value)
+        assert sum(weights[:position]) <= value < sum(weights[:position + 1])
+    assert FenwickTree.frombytes(tree.tobytes()).tobytes() == tree.tobytes()
+
+
+def test_no_repeats_within_a_round_when_answered_correctly():
+    sampler = AdaptiveSampler(50, rng=random.Random(2))
+    for _ in range(3):
+        positions = []
+        for _ in range(50):
+            position = sampler.draw()
+            sampler.record(position, True)
+            positions.append(position)
+        assert sorted(positions) == list(range(50))
+    assert sampler.rounds == 3
+
+
+def test_missed_items_come_back_within_the_round_after_cooldown():
+    sampler = AdaptiveSampler(50, cooldown=5, rng=random.Random(3))
+    missed = sampler.draw()
+    sampler.record(missed, False)
+    positions = [sampler.draw() for _ in range(49)]
+    # 同じ周のうちにもう一度出る。ただし cooldown 問のあいだは出さない
+    assert missed in positions
+    assert missed not in positions[:5]
+    assert sampler.rounds == 1
+
+
+def test_stale_items_weigh_more_at_the_next_round():
+    sampler = AdaptiveSampler(20, cooldown=0, rng=random.Random(4))
+    order = []
+    for _ in range(20):
+        position = sampler.draw()
+        sampler.record(position, True)
+        order.append(position)
+    sampler._new_round()
+    weights = [sampler.tree.weight(position) for position in order]
+    # 前の周の早いうちに出した問題ほど重い
+    assert weights == sorted(weights, reverse=True)
+    assert weights[0] == BASE_WEIGHT + STALE_WEIGHT * 19 // 20
+    assert weights[-1] == BASE_WEIGHT
+
+
+def test_dumps_loads_continues_the_same_sequence():
+    sampler = AdaptiveSampler(30, rng=random.Random(5))
+    for i in range(40):
+        sampler.record(sampler.draw(), i % 3 != 0)
+    restored = AdaptiveSampler.loads(sampler.dumps(), rng=random.Random(6))
+    sampler.rng = random.Random(6)
+    assert [restored.draw() for _ in range(60)] == [sampler.draw() for _ in range(60)]
+    assert restored.dumps() == sampler.dumps()
+
+
+@pytest.mark.parametrize("data", [b"", b"\x00" * 40])
+def test_loads_rejects_other_formats(data):
+    assert AdaptiveSampler.loads(data) is None
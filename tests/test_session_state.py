@@ -0,0 +1,161 @@
+import asyncio
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+import pytest
+
+from progress import ProgressStore
+from sampler import AdaptiveSampler
+from session_state import GeneratedQuiz, Round, SessionMemory, dump_words, load_words, state_bytes
+from srs import CardState, Deck
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_round_and_generated_quiz():
+    current = Round(12)
+    assert not current.answered
+    current.result = False
+    assert current.answered
+    quiz = GeneratedQuiz.from_dict({
+        "word": "経済", "correct_reading": "けいざい", "wrong_readings": ["けいさい", "きょうざい"],
+        "meaning_chinese": "经济", "example": "経済を学びます。", "level": "ふつう",
+    })
+    assert (quiz.word, quiz.reading, quiz.wrong_readings) == ("経済", "けいざい", ("けいさい", "きょうざい"))
+    assert not hasattr(quiz, "__dict__")
+
+
+def test_words_round_trip():
+    assert load_words(dump_words({"学校", "先生"})) == {"学校", "先生"}
+    assert load_words(b"") == set()
+
+
+def test_state_bytes_uses_estimates_for_large_objects():
+    cards = [CardState(i, random.random() * 1e9, random.random() * 9, 2 + random.random()) for i in range(10000)]
+    deck = Deck("learner", 10000, lambda i: i, cards)
+    start = time.perf_counter()
+    size = state_bytes({"flashcard_deck": deck, "quiz": Round(3)})
+    assert time.perf_counter() - start < 0.01
+    assert size > 10000 * 100
+    assert state_bytes([1, "abc"]) > state_bytes([])
+
+
+def test_session_memory_idle_and_summary():
+    memory = SessionMemory(window=60)
+    memory.active("a", now=100)
+    assert memory.measure("a", 4000, now=130) == 30
+    memory.measure("b", 1000, now=130)
+    memory.active("a", now=150)
+    assert memory.measure("a", 5000, now=151) == 1
+    assert memory.size("a") == 5000
+    memory._sessions["b"][2] = time.monotonic() - 120  # 閉じたタブ
+    memory._sessions["a"][2] = time.monotonic()
+    assert memory.summary() == {"total": 5000, "max": 5000, "mean": 5000}
+
+
+def test_session_memory_prunes_closed_tabs_on_measure():
+    memory = SessionMemory(window=120)
+    memory._pruned_at = 0
+    memory.measure("closed", 1000, now=10)
+    # 60秒ごとに測られるタブは窓（2倍）から外れない
+    for now in range(10, 400, 60):
+        memory.measure("open", 2000, now=now)
+        assert "open" in memory._sessions
+    # /metrics を読まなくても閉じたタブは消える
+    assert "closed" not in memory._sessions
+    assert memory.size("open") == 2000
+
+
+def test_progress_store_keeps_learner_state(tmp_path):
+    path = str(tmp_path / "progress.sqlite3")
+    store = ProgressStore(path)
+    sampler = AdaptiveSampler(30, rng=random.Random(1))
+    for _ in range(10):
+        sampler.record(sampler.draw(), False)
+    store.save_state("learner", {"sampler:quiz": sampler.dumps(), "ai_quiz_seen": dump_words({"学校"})})
+    store.save_state("learner", {"ai_quiz_seen": dump_words({"先生"})})
+    state = ProgressStore(path).load_state("learner")
+    assert load_words(state["ai_quiz_seen"]) == {"先生"}
+    restored = AdaptiveSampler.loads(state["sampler:quiz"])
+    assert (restored.draws, bytes(restored.misses)) == (sampler.draws, bytes(sampler.misses))
+    assert store.load_state("someone-else") == {}
+
+
+# ============================================
+# 実際にアプリを立てて、使っていないタブの退避と読み直しを見る
+# ============================================
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def read_metric(port, name):
+    text = urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5).read().decode()
+    return {line.split(" ")[0]: float(line.split(" ")[1]) for line in text.splitlines() if line.startswith(name)}
+
+
+@pytest.fixture
+def app_server(tmp_path):
+    pytest.importorskip("websockets")
+    app_port, metrics_port = free_port(), free_port()
+    env = dict(
+        os.environ,
+        GROQ_API_KEY="stub", SESSION_IDLE_SECONDS="1", SESSION_CHECK_SECONDS="1",
+        METRICS_PORT=str(metrics_port), LLM_CACHE_PATH=str(tmp_path / "cache.sqlite3"),
+        CONTENT_CACHE_DIR=str(tmp_path / "content"), PROGRESS_DB_PATH=str(tmp_path / "progress.sqlite3"),
+    )
+    process = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", os.path.join(ROOT_DIR, "app.py"),
+         "--server.headless", "true", "--server.port", str(app_port), "--browser.gatherUsageStats", "false"],
+        env=env, cwd=ROOT_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        for _ in range(120):
+            try:
+                urllib.request.urlopen(f"http://127.0.0.1:{app_port}/_stcore/health", timeout=1)
+                break
+            except OSError:
+                time.sleep(0.5)
+        yield f"http://127.0.0.1:{app_port}", metrics_port
+    finally:
+        process.terminate()
+        process.wait(10)
+
+
+def test_idle_session_is_spilled_and_restored(app_server):
+    sys.path.insert(0, os.path.join(ROOT_DIR, "loadtest"))
+    from load_generator import Session
+
+    url, metrics_port = app_server
+    spills = 'app_session_spills_total{event="spills"}'
+    restores = 'app_session_spills_total{event="restores"}'
+
+    async def scenario():
+        rng = random.Random(1)
+        tab = Session(url, 30, query_string="learner=spilltest")
+        await tab.connect()
+        for _ in range(3):
+            await tab.click_keyed("opt_", rng)
+            await tab.click("🆕 新しい問題")
+        # 操作しないまま、ブラウザと同じように run_every の再実行だけを送る
+        deadline = time.monotonic() + 4
+        while time.monotonic() < deadline:
+            if not await tab.auto_rerun_due():
+                await asyncio.sleep(0.05)
+        assert read_metric(metrics_port, "app_session_spills_total")[spills] == 1
+        await tab.click_keyed("opt_", rng)
+        assert read_metric(metrics_port, "app_session_spills_total")[restores] == 1
+        # 同じ学習者の新しいタブも退避した状態から始める
+        other = Session(url, 30, query_string="learner=spilltest")
+        await other.connect()
+        assert read_metric(metrics_port, "app_session_spills_total")[restores] == 2
+        await tab.close()
+        await other.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,132 @@
+import sqlite3
+import threading
+
+import pytest
+
+from srs import DAY, MIN_EASE, RELEARN_SECONDS, CardState, Deck, SRSStore, schedule
+
+
+class FailingDB:
+    """最初の failures 回の書き込みで sqlite のエラーを出す接続の代わり。"""
+
+    def __init__(self, db, failures=1):
+        self.db = db
+        self.failures = failures
+
+    def __enter__(self):
+        return self.db.__enter__()
+
+    def __exit__(self, *exc):
+        return self.db.__exit__(*exc)
+
+    def execute(self, *args):
+        return self.db.execute(*args)
+
+    def executemany(self, *args):
+        if self.failures:
+            self.failures -= 1
+            raise sqlite3.OperationalError("database is locked")
+        return self.db.executemany(*args)
+
+
+def test_schedule_follows_sm2_intervals():
+    state = CardState(1)
+    now = 1000.0
+    intervals = [schedule(state, True, now).interval for _ in range(4)]
+    # q=4 では ease は変わらない（2.5）
+    assert intervals == [1.0, 6.0, 15.0, 37.5]
+    assert state.reps == 4
+    assert state.due == now + state.interval * DAY
+
+
+def test_schedule_lapse_resets_and_lowers_ease():
+    state = CardState(1, reps=3, interval=15.0)
+    schedule(state, False, 100.0)
+    assert (state.reps, state.lapses, state.interval) == (0, 1, 0.0)
+    assert state.due == 100.0 + RELEARN_SECONDS
+    for _ in range(10):
+        schedule(state, False, 100.0)
+    assert state.ease == MIN_EASE
+
+
+def test_deck_order_due_then_new_then_nearest():
+    deck = Deck("a", 3, lambda i: [10, 11, 12][i])
+    assert deck.next_card(now=0) == 10
+    deck.review(10, True, now=0)
+    assert deck.next_card(now=0) == 11
+    deck.review(11, False, now=0)
+    # 11 は10分後に期限が来る。それまでは新しいカード
+    assert deck.next_card(now=1) == 12
+    assert deck.next_card(now=RELEARN_SECONDS) == 11
+    deck.review(12, True, now=0)
+    deck.review(11, True, now=RELEARN_SECONDS)
+    # 新しいカードがなくなったら一番期限の近いカード
+    assert deck.next_card(now=RELEARN_SECONDS + 1) == 10
+    assert deck.new_cursor == 3
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SRSStore(str(tmp_path / "srs.sqlite3"), flush_interval=3600)
+
+
+def test_store_round_trip(store, tmp_path):
+    deck = store.load("a", 2, lambda i: i)
+    store.save(deck, deck.review(0, True, now=0))
+    store.save(deck, deck.review(1, False, now=0))
+    store.flush()
+    reopened = SRSStore(str(tmp_path / "srs.sqlite3"), flush_interval=3600).load("a", 2, lambda i: i)
+    assert reopened.new_cursor == 2
+    assert {card_id: (s.reps, s.lapses) for card_id, s in reopened.states.items()} == {0: (1, 0), 1: (0, 1)}
+
+
+def test_failed_flush_requeues_and_keeps_newer_saves(store):
+    deck = store.load("a", 1, lambda i: i)
+    store.save(deck, deck.review(0, True, now=0))
+    store._db = FailingDB(store._db)
+    with pytest.raises(sqlite3.OperationalError):
+        store.flush()
+    assert store.pending() == 1
+    assert store.stats["flush_errors"] == 1
+    store.save(deck, deck.review(0, True, now=DAY))
+    store.flush()
+    assert store.pending() == 0
+    assert store.load("a", 1, lambda i: i).states[0].reps == 2
+
+
+def test_load_sees_unwritten_states_when_flush_fails(store):
+    deck = store.load("a", 1, lambda i: i)
+    store.save(deck, deck.review(0, True, now=0))
+    store._db = FailingDB(store._db)
+    reloaded = store.load("a", 1, lambda i: i)
+    assert reloaded.states[0].reps == 1
+    assert reloaded.new_cursor == 1
+    assert store.pending() == 1
+
+
+def test_load_waits_for_in_flight_flush(store):
+    deck = store.load("a", 1, lambda i: i)
+    store.save(deck, deck.review(0, True, now=0))
+    started, release = threading.Event(), threading.Event()
+    real_db = store._db
+
+    class SlowDB(FailingDB):
+        def executemany(self, *args):
+            started.set()
+            release.wait(5)
+            return self.db.executemany(*args)
+
+    store._db = SlowDB(real_db, failures=0)
+    writer = threading.Thread(target=store.flush)
+    writer.start()
+    assert started.wait(5)
+    # 書き込み中の状態は _pending にも DB にもない。load は書き終わるのを待つ
+    result = []
+    reader = threading.Thread(target=lambda: result.append(store.load("a", 1, lambda i: i)))
+    reader.start()
+    reader.join(0.2)
+    assert reader.is_alive()
+    release.set()
+    writer.join(5)
+    reader.join(5)
+    assert result[0].states[0].reps == 1